@@ -0,0 +1,95 @@
+"""
+Micro-benchmark for the SQLite DB layer
+
+Compares the old connect-per-call pattern against the shared connection in
+`gdoc_summaries.libs.db`, with and without batching the writes in one transaction.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_db.py [--ops 2000]`
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from gdoc_summaries.libs import constants, db
+
+
+def _summary(i: int) -> constants.Summary:
+    return constants.Summary(
+        document_id=f"doc{i}",
+        title=f"Document {i}",
+        content="<p>summary</p>" * 20,
+        date_published="2024-03-15",
+        summary_type=constants.SummaryType.TDD,
+    )
+
+
+def _connect_per_call_save(path: str, summary: constants.Summary) -> None:
+    """What `save_summary_to_db` used to do before the shared connection"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO summaries (document_id, title, summary, date_published, sent, summary_type)
+        VALUES (?, ?, ?, ?, 0, ?)
+        ON CONFLICT(document_id) DO UPDATE SET
+            title=excluded.title, summary=excluded.summary, date_published=excluded.date_published,
+            summary_type=excluded.summary_type, sent=0
+    """, (summary.document_id, summary.title, summary.content, summary.date_published,
+          summary.summary_type.value))
+    conn.commit()
+    conn.close()
+
+
+def _connect_per_call_get(path: str, document_id: str) -> None:
+    """What `get_summary_from_db` used to do before the shared connection"""
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT title, summary, date_published, summary_type FROM summaries WHERE document_id = ?
+    """, (document_id,))
+    cursor.fetchone()
+    conn.close()
+
+
+def _time(label: str, ops: int, func) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {ops / elapsed:>12,.0f} ops/sec")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+    summaries = [_summary(i) for i in range(args.ops)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        before_path = os.path.join(tmp_dir, "before.db")
+        db.DATABASE_PATH = before_path
+        db.setup_database()
+        db.get_connection().execute("PRAGMA journal_mode=DELETE")
+        db.close_connection()
+        _time("before: connect per call, save", args.ops,
+              lambda: [_connect_per_call_save(before_path, s) for s in summaries])
+        _time("before: connect per call, get", args.ops,
+              lambda: [_connect_per_call_get(before_path, s.document_id) for s in summaries])
+
+        db.DATABASE_PATH = os.path.join(tmp_dir, "after.db")
+        db.setup_database()
+        _time("after: shared connection, save (autocommit)", args.ops,
+              lambda: [db.save_summary_to_db(s) for s in summaries])
+
+        def save_in_transaction():
+            with db.transaction():
+                for s in summaries:
+                    db.save_summary_to_db(s)
+        _time("after: shared connection, save (1 transaction)", args.ops, save_in_transaction)
+        _time("after: shared connection, get", args.ops,
+              lambda: [db.get_summary_from_db(s.document_id) for s in summaries])
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the summary_sections and summaries indexes at scale
+
+Fills a temporary database with `--rows` biweekly sections (and as many summaries),
+then times the section lookups the biweekly run makes for each document, with the
+migration 7 indexes dropped and with them in place.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_db_indexes.py [--rows 1000000]`
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from gdoc_summaries.libs import db
+
+_INDEXES = {
+    "idx_summary_sections_document_date":
+        "CREATE UNIQUE INDEX idx_summary_sections_document_date ON summary_sections(document_id, section_date)",
+    "idx_summary_sections_document_sent_date":
+        "CREATE INDEX idx_summary_sections_document_sent_date ON summary_sections(document_id, sent, section_date)",
+    "idx_summaries_type_sent":
+        "CREATE INDEX idx_summaries_type_sent ON summaries(summary_type, sent)",
+}
+
+
+def _fill(rows: int, documents: int) -> None:
+    start = datetime.date(2000, 1, 1)
+    sections_per_document = rows // documents
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO summary_sections (document_id, section_date, section_content, section_summary, sent)
+            VALUES (?, ?, 'content', 'summary', ?)
+        """, (
+            (f"doc{d}", (start + datetime.timedelta(days=i)).isoformat(), int(i < sections_per_document - 2))
+            for d in range(documents) for i in range(sections_per_document)
+        ))
+        conn.executemany("""
+            INSERT INTO summaries (document_id, title, summary, date_published, sent, summary_type)
+            VALUES (?, 'title', 'summary', '2024-03-15', ?, ?)
+        """, ((f"summary{i}", i % 2, ("TDD", "PRD", "BIWEEKLY")[i % 3]) for i in range(rows)))
+
+
+def _time(label: str, document_ids: list[str]) -> None:
+    conn = db.get_connection()
+    start = time.perf_counter()
+    for document_id in document_ids:
+        db.get_latest_section_date(document_id)
+        db.get_unsent_sections(document_id)
+    conn.execute("SELECT count(*) FROM summaries WHERE summary_type = 'PRD' AND sent = 0").fetchone()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<25} {elapsed * 1000 / len(document_ids):>10.3f} ms per document")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--documents", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DATABASE_PATH = os.path.join(tmp_dir, "summaries.db")
+        db.setup_database()
+        start = time.perf_counter()
+        _fill(args.rows, args.documents)
+        print(f"filled {args.rows:,} sections in {time.perf_counter() - start:.1f} s")
+        document_ids = [f"doc{d}" for d in range(0, args.documents, max(1, args.documents // args.lookups))]
+
+        conn = db.get_connection()
+        for index_name in _INDEXES:
+            conn.execute(f"DROP INDEX {index_name}")
+        _time("before: no indexes", document_ids)
+
+        for create_index in _INDEXES.values():
+            conn.execute(create_index)
+        conn.execute("ANALYZE")
+        _time("after: migration 7", document_ids)
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Micro-benchmark for field-masked Docs API responses
+
+Builds large fixture documents shaped like real `documents.get` responses (styles, lists,
+inline objects, named ranges and per-run text styles) and compares the payload size and
+JSON parse time of the full resource against the `gdoc_client.DOCUMENT_TEXT_FIELDS` mask.
+The masked payload is produced locally by keeping only the masked fields, which is what
+the API does server-side.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_docs_fields.py [--paragraphs 20000]`
+"""
+import argparse
+import json
+import time
+
+from gdoc_summaries.libs import gdoc_client
+
+_TEXT_STYLE = {
+    "bold": False,
+    "italic": False,
+    "fontSize": {"magnitude": 11, "unit": "PT"},
+    "weightedFontFamily": {"fontFamily": "Arial", "weight": 400},
+    "foregroundColor": {"color": {"rgbColor": {"red": 0.2, "green": 0.2, "blue": 0.2}}},
+}
+_PARAGRAPH_STYLE = {
+    "namedStyleType": "NORMAL_TEXT",
+    "direction": "LEFT_TO_RIGHT",
+    "lineSpacing": 115,
+    "spaceAbove": {"magnitude": 0, "unit": "PT"},
+    "spaceBelow": {"magnitude": 0, "unit": "PT"},
+}
+
+
+def _full_document(paragraphs: int) -> dict:
+    """A document resource like the unmasked Docs API returns"""
+    content = []
+    index = 1
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            text = f"--- UPDATE 2024-{i // 50 % 12 + 1:02d}-01 ---\n"
+        else:
+            text = f"Paragraph {i} talks about the status of the project and its next milestones.\n"
+        element = {
+            "startIndex": index,
+            "endIndex": index + len(text),
+            "paragraph": {
+                "elements": [{
+                    "startIndex": index,
+                    "endIndex": index + len(text),
+                    "textRun": {"content": text, "textStyle": _TEXT_STYLE},
+                }],
+                "paragraphStyle": dict(_PARAGRAPH_STYLE, headingId=f"h.{i}"),
+            },
+        }
+        if i % 10 == 0:
+            element["paragraph"]["bullet"] = {"listId": f"kix.list{i // 100}", "textStyle": {}}
+        content.append(element)
+        index += len(text)
+
+    return {
+        "documentId": "doc",
+        "title": "Benchmark Document",
+        "revisionId": "ALm37BV",
+        "tabs": [{
+            "tabProperties": {"tabId": "t.0", "title": "Tab 1", "index": 0},
+            "documentTab": {"body": {"content": content}},
+        }],
+        "documentStyle": {"pageSize": {"height": {"magnitude": 792}, "width": {"magnitude": 612}}},
+        "namedStyles": {"styles": [
+            {"namedStyleType": f"HEADING_{n}", "textStyle": _TEXT_STYLE, "paragraphStyle": _PARAGRAPH_STYLE}
+            for n in range(1, 7)
+        ]},
+        "lists": {
+            f"kix.list{n}": {"listProperties": {"nestingLevels": [
+                {"bulletAlignment": "START", "glyphSymbol": "●", "indentStart": {"magnitude": 36 * level}}
+                for level in range(9)
+            ]}}
+            for n in range(paragraphs // 100 + 1)
+        },
+        "inlineObjects": {
+            f"kix.img{n}": {"inlineObjectProperties": {"embeddedObject": {
+                "imageProperties": {"contentUri": "https://lh3.googleusercontent.com/" + "x" * 200},
+                "size": {"height": {"magnitude": 300}, "width": {"magnitude": 400}},
+            }}}
+            for n in range(paragraphs // 200 + 1)
+        },
+        "namedRanges": {
+            f"range{n}": {"name": f"range{n}", "namedRanges": [{"ranges": [{"startIndex": n, "endIndex": n + 5}]}]}
+            for n in range(paragraphs // 100 + 1)
+        },
+    }
+
+
+def _masked_document(document: dict) -> dict:
+    """Keep only what `DOCUMENT_TEXT_FIELDS` asks the API for"""
+    content = []
+    for element in document["tabs"][0]["documentTab"]["body"]["content"]:
+        if "paragraph" not in element:
+            continue
+        content.append({"paragraph": {"elements": [
+            {"textRun": {"content": item["textRun"]["content"]}}
+            for item in element["paragraph"]["elements"] if "textRun" in item
+        ]}})
+    return {
+        "documentId": document["documentId"],
+        "title": document["title"],
+        "revisionId": document["revisionId"],
+        "tabs": [{"documentTab": {"body": {"content": content}}}],
+    }
+
+
+def _parse_time(payload: bytes, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        json.loads(payload)
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--paragraphs", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    full = _full_document(args.paragraphs)
+    masked = _masked_document(full)
+    assert gdoc_client.extract_document_content(full) == gdoc_client.extract_document_content(masked)
+
+    print(f"mask: {gdoc_client.DOCUMENT_TEXT_FIELDS}")
+    results = {}
+    for label, document in (("full document", full), ("masked document", masked)):
+        payload = json.dumps(document).encode()
+        results[label] = (len(payload), _parse_time(payload, args.repeat))
+        size, parse = results[label]
+        print(f"{label:<20} {size / 1024:>10,.0f} KiB {parse * 1000:>10.1f} ms to parse")
+
+    (full_size, full_parse), (masked_size, masked_parse) = results.values()
+    print(f"{'saved':<20} {1 - masked_size / full_size:>13.0%} {1 - masked_parse / full_parse:>13.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of sending one summary email to many subscribers
+
+Sends to a local fake SendGrid server (see `fake_sendgrid.py`) with simulated API latency
+and compares calling `build_and_send_email` once per recipient, which re-renders the body
+and builds a new client each time, against `send_bulk_email` with one recipient per request
+and with recipients packed into SendGrid personalizations.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_email_fanout.py [--recipients 200] [--latency-ms 50]`
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_sendgrid import FakeSendGridServer  # noqa: E402
+
+from gdoc_summaries.libs import constants, email_client  # noqa: E402
+
+
+def _summaries(count: int) -> list[constants.Summary]:
+    return [
+        constants.Summary(f"doc{i}", f"Document {i}", "<p>summary</p>" * 20, "2024-03-15", constants.SummaryType.TDD)
+        for i in range(count)
+    ]
+
+
+def _time(label: str, server: FakeSendGridServer, recipients: int, func) -> None:
+    requests_before = server.requests
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {elapsed:>8.2f} s {recipients / elapsed:>10,.1f} emails/sec "
+          f"{server.requests - requests_before:>6} requests")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--summaries", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    summaries = _summaries(args.summaries)
+    recipients = [f"user{i}@example.com" for i in range(args.recipients)]
+    os.environ.setdefault("SENDGRID_API_KEY", "SG.fake")
+
+    with FakeSendGridServer(latency_seconds=args.latency_ms / 1000) as server:
+        constants.SENDGRID_HOST = server.host
+
+        def per_recipient():
+            for email_address in recipients:
+                email_client.build_and_send_email(
+                    email_address=email_address, summaries=summaries, summary_type=constants.SummaryType.TDD
+                )
+        _time("before: build_and_send_email per recipient", server, len(recipients), per_recipient)
+
+        def bulk(recipients_per_request):
+            results = email_client.send_bulk_email(
+                email_addresses=recipients,
+                summaries=summaries,
+                summary_type=constants.SummaryType.TDD,
+                recipients_per_request=recipients_per_request,
+            )
+            assert all(result.ok for result in results)
+        _time(f"after: send_bulk_email ({constants.EMAIL_MAX_WORKERS} workers)", server, len(recipients),
+              lambda: bulk(1))
+        _time("after: send_bulk_email, personalizations", server, len(recipients),
+              lambda: bulk(constants.SENDGRID_MAX_PERSONALIZATIONS))
+
+
+if __name__ == "__main__":
+    main()
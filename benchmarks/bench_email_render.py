@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for rendering summary email bodies
+
+Compares the previous `+=` string concatenation, which ran once per recipient, against
+`email_client.build_email_html`, which runs once per send and writes compiled f-string
+fragments into a single buffer, caching each summary's fragment.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_email_render.py [--summaries 1000] [--recipients 100]`
+"""
+import argparse
+import time
+
+from gdoc_summaries.libs import constants, email_client
+
+
+def _summaries(count: int) -> list[constants.Summary]:
+    content = "<p><strong>TLDR:</strong> Short version.</p>\n<p><strong>Full Summary:</strong> " + "Details. " * 150 + "</p>"
+    return [
+        constants.Summary(f"doc{i}", f"Document {i}", content, "2024-03-15", constants.SummaryType.TDD)
+        for i in range(count)
+    ]
+
+
+def _previous_build_email_html(summaries: list[constants.Summary], joke: str) -> str:
+    """What `build_and_send_email` used to build for every recipient"""
+    body_html = "<p>Hi everyone!</p><p>Here are AI generated summaries of recent documents to review:</p>"
+    body_html += "<hr>"
+    for summary in summaries:
+        body_html += f'<h3>{summary.title}</h3>'
+        body_html += f'<p><em>Published: {summary.date_published}</em></p>'
+        if summary.content:
+            body_html += "<p>" + summary.content + "</p>"
+        body_html += f'<p>Click <a href="https://docs.google.com/document/d/{summary.document_id}">here</a> to read.</p>'
+        body_html += "<hr>"
+    body_html += '<p>If a summary was sent. It will not be sent again. </p>'
+    body_html += '<p>See <a href="https://cloverhealth.atlassian.net/wiki/x/CACt0Q">previously sent TDDs</a>'
+    body_html += ' | <a href="https://cloverhealth.atlassian.net/wiki/x/kADt0w">previously sent PRDs</a>'
+    body_html += ' | <a href="https://cloverhealth.atlassian.net/wiki/x/cIDs0w">previously sent Biweekly Summaries</a></p>'
+    body_html += "<p>Also, enjoy this randomly generated joke:</p>"
+    body_html += f"<p>{joke}</p>"
+    return body_html
+
+
+def _time(label: str, repeat: int, renders_per_send: int, func) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    per_digest = (time.perf_counter() - start) / repeat * 1000
+    print(f"{label:<40} {per_digest:>8.2f} ms per digest {per_digest * renders_per_send:>10.2f} ms per send")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--summaries", type=int, default=1000)
+    parser.add_argument("--recipients", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    summaries = _summaries(args.summaries)
+    joke = "A joke"
+    assert email_client.build_email_html(summaries, joke=joke) == _previous_build_email_html(summaries, joke)
+
+    _time("before: string concatenation", args.repeat, args.recipients,
+          lambda: _previous_build_email_html(summaries, joke))
+
+    def cold():
+        email_client._render_summary.cache_clear()
+        email_client.build_email_html(summaries, joke=joke)
+    _time("after: f-string fragments, cold cache", args.repeat, 1, cold)
+    _time("after: f-string fragments, warm cache", args.repeat, 1,
+          lambda: email_client.build_email_html(summaries, joke=joke))
+
+
+if __name__ == "__main__":
+    main()
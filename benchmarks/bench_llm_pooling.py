@@ -0,0 +1,134 @@
+"""
+Benchmark of Azure OpenAI request latency with and without connection pooling
+
+Starts a local HTTPS stub of the chat completions endpoint (self-signed certificate) and
+compares bare `requests.post` calls, which open a new TCP + TLS connection per request,
+against `AzureOpenAIClient`, which reuses keep-alive connections from its pooled session.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_llm_pooling.py [--requests 200] [--workers 8]`
+"""
+import argparse
+import datetime
+import json
+import os
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from gdoc_summaries.libs import llm_client
+
+_COMPLETION = json.dumps({"choices": [{"message": {"content": "stub summary"}}]}).encode()
+
+
+class _StubCompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_COMPLETION)))
+        self.end_headers()
+        self.wfile.write(_COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StaticToken:
+    def get_token(self) -> str:
+        return "stub-token"
+
+
+def _write_self_signed_cert(directory: str) -> tuple[str, str]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+def _measure(label: str, send, total: int, workers: int) -> None:
+    def timed(_):
+        start = time.perf_counter()
+        send()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        latencies = sorted(executor.map(timed, range(total)))
+    elapsed = time.perf_counter() - start
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<28} mean {statistics.mean(latencies) * 1000:7.2f} ms  "
+        f"p95 {p95 * 1000:7.2f} ms  throughput {total / elapsed:8.1f} req/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cert_path, key_path = _write_self_signed_cert(tmp_dir)
+        server = ThreadingHTTPServer(("localhost", 0), _StubCompletionHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_base = f"https://localhost:{server.server_address[1]}"
+
+        client = llm_client.AzureOpenAIClient(
+            api_base=api_base, pool_size=args.workers, token_provider=_StaticToken()
+        )
+        client._session.verify = cert_path
+        client._session.trust_env = False  # so REQUESTS_CA_BUNDLE can't override `verify`
+        messages = [{"role": "user", "content": "Summarize this"}]
+
+        def unpooled():
+            response = requests.post(
+                client.api_url,
+                headers={"Authorization": "Bearer stub-token"},
+                json={"messages": messages, "max_tokens": 500},
+                verify=cert_path,
+            )
+            response.json()
+
+        _measure("without pooling", unpooled, args.requests, args.workers)
+        _measure("with pooled session", lambda: client.chat_completion(messages, 500),
+                 args.requests, args.workers)
+
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
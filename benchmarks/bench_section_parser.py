@@ -0,0 +1,79 @@
+"""
+Micro-benchmark for biweekly section parsing
+
+Compares the previous DOTALL `finditer` + `strptime`-per-header parser against
+`section_parser` on synthetic documents with years of history, both for finding the latest
+section and for materializing only the sections newer than the last processed date.
+In documents that list their updates newest first, the streamed parser stops reading after
+the new ones.
+
+Run it via: `PYTHONPATH=. python benchmarks/bench_section_parser.py [--sections 10000]`
+"""
+import argparse
+import datetime
+import re
+import time
+
+from gdoc_summaries.libs import constants, gdoc_client, section_parser
+
+
+def _document(sections: int, newest_first: bool = True) -> dict:
+    """A biweekly document with the newest update first, or last"""
+    start = datetime.date(2000, 1, 1)
+    content = []
+    for i in (reversed(range(sections)) if newest_first else range(sections)):
+        section_date = (start + datetime.timedelta(days=i)).isoformat()
+        content.append({"paragraph": {"elements": [{"textRun": {"content": f"--- UPDATE {section_date} ---\n"}}]}})
+        for line in range(5):
+            text = f"Update {i}, line {line}: shipped the feature, fixed the bugs, planned the next sprint.\n"
+            content.append({"paragraph": {"elements": [{"textRun": {"content": text}}]}})
+    return {"body": {"content": content}}
+
+
+def _previous_extract_latest_section(document: dict) -> constants.DocumentSection:
+    """What `section_parser.extract_latest_section` did before the indexed parser"""
+    content = gdoc_client.extract_document_content(document)
+    section_pattern = r"---\s*UPDATE\s+(\d{4}-\d{2}-\d{2})\s*---\s*(.*?)(?=---\s*UPDATE|\Z)"
+    latest_section = None
+    latest_date = None
+    for match in re.finditer(section_pattern, content, re.DOTALL):
+        current_date = datetime.datetime.strptime(match.group(1), "%Y-%m-%d")
+        if not latest_date or current_date > latest_date:
+            latest_date = current_date
+            latest_section = constants.DocumentSection(match.group(1), match.group(2).strip(), match.group(0))
+    return latest_section
+
+
+def _time(label: str, repeat: int, func) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    print(f"{label:<45} {(time.perf_counter() - start) / repeat * 1000:>10.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sections", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    document = _document(args.sections)
+    oldest_first = _document(args.sections, newest_first=False)
+    latest = _previous_extract_latest_section(document)
+    assert section_parser.extract_latest_section(document) == latest
+    assert section_parser.extract_latest_section(oldest_first) == latest
+    since_date = (datetime.date.fromisoformat(latest.section_date) - datetime.timedelta(days=2)).isoformat()
+    assert len(section_parser.extract_sections_since(document, since_date)) == 2
+
+    _time("before: regex + strptime, latest section", args.repeat,
+          lambda: _previous_extract_latest_section(document))
+    _time("after: streamed, latest section", args.repeat,
+          lambda: section_parser.extract_latest_section(document))
+    _time("after: streamed, 2 sections since last run", args.repeat,
+          lambda: section_parser.extract_sections_since(document, since_date))
+    _time("after: streamed, latest section, oldest first", args.repeat,
+          lambda: section_parser.extract_latest_section(oldest_first))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Local fake of the SendGrid v3 mail send endpoint, for benchmarking the email client
+
+Accepts `POST /v3/mail/send` after a simulated latency, answers 202 like SendGrid does,
+and records how many requests and recipients it received. Point the email client at it
+by setting `constants.SENDGRID_HOST` (or GDOC_SUMMARIES_SENDGRID_HOST) to `server.host`.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSendGridServer:
+    """Runs the fake endpoint on a background thread while used as a context manager"""
+
+    def __init__(self, latency_seconds: float = 0.05):
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+        self.recipients = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def _handler(self):
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                time.sleep(fake.latency_seconds)
+                with fake._lock:
+                    fake.requests += 1
+                    fake.recipients += sum(len(p.get("to", [])) for p in body.get("personalizations", []))
+                self.send_response(202)
+                self.send_header("Content-Length", "0")
+                self.send_header("X-Message-Id", f"fake-{fake.requests}")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return _Handler
+
+    def __enter__(self) -> "FakeSendGridServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
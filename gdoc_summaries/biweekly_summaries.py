@@ -2,23 +2,32 @@
 Main entrypoint for script to run Gdoc Summaries for Biweekly updates
 
 The logic is as follows:
-1. Get the latest section from each document;
-    the section is required to be in the format of "--- UPDATE YYYY-MM-DD --- ... "
-2. If the section is newer than the last processed section, generate a summary
-3. Save the new section and summary to the database
+1. Get the sections newer than the last processed section, or only the latest section when none
+    was processed yet, from each document whose Drive revision changed since the last run;
+    sections are required to be in the format of
+    "--- UPDATE YYYY-MM-DD --- ... ". Documents are decoded and parsed in the `cpu_pool`.
+2. Generate a summary of each new section, concurrently
+3. Save the new sections and summaries to the database in one transaction
 4. Send an email with the new summary
-5. Mark the section as sent
+5. Mark the sections as sent
 
 This is different than other summaries because it uses the same biweekly documents for all updates.
+Documents are claimed for the whole run, so workers sharing a document list never process the
+same document at once.
+Each document is fetched at most once per run, and titles are stored in the DB so documents
+that only have unsent sections don't need to be fetched at all.
 """
 
+import dataclasses
 import logging
 from typing import List
 
 from googleapiclient import discovery
 
 from gdoc_summaries.libs import (
+    claims,
     constants,
+    cpu_pool,
     db,
     gdoc_client,
     llm,
@@ -28,28 +37,68 @@ from gdoc_summaries.libs import (
 
 LOGGER = logging.getLogger(__name__)
 
-def _process_document_sections(service, doc_info: constants.DocumentInfo) -> List[str]:
-    """Process sections for a single document and return document ID if updated"""
+
+@dataclasses.dataclass
+class _DocumentStore:
+    """Everything this run has fetched or stored about each document, so nothing is fetched twice"""
+    titles: dict[str, str] = dataclasses.field(default_factory=dict)
+    sections: dict[str, List[constants.DocumentSection]] = dataclasses.field(default_factory=dict)
+
+    def fetch(self, service, since_dates: dict[str, str | None]) -> None:
+        """
+        Fetch the given documents that haven't been fetched in this run yet, keeping their
+        titles and their sections newer than the given dates
+        """
+        missing = [document_id for document_id in since_dates if document_id not in self.sections]
+        if not missing:
+            return
+
+        responses, errors = gdoc_client.get_documents_from_ids(service, missing, decode=False)
+        if errors:
+            raise next(iter(errors.values()))
+
+        # Decoding and section parsing are CPU-bound, so they can run in other processes
+        futures = {
+            document_id: cpu_pool.submit(section_parser.read_sections_since, response, since_dates[document_id])
+            for document_id, response in responses.items()
+        }
+        titles = {}
+        for document_id, future in futures.items():
+            titles[document_id], self.sections[document_id] = future.result()
+        db.save_document_titles(titles)
+        self.titles.update(titles)
+
+
+def _process_document_sections(
+    new_sections: List[constants.DocumentSection], last_processed_date: str | None, doc_info: constants.DocumentInfo
+) -> List[str]:
+    """
+    Save the summaries of a document's new sections and return document ID if updated.
+
+    A document with no processed section yet starts from its latest section, rather than
+    summarizing and sending its whole history.
+    """
     try:
-        document = gdoc_client.get_document_from_id(service, doc_info.document_id)
-        latest_section = section_parser.extract_latest_section(document)
-        
-        if not latest_section:
+        if not new_sections and not last_processed_date:
             raise ValueError(f"No sections found in document {doc_info.document_id}")
-            
-        last_processed_date = db.get_latest_section_date(doc_info.document_id)
+        if not last_processed_date:
+            new_sections = new_sections[-1:]
+
         has_unsent_sections = bool(db.get_unsent_sections(doc_info.document_id))
-        has_new_section = not last_processed_date or latest_section.section_date > last_processed_date
-        
+        has_new_section = bool(new_sections)
+
         if has_new_section:
-            print(f"Found new section for document {doc_info.document_id}, generating summary for section:", latest_section.section_date)
-            section_summary = llm.generate_llm_summary(latest_section.content)
-            db.save_section_to_db(
-                document_id=doc_info.document_id,
-                section_date=latest_section.section_date,
-                section_content=latest_section.raw_content,
-                section_summary=section_summary
-            )
+            section_dates = ", ".join(section.section_date for section in new_sections)
+            print(f"Found new sections for document {doc_info.document_id}, generating summaries for sections:", section_dates)
+            section_summaries = llm.generate_llm_summaries([section.content for section in new_sections])
+            with db.transaction():
+                for section, section_summary in zip(new_sections, section_summaries):
+                    db.save_section_to_db(
+                        document_id=doc_info.document_id,
+                        section_date=section.section_date,
+                        section_content=section.raw_content,
+                        section_summary=section_summary
+                    )
             
         if has_new_section or has_unsent_sections:
             status = []
@@ -67,7 +116,7 @@ def _process_document_sections(service, doc_info: constants.DocumentInfo) -> Lis
         LOGGER.error(f"Error processing document {doc_info.document_id}: {e}")
         raise e
 
-def _create_biweekly_summary(doc_id: str, document: dict) -> constants.Summary:
+def _create_biweekly_summary(doc_id: str, title: str) -> constants.Summary:
     """Create a summary object from unsent sections"""
     unsent_sections = db.get_unsent_sections(doc_id)
     if not unsent_sections:
@@ -75,7 +124,7 @@ def _create_biweekly_summary(doc_id: str, document: dict) -> constants.Summary:
 
     return constants.Summary(
         document_id=doc_id,
-        title=document["title"],
+        title=title,
         content="\n\n".join([
             f"Update {date}:\n{summary}" 
             for date, summary in unsent_sections
@@ -84,6 +133,69 @@ def _create_biweekly_summary(doc_id: str, document: dict) -> constants.Summary:
         summary_type=constants.SummaryType.BIWEEKLY
     )
 
+def _process_documents(
+    service, creds, document_infos: List[constants.DocumentInfo], document_claims: claims.DocumentClaims
+) -> None:
+    """Summarize and send the new sections of documents this worker has claimed"""
+    documents_with_updates = []
+
+    # Only fetch documents whose Drive revision moved since they were last processed
+    drive_service = discovery.build("drive", "v3", credentials=creds)
+    document_ids = [doc_info.document_id for doc_info in document_infos]
+    current_revisions = gdoc_client.get_revision_metadata(drive_service, document_ids)
+    stored_revisions = db.get_document_revisions(document_ids)
+
+    changed_doc_infos = []
+    for doc_info in document_infos:
+        revision = current_revisions.get(doc_info.document_id)
+        if revision and revision == stored_revisions.get(doc_info.document_id):
+            if db.get_unsent_sections(doc_info.document_id):
+                print(f"Document {doc_info.document_id} is unchanged but has unsent sections")
+                documents_with_updates.append(doc_info.document_id)
+            else:
+                print(f"Document {doc_info.document_id} is unchanged since the last run, skipping")
+        else:
+            changed_doc_infos.append(doc_info)
+
+    last_processed_dates = {
+        doc_info.document_id: db.get_latest_section_date(doc_info.document_id) for doc_info in changed_doc_infos
+    }
+    store = _DocumentStore(titles=db.get_document_titles(document_ids))
+    store.fetch(service, last_processed_dates)
+
+    # Process each changed document's sections
+    for doc_info in changed_doc_infos:
+        revision = current_revisions.get(doc_info.document_id)
+        doc_updates = _process_document_sections(
+            store.sections[doc_info.document_id], last_processed_dates[doc_info.document_id], doc_info
+        )
+        documents_with_updates.extend(doc_updates)
+        if revision:
+            db.save_document_revision(revision)
+
+    if not documents_with_updates:
+        print("No new updates to send - all sections are either processed and sent or up to date")
+        return
+
+    # A worker that stalled past its leases may have lost documents to another worker
+    documents_with_updates = document_claims.still_held(documents_with_updates)
+
+    # Create summaries for documents with updates, only fetching titles we have never stored
+    store.fetch(service, {
+        doc_id: db.get_latest_section_date(doc_id) for doc_id in documents_with_updates if doc_id not in store.titles
+    })
+    all_summaries = []
+    for doc_id in documents_with_updates:
+        summary = _create_biweekly_summary(doc_id, store.titles[doc_id])
+        if summary:
+            all_summaries.append(summary)
+
+    # Send summaries via email
+    if summary_processor.send_summaries(all_summaries, constants.SummaryType.BIWEEKLY):
+        with db.transaction():
+            for doc_id in documents_with_updates:
+                db.mark_sections_as_sent(doc_id)
+
 def process_biweekly_summaries() -> None:
     """Process summaries for biweekly documents"""
     db.setup_database()
@@ -109,29 +221,15 @@ def process_biweekly_summaries() -> None:
         print(f"Error: {e}")
         return
 
-    documents_with_updates = []
-
-    # Process each document's sections
-    for doc_info in document_infos:
-        doc_updates = _process_document_sections(service, doc_info)
-        documents_with_updates.extend(doc_updates)
-
-    if not documents_with_updates:
-        print("No new updates to send - all sections are either processed and sent or up to date")
-        return
-
-    # Create summaries for documents with updates
-    all_summaries = []
-    for doc_id in documents_with_updates:
-        document = gdoc_client.get_document_from_id(service, doc_id)
-        summary = _create_biweekly_summary(doc_id, document)
-        if summary:
-            all_summaries.append(summary)
-
-    # Send summaries via email
-    if summary_processor.send_summaries(all_summaries, constants.SummaryType.BIWEEKLY):
-        for doc_id in documents_with_updates:
-            db.mark_sections_as_sent(doc_id)
+    # Other workers skip the documents this one claims until it has sent their updates
+    with claims.DocumentClaims() as document_claims:
+        claimed = set(document_claims.claim([doc_info.document_id for doc_info in document_infos]))
+        _process_documents(
+            service,
+            creds,
+            [doc_info for doc_info in document_infos if doc_info.document_id in claimed],
+            document_claims,
+        )
 
 if __name__ == "__main__":
     process_biweekly_summaries()
@@ -1,9 +1,13 @@
 from . import (
+    claims,
     constants,
+    cpu_pool,
     db,
     email_client,
     gdoc_client,
     llm,
+    llm_client,
     section_parser,
+    sql_storage,
     summary_processor,
 )
@@ -0,0 +1,94 @@
+"""Leases on documents, so several workers can share one document list
+
+A worker claims documents before working on them and releases them once their summaries
+are sent. While it holds them, its leases are renewed on a background thread. When a
+worker dies, its leases run out and other workers can claim its documents.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from gdoc_summaries.libs import constants, db
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _new_owner() -> str:
+    """Name this worker uniquely, and recognizably in the claims table"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class DocumentClaims:
+    """
+    The documents this worker has claimed, released when the `with` block exits.
+
+    Leases are renewed every third of `lease_seconds` until then, so a document stays
+    claimed however long its summary or the email confirmation takes.
+    """
+
+    def __init__(self, lease_seconds: float = constants.CLAIM_LEASE_SECONDS, owner: str | None = None):
+        self.owner = owner or _new_owner()
+        self.lease_seconds = lease_seconds
+        self._held: dict[str, None] = {}  # insertion-ordered set
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    def __enter__(self) -> "DocumentClaims":
+        self._heartbeat = threading.Thread(target=self._renew_until_stopped, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._heartbeat.join()
+        with self._lock:
+            held = list(self._held)
+            self._held.clear()
+        db.release_documents(held, self.owner)
+
+    def claim(self, document_ids: list[str]) -> list[str]:
+        """Claim the given documents that no other worker holds, and return them in order"""
+        claimed = db.claim_documents(document_ids, self.owner, self.lease_seconds)
+        with self._lock:
+            self._held.update(dict.fromkeys(claimed))
+        claimed_ids = set(claimed)
+        for document_id in dict.fromkeys(document_ids):
+            if document_id not in claimed_ids:
+                print(f"Document {document_id} is claimed by another worker, skipping.")
+        return claimed
+
+    def still_held(self, document_ids: list[str]) -> list[str]:
+        """Renew the leases on the given documents now, and return the ones this worker still holds"""
+        held = db.renew_claims(document_ids, self.owner, self.lease_seconds)
+        self._forget_lost(document_ids, held)
+        return held
+
+    def _forget_lost(self, document_ids: list[str], held: list[str]) -> None:
+        lost = set(document_ids) - set(held)
+        if not lost:
+            return
+        LOGGER.warning(f"Lost the claims on {sorted(lost)} to another worker")
+        with self._lock:
+            for document_id in lost:
+                self._held.pop(document_id, None)
+
+    def _renew_until_stopped(self) -> None:
+        try:
+            while not self._stopped.wait(self.lease_seconds / 3):
+                with self._lock:
+                    document_ids = list(self._held)
+                if not document_ids:
+                    continue
+                try:
+                    held = db.renew_claims(document_ids, self.owner, self.lease_seconds)
+                except Exception as e:
+                    # The next renewal may still be in time
+                    LOGGER.warning(f"Error renewing document claims: {e}")
+                    continue
+                self._forget_lost(document_ids, held)
+        finally:
+            db.close_connection()
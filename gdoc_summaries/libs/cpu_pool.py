@@ -0,0 +1,60 @@
+"""Optional process pool for the CPU-bound steps of a run
+
+Decoding Docs responses, extracting their text, parsing biweekly sections and converting
+summaries from markdown to HTML run in the calling thread by default. With
+`constants.CPU_WORKERS` set, they run in a pool of processes instead, so large runs use
+every core. Tasks take and return small picklable values, such as the raw JSON of a response,
+strings and dataclasses, so handing work to another process costs less than the work itself.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable
+
+from gdoc_summaries.libs import constants
+
+_EXECUTOR: ProcessPoolExecutor | None = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor | None:
+    """Get the process pool, starting it on first use, or None when it is disabled"""
+    global _EXECUTOR
+    if constants.CPU_WORKERS <= 0:
+        return None
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            # Worker processes are spawned rather than forked, since the parent has
+            # threads and open connections a fork would copy mid-use
+            _EXECUTOR = ProcessPoolExecutor(
+                max_workers=constants.CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _EXECUTOR
+
+
+def submit(func: Callable, *args) -> Future:
+    """
+    Run `func(*args)` in the process pool, or right away in this thread when it is disabled.
+
+    `func` must be a module-level function, and its arguments and result picklable.
+    """
+    executor = _get_executor()
+    if executor is not None:
+        return executor.submit(func, *args)
+
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def shutdown() -> None:
+    """Stop the process pool, if it was started; the next task starts a new one"""
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown()
+            _EXECUTOR = None
@@ -1,42 +1,160 @@
-"""SQLite DB Tools"""
+"""SQLite DB Tools
+
+Each thread reuses a single connection to `DATABASE_PATH` (see `get_connection`), so the
+statements below stay prepared in the connection's statement cache across calls.
+Statements run in autocommit mode unless they are grouped with `transaction()`.
+The schema version is kept in `PRAGMA user_version` (see `setup_database`).
+
+When `constants.DATABASE_URL` is set, the functions below store everything in that shared
+database instead, through `sql_storage.SQLAlchemyStorage`, so several workers can run at once.
+"""
+import contextlib
+import functools
 import sqlite3
+import threading
+import time
 
-from gdoc_summaries.libs import constants
+from gdoc_summaries.libs import constants, sql_storage
 
 DATABASE_PATH = "summaries.db"
 
+# Stay well below SQLite's limit on host parameters in a single statement
+_MAX_QUERY_PARAMS = 500
+
+# Number of prepared statements kept per connection
+_STATEMENT_CACHE_SIZE = 256
+
+_LOCAL = threading.local()
+
+_SHARED_STORAGES: dict[str, sql_storage.SQLAlchemyStorage] = {}
+_SHARED_STORAGES_LOCK = threading.Lock()
+
+def get_shared_storage() -> sql_storage.SQLAlchemyStorage | None:
+    """Get the storage for `constants.DATABASE_URL`, or None when the local SQLite file is used"""
+    url = constants.DATABASE_URL
+    if not url:
+        return None
+    storage = _SHARED_STORAGES.get(url)
+    if storage is None:
+        with _SHARED_STORAGES_LOCK:
+            storage = _SHARED_STORAGES.get(url)
+            if storage is None:
+                storage = sql_storage.SQLAlchemyStorage.from_url(url)
+                _SHARED_STORAGES[url] = storage
+    return storage
+
+def _dispatched(func):
+    """Call the shared storage's method of the same name instead, when a shared database is configured"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        storage = get_shared_storage()
+        if storage is not None:
+            return getattr(storage, func.__name__)(*args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+def _chunked(items: list, size: int = _MAX_QUERY_PARAMS):
+    """Yield successive slices of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def get_connection() -> sqlite3.Connection:
+    """Get this thread's connection to DATABASE_PATH, opening it on first use. Only used without a shared database."""
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is not None and _LOCAL.path != DATABASE_PATH:
+        close_connection()
+        conn = None
+
+    if conn is None:
+        conn = sqlite3.connect(
+            DATABASE_PATH,
+            isolation_level=None,  # we manage transactions explicitly
+            cached_statements=_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        _LOCAL.conn = conn
+        _LOCAL.path = DATABASE_PATH
+        _LOCAL.depth = 0
+    return conn
+
+@_dispatched
+def close_connection() -> None:
+    """Close this thread's connection, if it has one"""
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is not None:
+        conn.close()
+    _LOCAL.conn = None
+    _LOCAL.depth = 0
+
+@_dispatched
+@contextlib.contextmanager
+def transaction(immediate: bool = False):
+    """
+    Run the enclosed DB calls in a single transaction, committed when the block exits.
+
+    Nested blocks use savepoints, so a failing inner block only rolls back its own writes.
+    An `immediate` transaction takes the write lock up front, for blocks that read
+    something and then write based on it.
+    """
+    conn = get_connection()
+    depth = _LOCAL.depth
+    savepoint = f"sp_{depth}"
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    else:
+        conn.execute(f"SAVEPOINT {savepoint}")
+    _LOCAL.depth = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        _LOCAL.depth = depth
+        if depth == 0:
+            conn.execute("ROLLBACK")
+        else:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+        raise
+    _LOCAL.depth = depth
+    conn.execute("COMMIT" if depth == 0 else f"RELEASE {savepoint}")
+
 def _table_exists(cursor, table_name: str) -> bool:
     """Check if a table exists in the database"""
     cursor.execute("""
-        SELECT count(name) 
-        FROM sqlite_master 
+        SELECT count(name)
+        FROM sqlite_master
         WHERE type='table' AND name=?
     """, (table_name,))
     return cursor.fetchone()[0] == 1
 
+def _index_exists(cursor, index_name: str) -> bool:
+    """Check if an index exists in the database"""
+    cursor.execute("""
+        SELECT count(name)
+        FROM sqlite_master
+        WHERE type='index' AND name=?
+    """, (index_name,))
+    return cursor.fetchone()[0] == 1
+
 def _run_migration_1_add_summary_type():
     """First migration: Add summary_type column and set existing records to 'TDD'"""
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    
+    cursor = get_connection().cursor()
+
     # Check if summary_type column exists
     cursor.execute("PRAGMA table_info(summaries)")
     columns = cursor.fetchall()
     has_summary_type = any(column[1] == 'summary_type' for column in columns)
-    
+
     if not has_summary_type:
         print("Running migration 1: Adding summary_type column")
         cursor.execute("ALTER TABLE summaries ADD COLUMN summary_type TEXT DEFAULT 'TDD'")
         cursor.execute("UPDATE summaries SET summary_type = 'TDD'")
-        conn.commit()
-    
-    conn.close()
 
 def _run_migration_2_add_sections_table():
     """Second migration: Add sections table for biweekly updates"""
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    
+    cursor = get_connection().cursor()
+
     if not _table_exists(cursor, "summary_sections"):
         print("Running migration 2: Adding sections table")
         cursor.execute("""
@@ -51,54 +169,261 @@ def _run_migration_2_add_sections_table():
                 FOREIGN KEY(document_id) REFERENCES summaries(document_id)
             )
         """)
-        conn.commit()
-    
-    conn.close()
 
-def run_migrations():
-    """Run all database migrations in order"""
-    migrations = [
-        _run_migration_1_add_summary_type,
-        _run_migration_2_add_sections_table,
-    ]
-    
-    for migration in migrations:
-        migration()
+def _run_migration_3_add_document_revisions_table():
+    """Third migration: Add table tracking the last processed Drive revision of each document"""
+    cursor = get_connection().cursor()
 
-def setup_database():
-    """Initialize database and run migrations"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Create initial table structure
-    if not _table_exists(cursor, "summaries"):
-        print("Creating summaries table")
+    if not _table_exists(cursor, "document_revisions"):
+        print("Running migration 3: Adding document revisions table")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_revisions (
+                document_id TEXT PRIMARY KEY,
+                modified_time TEXT,
+                head_revision_id TEXT
+            )
+        """)
+
+def _run_migration_4_add_llm_cache_table():
+    """Fourth migration: Add content-addressed cache of LLM responses"""
+    cursor = get_connection().cursor()
+
+    if not _table_exists(cursor, "llm_cache"):
+        print("Running migration 4: Adding LLM cache table")
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS summaries (
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT,
+                created_at REAL,
+                last_used_at REAL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used_at ON llm_cache(last_used_at)")
+
+def _run_migration_5_add_documents_table():
+    """Fifth migration: Add table of document titles, so sending doesn't need to fetch documents"""
+    cursor = get_connection().cursor()
+
+    if not _table_exists(cursor, "documents"):
+        print("Running migration 5: Adding documents table")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
                 document_id TEXT PRIMARY KEY,
-                title TEXT,
-                summary TEXT,
-                date_published TEXT,
-                sent INTEGER DEFAULT 0
+                title TEXT
+            )
+        """)
+
+def _run_migration_6_add_email_outbox_table():
+    """Sixth migration: Add outbox of summary emails, tracking delivery to each recipient"""
+    cursor = get_connection().cursor()
+
+    if not _table_exists(cursor, "email_outbox"):
+        print("Running migration 6: Adding email outbox table")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS email_outbox (
+                batch_id TEXT NOT NULL,
+                email_address TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                message_id TEXT,
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (batch_id, email_address)
             )
         """)
-    conn.commit()
-    conn.close()
-    
-    # Run any pending migrations
-    run_migrations()
 
+def _run_migration_7_add_section_and_summary_indexes():
+    """Seventh migration: Index sections and summaries by how they're looked up, and dedupe sections"""
+    cursor = get_connection().cursor()
+
+    if not _index_exists(cursor, "idx_summary_sections_document_date"):
+        print("Running migration 7: Adding section and summary indexes")
+        # Keep the first copy of each duplicated section, sent if any copy was
+        cursor.execute("""
+            UPDATE summary_sections SET sent = 1
+            WHERE id IN (
+                SELECT MIN(id) FROM summary_sections
+                GROUP BY document_id, section_date
+                HAVING COUNT(*) > 1 AND MAX(sent) = 1
+            )
+        """)
+        cursor.execute("""
+            DELETE FROM summary_sections
+            WHERE id NOT IN (SELECT MIN(id) FROM summary_sections GROUP BY document_id, section_date)
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_summary_sections_document_date
+            ON summary_sections(document_id, section_date)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_summary_sections_document_sent_date
+            ON summary_sections(document_id, sent, section_date)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_summaries_type_sent
+            ON summaries(summary_type, sent)
+        """)
 
+def _run_migration_8_add_document_claims_table():
+    """Eighth migration: Add table of documents claimed by workers, so two workers never process the same document"""
+    cursor = get_connection().cursor()
+
+    if not _table_exists(cursor, "document_claims"):
+        print("Running migration 8: Adding document claims table")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS document_claims (
+                document_id TEXT PRIMARY KEY,
+                owner TEXT,
+                lease_expires_at REAL
+            )
+        """)
+
+# Migrations in the order they are applied; the DB's `PRAGMA user_version` is the number
+# of them already applied. Add new migrations to the end, and to `_LATEST_SCHEMA` too.
+_MIGRATIONS = [
+    _run_migration_1_add_summary_type,
+    _run_migration_2_add_sections_table,
+    _run_migration_3_add_document_revisions_table,
+    _run_migration_4_add_llm_cache_table,
+    _run_migration_5_add_documents_table,
+    _run_migration_6_add_email_outbox_table,
+    _run_migration_7_add_section_and_summary_indexes,
+    _run_migration_8_add_document_claims_table,
+]
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+# The schema after every migration, used to create new databases without replaying history
+_LATEST_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS summaries (
+        document_id TEXT PRIMARY KEY,
+        title TEXT,
+        summary TEXT,
+        date_published TEXT,
+        sent INTEGER DEFAULT 0,
+        summary_type TEXT DEFAULT 'TDD'
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_summaries_type_sent ON summaries(summary_type, sent)",
+    """
+    CREATE TABLE IF NOT EXISTS summary_sections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        document_id TEXT,
+        section_date TEXT,
+        section_content TEXT,
+        section_summary TEXT,
+        processed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sent INTEGER DEFAULT 0,
+        FOREIGN KEY(document_id) REFERENCES summaries(document_id)
+    )
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_summary_sections_document_date
+    ON summary_sections(document_id, section_date)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_summary_sections_document_sent_date
+    ON summary_sections(document_id, sent, section_date)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS document_revisions (
+        document_id TEXT PRIMARY KEY,
+        modified_time TEXT,
+        head_revision_id TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        cache_key TEXT PRIMARY KEY,
+        response TEXT,
+        created_at REAL,
+        last_used_at REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used_at ON llm_cache(last_used_at)",
+    """
+    CREATE TABLE IF NOT EXISTS documents (
+        document_id TEXT PRIMARY KEY,
+        title TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        batch_id TEXT NOT NULL,
+        email_address TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'PENDING',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        message_id TEXT,
+        error TEXT,
+        updated_at REAL,
+        PRIMARY KEY (batch_id, email_address)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS document_claims (
+        document_id TEXT PRIMARY KEY,
+        owner TEXT,
+        lease_expires_at REAL
+    )
+    """,
+]
+
+@_dispatched
+def get_schema_version() -> int:
+    """Get the number of migrations applied to the database"""
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def _set_schema_version(version: int) -> None:
+    # PRAGMA statements don't take parameters
+    get_connection().execute(f"PRAGMA user_version = {int(version)}")
+
+def run_migrations():
+    """Apply the migrations the database doesn't have yet, in order, in a single transaction"""
+    with transaction(immediate=True):
+        version = get_schema_version()
+        for migration in _MIGRATIONS[version:]:
+            migration()
+        if version < SCHEMA_VERSION:
+            _set_schema_version(SCHEMA_VERSION)
+
+@_dispatched
+def setup_database():
+    """Initialize database and run migrations"""
+    # Up-to-date databases only need this check on startup
+    if get_schema_version() >= SCHEMA_VERSION:
+        return
+
+    with transaction(immediate=True):
+        if not _table_exists(get_connection().cursor(), "summaries"):
+            print(f"Creating database schema version {SCHEMA_VERSION}")
+            for statement in _LATEST_SCHEMA:
+                get_connection().execute(statement)
+            _set_schema_version(SCHEMA_VERSION)
+        else:
+            # Databases from before versioning are at version 0, and the migrations skip
+            # whatever they already have
+            run_migrations()
+
+@_dispatched
+def drop_tables():
+    """Drop every table except the LLM cache, so `setup_database` recreates them empty"""
+    with transaction() as conn:
+        conn.execute("DROP TABLE IF EXISTS summary_sections")  # Drop sections first due to foreign key
+        conn.execute("DROP TABLE IF EXISTS summaries")
+        conn.execute("DROP TABLE IF EXISTS document_revisions")
+        conn.execute("DROP TABLE IF EXISTS documents")
+        conn.execute("DROP TABLE IF EXISTS email_outbox")
+        conn.execute("DROP TABLE IF EXISTS document_claims")
+        _set_schema_version(0)
+
+@_dispatched
 def get_summary_from_db(document_id: str) -> constants.Summary | None:
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT title, summary, date_published, summary_type 
-        FROM summaries 
+    cursor = get_connection().execute("""
+        SELECT title, summary, date_published, summary_type
+        FROM summaries
         WHERE document_id = ?
     """, (document_id,))
     result = cursor.fetchone()
-    conn.close()
     if result:
         return constants.Summary(
             document_id=document_id,
@@ -109,101 +434,333 @@ def get_summary_from_db(document_id: str) -> constants.Summary | None:
         )
     return None
 
+@_dispatched
 def save_summary_to_db(summary: constants.Summary):
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO summaries (document_id, title, summary, date_published, sent, summary_type) 
-        VALUES (?, ?, ?, ?, 0, ?) 
-        ON CONFLICT(document_id) DO UPDATE SET 
-            title=excluded.title, 
-            summary=excluded.summary, 
+    get_connection().execute("""
+        INSERT INTO summaries (document_id, title, summary, date_published, sent, summary_type)
+        VALUES (?, ?, ?, ?, 0, ?)
+        ON CONFLICT(document_id) DO UPDATE SET
+            title=excluded.title,
+            summary=excluded.summary,
             date_published=excluded.date_published,
             summary_type=excluded.summary_type,
             sent=0
     """, (
-        summary.document_id, 
-        summary.title, 
-        summary.content, 
-        summary.date_published, 
+        summary.document_id,
+        summary.title,
+        summary.content,
+        summary.date_published,
         summary.summary_type.value
     ))
-    conn.commit()
-    conn.close()
 
 
+@_dispatched
 def get_summary_sent_status(document_id: str) -> 0|1:
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT sent FROM summaries WHERE document_id = ?", (document_id,))
+    cursor = get_connection().execute("SELECT sent FROM summaries WHERE document_id = ?", (document_id,))
     result = cursor.fetchone()
-    conn.close()
     if result:
         return result[0]
     return None
 
 
+@_dispatched
 def mark_summary_as_sent(document_id: str):
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("UPDATE summaries SET sent = 1 WHERE document_id = ?", (document_id,))
-    conn.commit()
-    conn.close()
+    get_connection().execute("UPDATE summaries SET sent = 1 WHERE document_id = ?", (document_id,))
 
+@_dispatched
+def get_summaries_with_sent_status(
+    document_ids: list[str],
+) -> dict[str, tuple[constants.Summary, int]]:
+    """Get the stored summary and sent status of many documents in a single query"""
+    cursor = get_connection().cursor()
+    results = {}
+    for chunk in _chunked(list(dict.fromkeys(document_ids))):
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"""
+            SELECT document_id, title, summary, date_published, summary_type, sent
+            FROM summaries
+            WHERE document_id IN ({placeholders})
+        """, chunk)
+        for document_id, title, content, date_published, summary_type, sent in cursor.fetchall():
+            summary = constants.Summary(
+                document_id=document_id,
+                title=title,
+                content=content,
+                date_published=date_published,
+                summary_type=summary_type
+            )
+            results[document_id] = (summary, sent)
+    return results
+
+@_dispatched
+def mark_summaries_as_sent(document_ids: list[str]) -> None:
+    """Mark many summaries as sent in a single statement"""
+    with transaction() as conn:
+        for chunk in _chunked(list(dict.fromkeys(document_ids))):
+            placeholders = ", ".join("?" * len(chunk))
+            conn.execute(f"UPDATE summaries SET sent = 1 WHERE document_id IN ({placeholders})", chunk)
+
+@_dispatched
 def get_latest_section_date(document_id: str) -> str | None:
     """Get the most recent section date for a document"""
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT section_date 
-        FROM summary_sections 
-        WHERE document_id = ? 
-        ORDER BY section_date DESC 
+    cursor = get_connection().execute("""
+        SELECT section_date
+        FROM summary_sections
+        WHERE document_id = ?
+        ORDER BY section_date DESC
         LIMIT 1
     """, (document_id,))
     result = cursor.fetchone()
-    conn.close()
     return result[0] if result else None
 
+@_dispatched
 def save_section_to_db(
     document_id: str,
     section_date: str,
     section_content: str,
     section_summary: str
 ) -> None:
-    """Save a new document section"""
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO summary_sections 
-        (document_id, section_date, section_content, section_summary) 
+    """Save a new document section, ignoring a section already saved for the same date"""
+    get_connection().execute("""
+        INSERT INTO summary_sections
+        (document_id, section_date, section_content, section_summary)
         VALUES (?, ?, ?, ?)
+        ON CONFLICT(document_id, section_date) DO NOTHING
     """, (document_id, section_date, section_content, section_summary))
-    conn.commit()
-    conn.close()
 
+@_dispatched
 def get_unsent_sections(document_id: str) -> list[tuple]:
     """Get all unsent sections for a document"""
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT section_date, section_summary 
-        FROM summary_sections 
-        WHERE document_id = ? AND sent = 0 
+    cursor = get_connection().execute("""
+        SELECT section_date, section_summary
+        FROM summary_sections
+        WHERE document_id = ? AND sent = 0
         ORDER BY section_date DESC
     """, (document_id,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return cursor.fetchall()
 
+@_dispatched
 def mark_sections_as_sent(document_id: str) -> None:
     """Mark all sections for a document as sent"""
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE summary_sections 
-        SET sent = 1 
+    get_connection().execute("""
+        UPDATE summary_sections
+        SET sent = 1
         WHERE document_id = ? AND sent = 0
     """, (document_id,))
-    conn.commit()
-    conn.close()
+
+@_dispatched
+def get_document_revisions(document_ids: list[str]) -> dict[str, constants.DocumentRevision]:
+    """Get the last processed revision of each of the given documents"""
+    cursor = get_connection().cursor()
+    revisions = {}
+    for chunk in _chunked(list(dict.fromkeys(document_ids))):
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"""
+            SELECT document_id, modified_time, head_revision_id
+            FROM document_revisions
+            WHERE document_id IN ({placeholders})
+        """, chunk)
+        for document_id, modified_time, head_revision_id in cursor.fetchall():
+            revisions[document_id] = constants.DocumentRevision(
+                document_id=document_id,
+                modified_time=modified_time,
+                head_revision_id=head_revision_id,
+            )
+    return revisions
+
+@_dispatched
+def save_document_revision(revision: constants.DocumentRevision) -> None:
+    """Record the revision of a document that has just been processed"""
+    get_connection().execute("""
+        INSERT INTO document_revisions (document_id, modified_time, head_revision_id)
+        VALUES (?, ?, ?)
+        ON CONFLICT(document_id) DO UPDATE SET
+            modified_time=excluded.modified_time,
+            head_revision_id=excluded.head_revision_id
+    """, (revision.document_id, revision.modified_time, revision.head_revision_id))
+
+@_dispatched
+def get_document_titles(document_ids: list[str]) -> dict[str, str]:
+    """Get the stored title of each of the given documents"""
+    cursor = get_connection().cursor()
+    titles = {}
+    for chunk in _chunked(list(dict.fromkeys(document_ids))):
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"""
+            SELECT document_id, title
+            FROM documents
+            WHERE document_id IN ({placeholders})
+        """, chunk)
+        titles.update(cursor.fetchall())
+    return titles
+
+@_dispatched
+def save_document_titles(titles: dict[str, str]) -> None:
+    """Store the titles of documents by ID"""
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO documents (document_id, title)
+            VALUES (?, ?)
+            ON CONFLICT(document_id) DO UPDATE SET title=excluded.title
+        """, titles.items())
+
+@_dispatched
+def enqueue_emails(batch_id: str, email_addresses: list[str]) -> None:
+    """Add recipients of a batch to the outbox, keeping the delivery state of ones already there"""
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO email_outbox (batch_id, email_address, status, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(batch_id, email_address) DO NOTHING
+        """, [
+            (batch_id, email_address, constants.DeliveryStatus.PENDING.value, time.time())
+            for email_address in email_addresses
+        ])
+
+@_dispatched
+def get_undelivered_emails(batch_id: str) -> list[str]:
+    """Get the recipients of a batch that haven't been sent the email yet, in the order they were added"""
+    cursor = get_connection().execute("""
+        SELECT email_address
+        FROM email_outbox
+        WHERE batch_id = ? AND status != ?
+        ORDER BY rowid
+    """, (batch_id, constants.DeliveryStatus.SENT.value))
+    return [row[0] for row in cursor.fetchall()]
+
+@_dispatched
+def record_email_results(batch_id: str, results: list[constants.EmailResult]) -> None:
+    """Record the outcome of an attempt to send a batch's email to some of its recipients"""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany("""
+            UPDATE email_outbox
+            SET status = ?, attempts = attempts + 1, message_id = ?, error = ?, updated_at = ?
+            WHERE batch_id = ? AND email_address = ?
+        """, [
+            (
+                (constants.DeliveryStatus.SENT if result.ok else constants.DeliveryStatus.FAILED).value,
+                result.message_id,
+                None if result.ok else str(result.error),
+                now,
+                batch_id,
+                result.email_address,
+            )
+            for result in results
+        ])
+
+@_dispatched
+def claim_documents(document_ids: list[str], owner: str, lease_seconds: float) -> list[str]:
+    """
+    Claim the given documents for `owner` until the lease expires.
+
+    Documents claimed by another owner whose lease hasn't expired are skipped. Claiming a
+    document `owner` already holds extends its lease.
+
+    Returns:
+        list[str]: The claimed document IDs, in the order of `document_ids`
+    """
+    unique_ids = list(dict.fromkeys(document_ids))
+    now = time.time()
+    claimable = set()
+    with transaction(immediate=True) as conn:
+        conn.executemany("""
+            INSERT INTO document_claims (document_id)
+            VALUES (?)
+            ON CONFLICT(document_id) DO NOTHING
+        """, [(document_id,) for document_id in unique_ids])
+        for chunk in _chunked(unique_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = conn.execute(f"""
+                SELECT document_id
+                FROM document_claims
+                WHERE document_id IN ({placeholders})
+                    AND (owner IS NULL OR owner = ? OR lease_expires_at < ?)
+            """, (*chunk, owner, now))
+            claimable.update(row[0] for row in cursor.fetchall())
+        claimed = [document_id for document_id in unique_ids if document_id in claimable]
+        conn.executemany("""
+            UPDATE document_claims
+            SET owner = ?, lease_expires_at = ?
+            WHERE document_id = ?
+        """, [(owner, now + lease_seconds, document_id) for document_id in claimed])
+    return claimed
+
+@_dispatched
+def renew_claims(document_ids: list[str], owner: str, lease_seconds: float) -> list[str]:
+    """
+    Extend `owner`'s leases on the given documents.
+
+    Returns:
+        list[str]: The given document IDs `owner` still holds, in the order of `document_ids`
+    """
+    unique_ids = list(dict.fromkeys(document_ids))
+    held = set()
+    with transaction() as conn:
+        for chunk in _chunked(unique_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            conn.execute(f"""
+                UPDATE document_claims
+                SET lease_expires_at = ?
+                WHERE document_id IN ({placeholders}) AND owner = ?
+            """, (time.time() + lease_seconds, *chunk, owner))
+            cursor = conn.execute(f"""
+                SELECT document_id
+                FROM document_claims
+                WHERE document_id IN ({placeholders}) AND owner = ?
+            """, (*chunk, owner))
+            held.update(row[0] for row in cursor.fetchall())
+    return [document_id for document_id in unique_ids if document_id in held]
+
+@_dispatched
+def release_documents(document_ids: list[str], owner: str) -> None:
+    """Give up `owner`'s claims on the given documents"""
+    with transaction() as conn:
+        conn.executemany("""
+            UPDATE document_claims
+            SET owner = NULL, lease_expires_at = NULL
+            WHERE document_id = ? AND owner = ?
+        """, [(document_id, owner) for document_id in dict.fromkeys(document_ids)])
+
+@_dispatched
+def get_cached_llm_response(cache_key: str, max_age_seconds: float) -> str | None:
+    """Get a cached LLM response that is younger than `max_age_seconds`"""
+    now = time.time()
+    conn = get_connection()
+    result = conn.execute("""
+        SELECT response
+        FROM llm_cache
+        WHERE cache_key = ? AND created_at >= ?
+    """, (cache_key, now - max_age_seconds)).fetchone()
+    if not result:
+        return None
+    conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE cache_key = ?", (now, cache_key))
+    return result[0]
+
+@_dispatched
+def save_cached_llm_response(cache_key: str, response: str) -> None:
+    """Cache an LLM response under the hash of everything that produced it"""
+    now = time.time()
+    get_connection().execute("""
+        INSERT INTO llm_cache (cache_key, response, created_at, last_used_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+            response=excluded.response,
+            created_at=excluded.created_at,
+            last_used_at=excluded.last_used_at
+    """, (cache_key, response, now, now))
+
+@_dispatched
+def evict_llm_cache(max_entries: int, max_age_seconds: float) -> int:
+    """Drop expired cache entries, then the least recently used ones above `max_entries`"""
+    with transaction() as conn:
+        expired = conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - max_age_seconds,)
+        ).rowcount
+        overflow = conn.execute("""
+            DELETE FROM llm_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+    return expired + overflow
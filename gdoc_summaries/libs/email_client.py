@@ -1,10 +1,16 @@
 """Email client for sending emails"""
 
+import functools
+import io
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Callable
 
 import pyjokes
+import requests
+from requests.adapters import HTTPAdapter
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 
@@ -12,39 +18,119 @@ from gdoc_summaries.libs import constants
 
 LOGGER = logging.getLogger(__name__)
 
+SENDER_EMAIL = "danny.vu@cloverhealth.com"
+
+
+def build_subject(summary_type: constants.SummaryType) -> str:
+    """Build the subject line of a summary email"""
+    return f"{summary_type.value.capitalize()} Summaries | Date: {datetime.now().strftime('%Y-%m-%d')}"
+
+_HEADER_HTML = (
+    "<p>Hi everyone!</p><p>Here are AI generated summaries of recent documents to review:</p>"
+    "<hr>"
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_summary(document_id: str, title: str, date_published: str, content: str) -> str:
+    """
+    Render the fragment of a single summary.
+
+    The f-strings are compiled with the module, and fragments are cached since a summary is
+    rendered again for every send until it is marked as sent.
+    """
+    link = f'<p>Click <a href="https://docs.google.com/document/d/{document_id}">here</a> to read.</p><hr>'
+    if content:
+        return f'<h3>{title}</h3><p><em>Published: {date_published}</em></p><p>{content}</p>{link}'
+    return f'<h3>{title}</h3><p><em>Published: {date_published}</em></p>{link}'
+
+def _render_footer(joke: str) -> str:
+    return (
+        '<p>If a summary was sent. It will not be sent again. </p>'
+        '<p>See <a href="https://cloverhealth.atlassian.net/wiki/x/CACt0Q">previously sent TDDs</a>'
+        ' | <a href="https://cloverhealth.atlassian.net/wiki/x/kADt0w">previously sent PRDs</a>'
+        ' | <a href="https://cloverhealth.atlassian.net/wiki/x/cIDs0w">previously sent Biweekly Summaries</a></p>'
+        '<p>Also, enjoy this randomly generated joke:</p>'
+        f'<p>{joke}</p>'
+    )
+
+def build_email_html(summaries: list[constants.Summary], joke: str | None = None) -> str:
+    """
+    Render the HTML body of a summary email.
+
+    Args:
+        summaries: Summaries included in the email
+        joke: Joke at the end of the email, a random one if not given
+
+    Returns:
+        str: The HTML body
+    """
+    if joke is None:
+        joke = pyjokes.get_joke(language='en', category='neutral')
+
+    buffer = io.StringIO()
+    buffer.write(_HEADER_HTML)
+    for summary in summaries:
+        buffer.write(_render_summary(summary.document_id, summary.title, summary.date_published, summary.content))
+    buffer.write(_render_footer(joke))
+    return buffer.getvalue()
+
+def get_sendgrid_client() -> SendGridAPIClient:
+    """Create a SendGrid API client from the SENDGRID_API_KEY env variable"""
+    return SendGridAPIClient(os.environ.get("SENDGRID_API_KEY"), host=constants.SENDGRID_HOST)
+
+class SendGridSession:
+    """
+    Sends mail through SendGrid's v3 API over a pooled keep-alive HTTP session.
+
+    `SendGridAPIClient` opens a new connection for every request, paying the TCP + TLS
+    handshake each time. This keeps up to `pool_size` connections alive instead, so
+    concurrent bulk sends reuse them.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None,
+        host: str = constants.SENDGRID_HOST,
+        pool_size: int = constants.EMAIL_MAX_WORKERS,
+        connect_timeout: float = constants.SENDGRID_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = constants.SENDGRID_READ_TIMEOUT_SECONDS,
+    ):
+        self.api_url = f"{host.rstrip('/')}/v3/mail/send"
+        self._timeout = (connect_timeout, read_timeout)
+        self._session = requests.Session()
+        self._session.headers.update({"Authorization": f"Bearer {api_key}"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def send(self, message: Mail) -> requests.Response:
+        """
+        Send a message.
+
+        Raises:
+            requests.HTTPError: If SendGrid answers with an error status
+        """
+        response = self._session.post(self.api_url, json=message.get(), timeout=self._timeout)
+        response.raise_for_status()
+        return response
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self._session.close()
 
 def build_and_send_email(
     *, email_address: str, summaries: list[constants.Summary], summary_type: constants.SummaryType
 ):
     """Use Sendgrid's API Client to send an email"""
-    sender_email = "danny.vu@cloverhealth.com"
-    subject = f"{summary_type.value.capitalize()} Summaries | Date: {datetime.now().strftime('%Y-%m-%d')}"
-    body_html = "<p>Hi everyone!</p><p>Here are AI generated summaries of recent documents to review:</p>"
-    body_html += "<hr>"
-
-    for summary in summaries:
-        body_html += f'<h3>{summary.title}</h3>'
-        body_html += f'<p><em>Published: {summary.date_published}</em></p>'
-        if summary.content:
-            body_html += "<p>" + summary.content + "</p>"
-        body_html += f'<p>Click <a href="https://docs.google.com/document/d/{summary.document_id}">here</a> to read.</p>'
-        body_html += "<hr>"
-
-    body_html += '<p>If a summary was sent. It will not be sent again. </p>'
-    body_html += '<p>See <a href="https://cloverhealth.atlassian.net/wiki/x/CACt0Q">previously sent TDDs</a>'
-    body_html += ' | <a href="https://cloverhealth.atlassian.net/wiki/x/kADt0w">previously sent PRDs</a>'
-    body_html += ' | <a href="https://cloverhealth.atlassian.net/wiki/x/cIDs0w">previously sent Biweekly Summaries</a></p>'
-    body_html += "<p>Also, enjoy this randomly generated joke:</p>"
-    body_html += f"<p>{pyjokes.get_joke(language='en', category='neutral')}</p>"
-
     message = Mail(
-        from_email=sender_email,
+        from_email=SENDER_EMAIL,
         to_emails=email_address,
-        subject=subject,
-        html_content=body_html,
+        subject=build_subject(summary_type),
+        html_content=build_email_html(summaries),
     )
     try:
-        sg = SendGridAPIClient(os.environ.get("SENDGRID_API_KEY"))
+        sg = get_sendgrid_client()
         response = sg.send(message)
         print(response.status_code)
         print(response.body)
@@ -52,3 +138,72 @@ def build_and_send_email(
     except Exception as e:
         print(f"Error sending email! Error: {e}")
         raise e
+
+def send_bulk_email(
+    *,
+    email_addresses: list[str],
+    summaries: list[constants.Summary],
+    summary_type: constants.SummaryType,
+    recipients_per_request: int = constants.SENDGRID_MAX_PERSONALIZATIONS,
+    max_workers: int = constants.EMAIL_MAX_WORKERS,
+    on_results: Callable[[list[constants.EmailResult]], None] | None = None,
+) -> list[constants.EmailResult]:
+    """
+    Send the same summary email to many recipients.
+
+    The body is rendered once and every request goes through one `SendGridSession`, with up to
+    `max_workers` requests in flight on its keep-alive connections. Each request carries up to `recipients_per_request`
+    recipients as separate personalizations, so every recipient only sees their own address.
+    A failed request doesn't stop the others.
+
+    Args:
+        email_addresses: Recipients, each sent their own email
+        summaries: Summaries included in the email
+        summary_type: Type of the summaries, used in the subject
+        recipients_per_request: Recipients packed into a single SendGrid request
+        max_workers: Number of requests sent concurrently
+        on_results: Called with the outcome of each request as soon as it completes, from the
+            thread that sent it
+
+    Returns:
+        list[constants.EmailResult]: The outcome for each recipient, in the order of `email_addresses`
+    """
+    subject = build_subject(summary_type)
+    body_html = build_email_html(summaries)
+    sg = SendGridSession(os.environ.get("SENDGRID_API_KEY"), host=constants.SENDGRID_HOST, pool_size=max_workers)
+
+    def _send_request(batch: list[str]) -> list[constants.EmailResult]:
+        message = Mail(
+            from_email=SENDER_EMAIL,
+            to_emails=batch,
+            subject=subject,
+            html_content=body_html,
+            is_multiple=True,
+        )
+        try:
+            response = sg.send(message)
+        except Exception as e:
+            print(f"Error sending email to {len(batch)} recipients starting with {batch[0]}! Error: {e}")
+            return [constants.EmailResult(email_address=email_address, error=e) for email_address in batch]
+        print(f"Sent email to {len(batch)} recipients starting with {batch[0]}: {response.status_code}")
+        message_id = response.headers.get("X-Message-Id")
+        return [
+            constants.EmailResult(email_address=email_address, status_code=response.status_code, message_id=message_id)
+            for email_address in batch
+        ]
+
+    def _send(batch: list[str]) -> list[constants.EmailResult]:
+        results = _send_request(batch)
+        if on_results:
+            on_results(results)
+        return results
+
+    batches = [
+        email_addresses[start:start + recipients_per_request]
+        for start in range(0, len(email_addresses), recipients_per_request)
+    ]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return [result for batch_results in executor.map(_send, batches) for result in batch_results]
+    finally:
+        sg.close()
@@ -1,11 +1,15 @@
 """Google Doc Wrapper"""
 
+import json
 import logging
+from typing import Iterator
 
 from google import auth
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 
+from gdoc_summaries.libs import constants
+
 LOGGER = logging.getLogger(__name__)
 
 # This script needs scope access to the Docs and Drive and Email APIs
@@ -14,6 +18,32 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive.metadata.readonly",
 ]
 
+# Levels of nested tables and child tabs spelled out in the partial response mask; deeper
+# levels are returned in full, since a field mask can't express recursion
+_MASK_NESTING_DEPTH = 2
+
+
+def _content_fields(depth: int) -> str:
+    """Mask of the structural elements text is extracted from"""
+    if depth == 0:
+        return "content"
+    nested = _content_fields(depth - 1)
+    return (
+        "content(paragraph(elements(textRun(content))),"
+        f"table(tableRows(tableCells({nested}))),tableOfContents({nested}))"
+    )
+
+
+def _tab_fields(depth: int) -> str:
+    """Mask of a tab's body and its child tabs"""
+    child_tabs = "childTabs" if depth == 0 else f"childTabs({_tab_fields(depth - 1)})"
+    return f"documentTab(body({_content_fields(_MASK_NESTING_DEPTH)})),{child_tabs}"
+
+
+# Partial response mask with only what summarization reads, so the API doesn't send styles,
+# lists, inline objects and named ranges. Pass `fields=None` to get the full document.
+DOCUMENT_TEXT_FIELDS = f"documentId,title,revisionId,tabs({_tab_fields(_MASK_NESTING_DEPTH)})"
+
 
 def get_credentials(creds_path: str, scopes: list[str]) -> Credentials:
     """Get Google API Credentials"""
@@ -26,10 +56,19 @@ def get_credentials(creds_path: str, scopes: list[str]) -> Credentials:
 
     return creds
 
-def get_document_from_id(service, document_id) -> dict:
-    """Gets the content and metadata of a Google Doc."""
+def _get_document_request(service, document_id: str, fields: str | None):
+    """
+    Build a Docs `documents.get` request of every tab's content, with a partial response
+    mask unless `fields` is None
+    """
+    if fields is None:
+        return service.documents().get(documentId=document_id, includeTabsContent=True)
+    return service.documents().get(documentId=document_id, includeTabsContent=True, fields=fields)
+
+def get_document_from_id(service, document_id, fields: str | None = DOCUMENT_TEXT_FIELDS) -> dict:
+    """Gets the content and metadata of a Google Doc, limited to `fields` unless it is None."""
     try:
-        document = service.documents().get(documentId=document_id).execute()
+        document = _get_document_request(service, document_id, fields).execute()
         print(f"Retrieved Document: {document.get('title')}")
         return document
 
@@ -37,21 +76,161 @@ def get_document_from_id(service, document_id) -> dict:
         print(f"An error occurred: {e}")
         raise e
 
-def extract_document_content(document: dict) -> str:
+def _undecoded_response(resp, content: bytes | str) -> bytes | str:
+    """Response post-processor that leaves the body as JSON text, for decoding elsewhere"""
+    return content
+
+def get_documents_from_ids(
+    service,
+    document_ids: list[str],
+    batch_size: int = constants.DOCS_BATCH_SIZE,
+    fields: str | None = DOCUMENT_TEXT_FIELDS,
+    decode: bool = True,
+) -> tuple[dict[str, dict], dict[str, Exception]]:
+    """
+    Gets many Google Docs using batched requests.
+
+    Args:
+        service: A Docs v1 service
+        document_ids: IDs of the documents to get
+        batch_size: Number of documents requested in a single batch request
+        fields: Partial response mask of each document, or None for the full document
+        decode: Whether to decode the documents, rather than return their JSON text so it
+            can be decoded in another process with `read_document`
+
+    Returns:
+        tuple[dict[str, dict], dict[str, Exception]]: Documents by ID, as JSON text unless
+            decoded, and the error of each document that could not be retrieved
+    """
+    documents = {}
+    errors = {}
+
+    def _callback(request_id, response, exception):
+        if exception:
+            print(f"An error occurred retrieving {request_id}: {exception}")
+            errors[request_id] = exception
+            return
+        if decode:
+            print(f"Retrieved Document: {response.get('title')}")
+        else:
+            print(f"Retrieved Document: {request_id}")
+        documents[request_id] = response
+
+    unique_ids = list(dict.fromkeys(document_ids))
+    for start in range(0, len(unique_ids), batch_size):
+        batch = service.new_batch_http_request(callback=_callback)
+        for document_id in unique_ids[start:start + batch_size]:
+            request = _get_document_request(service, document_id, fields)
+            if not decode:
+                request.postproc = _undecoded_response
+            batch.add(request, request_id=document_id)
+        batch.execute()
+
+    return documents, errors
+
+def get_revision_metadata(
+    drive_service, document_ids: list[str], batch_size: int = constants.DRIVE_BATCH_SIZE
+) -> dict[str, constants.DocumentRevision]:
+    """
+    Get the Drive revision metadata of many documents using batched metadata requests.
+
+    Args:
+        drive_service: A Drive v3 service
+        document_ids: IDs of the documents to look up
+        batch_size: Number of lookups sent in a single batch request
+
+    Returns:
+        dict[str, constants.DocumentRevision]: Revision metadata by document ID.
+            Documents whose lookup failed are left out, so callers treat them as changed.
+    """
+    revisions = {}
+
+    def _callback(request_id, response, exception):
+        if exception:
+            print(f"Could not get revision metadata for {request_id}: {exception}")
+            return
+        revisions[request_id] = constants.DocumentRevision(
+            document_id=request_id,
+            modified_time=response.get("modifiedTime"),
+            head_revision_id=response.get("headRevisionId"),
+        )
+
+    unique_ids = list(dict.fromkeys(document_ids))
+    for start in range(0, len(unique_ids), batch_size):
+        batch = drive_service.new_batch_http_request(callback=_callback)
+        for document_id in unique_ids[start:start + batch_size]:
+            batch.add(
+                drive_service.files().get(
+                    fileId=document_id,
+                    fields="id,modifiedTime,headRevisionId",
+                    supportsAllDrives=True,
+                ),
+                request_id=document_id,
+            )
+        batch.execute()
+
+    return revisions
+
+def _iter_tabs(tabs: list[dict]) -> Iterator[dict]:
+    """Yield each tab followed by its child tabs, in the order they appear in the document"""
+    for tab in tabs:
+        yield tab
+        yield from _iter_tabs(tab.get("childTabs", []))
+
+def _iter_content_text(content: list[dict], include_table_of_contents: bool) -> Iterator[str]:
+    """Yield the text runs of a list of structural elements, descending into tables"""
+    for element in content:
+        if "paragraph" in element:
+            for item in element["paragraph"].get("elements", []):
+                if "textRun" in item:
+                    yield item["textRun"].get("content", "")
+        elif "table" in element:
+            for row in element["table"].get("tableRows", []):
+                for cell in row.get("tableCells", []):
+                    yield from _iter_content_text(cell.get("content", []), include_table_of_contents)
+        elif "tableOfContents" in element and include_table_of_contents:
+            yield from _iter_content_text(element["tableOfContents"].get("content", []), include_table_of_contents)
+
+def iter_document_text(document: dict, include_table_of_contents: bool = True) -> Iterator[str]:
+    """
+    Yield the plain text of a Google Doc run by run, in reading order.
+
+    Walks the document tree once, including table cells and every tab, so callers can stop
+    as soon as they have read enough without building the whole text.
+
+    Args:
+        document: The Google Doc document dictionary, with or without tabs content
+        include_table_of_contents: Whether to yield the text of tables of contents, which
+            repeats the document's headings
+
+    Yields:
+        str: The content of each text run
+    """
+    if "tabs" in document:
+        for tab in _iter_tabs(document["tabs"]):
+            body = tab.get("documentTab", {}).get("body", {})
+            yield from _iter_content_text(body.get("content", []), include_table_of_contents)
+    else:
+        yield from _iter_content_text(document.get("body", {}).get("content", []), include_table_of_contents)
+
+def extract_document_content(document: dict, include_table_of_contents: bool = True) -> str:
     """
     Extract plain text content from a Google Doc document structure.
     
     Args:
         document: The Google Doc document dictionary
+        include_table_of_contents: Whether to include the text of tables of contents
         
     Returns:
         str: Plain text content of the document
     """
-    content = []
-    for element in document.get("body", {}).get("content", []):
-        if "paragraph" in element:
-            for item in element["paragraph"].get("elements", []):
-                if "textRun" in item:
-                    content.append(item["textRun"].get("content", ""))
-    
-    return "".join(content)
+    return "".join(iter_document_text(document, include_table_of_contents))
+
+def read_document(response: bytes | str, include_table_of_contents: bool = True) -> tuple[str, str]:
+    """
+    Decode a Docs response fetched with `decode=False`, and extract its title and plain text.
+
+    Takes and returns only text, so it can run in a `cpu_pool` process.
+    """
+    document = json.loads(response)
+    return document.get("title", ""), extract_document_content(document, include_table_of_contents)
@@ -1,46 +1,207 @@
 """LLM Based tooling"""
 
+import hashlib
+import json
 import logging
-import time
-from functools import wraps
-from typing import Callable
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import markdown
-import requests
-from azure.identity import DefaultAzureCredential
 
-from gdoc_summaries.libs import constants
+from gdoc_summaries.libs import constants, cpu_pool, db, llm_client
 
 LOGGER = logging.getLogger(__name__)
 
+TLDR_PROMPT = (
+    "Create a single sentence TLDR that captures the most important aspects "
+    "of this summary. Keep it concise but informative. The summary is:\n"
+)
+
+SUMMARY_PROMPT = (
+    "As a professional summarizer, create a concise "
+    "summary of the provided text while adhering to these guidelines:\n"
+    "Craft a summary that is detailed, thorough, in-depth, and complex, "
+    "while maintaining clarity and conciseness.\n"
+    "Incorporate main ideas and essential information, eliminating extraneous "
+    "language and focusing on critical aspects.\n"
+    "Rely strictly on the provided text, without including external information.\n"
+    "Utilize markdown to cleanly format your output. Do not use any header markdowns. " 
+    "Only use Bold or Italics for key subject matters that require emphasis.\n"
+    "Content is as follows:\n"
+)
+
+SUMMARY_WITH_TLDR_PROMPT = (
+    SUMMARY_PROMPT.removesuffix("Content is as follows:\n")
+    + "Respond only with a JSON object with two string fields, without a code block:\n"
+    "\"tldr\": a single sentence TLDR that captures the most important aspects of the summary, "
+    "concise but informative.\n"
+    "\"summary\": the summary itself, formatted as described above.\n"
+    "Content is as follows:\n"
+)
+
+CHUNK_SUMMARY_PROMPT = (
+    "The following text is part {part} of {parts} of a longer document. "
+    "Summarize it thoroughly, keeping every decision, requirement, number and open question, "
+    "so the parts can later be merged into one summary of the whole document. "
+    "Rely strictly on the provided text, without including external information. "
+    "Utilize markdown for emphasis only, without headers.\n"
+    "Content is as follows:\n"
+)
+
+MERGE_SUMMARY_PROMPT = (
+    "The following are summaries of consecutive parts of one longer document. "
+    "Merge them into a single summary that keeps every decision, requirement, number and "
+    "open question, removing repetition between parts. "
+    "Utilize markdown for emphasis only, without headers.\n"
+    "Summaries are as follows:\n"
+)
+
+# Structural boundaries to split on, from coarsest to finest
+_CHUNK_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+_CACHE_STATS = {"hits": 0, "misses": 0}
+_CACHE_STATS_LOCK = threading.Lock()
+
+
+def get_cache_stats() -> dict[str, int]:
+    """Get the number of summary cache hits and misses in this process"""
+    with _CACHE_STATS_LOCK:
+        return dict(_CACHE_STATS)
+
+
+def _record_cache_lookup(hit: bool) -> None:
+    with _CACHE_STATS_LOCK:
+        _CACHE_STATS["hits" if hit else "misses"] += 1
+
+
+def _summary_cache_key(content: str) -> str:
+    """
+    Hash everything that determines a summary: the normalized text, the prompts, the
+    map-reduce chunking settings and the model.
+
+    Whitespace is collapsed so re-extracting the same document text gives the same key.
+    """
+    normalized = " ".join(content.split())
+    key_parts = [
+        normalized,
+        SUMMARY_WITH_TLDR_PROMPT,
+        SUMMARY_PROMPT,
+        TLDR_PROMPT,
+        CHUNK_SUMMARY_PROMPT,
+        MERGE_SUMMARY_PROMPT,
+        str(constants.LLM_MAX_INPUT_TOKENS),
+        str(constants.LLM_CHUNK_TOKENS),
+        str(constants.LLM_CHUNK_SUMMARY_MAX_TOKENS),
+        constants.AZURE_API_BASE,
+        constants.AZURE_MODEL_ENGINE,
+        constants.AZURE_API_VERSION,
+    ]
+    return hashlib.sha256("\0".join(key_parts).encode("utf-8")).hexdigest()
+
+
+def generate_llm_summary(content: str) -> str:
+    """
+    Generate a summary using Azure OpenAI, reusing a cached summary of identical content.
+    
+    Args:
+        content: The text content to summarize
+        
+    Returns:
+        str: HTML formatted summary with TLDR
+    """
+    if not content.strip():
+        raise ValueError("No content provided to summarize")
+
+    max_age_seconds = constants.LLM_CACHE_MAX_AGE_DAYS * 24 * 60 * 60
+    cache_key = _summary_cache_key(content)
+    cached_summary = db.get_cached_llm_response(cache_key, max_age_seconds=max_age_seconds)
+    _record_cache_lookup(hit=cached_summary is not None)
+    if cached_summary is not None:
+        print("Using cached LLM Summary")
+        return cached_summary
+
+    html_content = _generate_llm_summary(content)
+    db.save_cached_llm_response(cache_key, html_content)
+    db.evict_llm_cache(max_entries=constants.LLM_CACHE_MAX_ENTRIES, max_age_seconds=max_age_seconds)
+    return html_content
+
+
+def generate_llm_summaries(contents: list[str]) -> list[str]:
+    """
+    Generate summaries of many texts concurrently, like `generate_llm_summary`.
+
+    If any summary fails, the first error is raised once the others finish; the ones that
+    succeeded are cached, so retrying only pays for the failures.
+
+    Args:
+        contents: The text contents to summarize
+
+    Returns:
+        list[str]: HTML formatted summaries with TLDR, in the order of `contents`
+    """
+    with ThreadPoolExecutor(max_workers=constants.LLM_MAX_CONCURRENCY) as executor:
+        futures = [executor.submit(generate_llm_summary, content) for content in contents]
+    return [future.result() for future in futures]
+
+
+def _estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text"""
+    return len(text) // constants.CHARS_PER_TOKEN + 1
+
+
+def _split_into_chunks(text: str, max_tokens: int, separators: list[str] = _CHUNK_SEPARATORS) -> list[str]:
+    """
+    Split text into chunks of at most `max_tokens`, preferring structural boundaries.
+
+    Paragraphs are kept whole where possible; a paragraph that is too large on its own is
+    split on lines, then sentences, then words, and only cut mid-word as a last resort.
+    """
+    if _estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    if not separators:
+        max_chars = max_tokens * constants.CHARS_PER_TOKEN
+        return [text[start:start + max_chars] for start in range(0, len(text), max_chars)]
+
+    separator, finer_separators = separators[0], separators[1:]
+    chunks = []
+    current = ""
+    for piece in text.split(separator):
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if _estimate_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        if _estimate_tokens(piece) <= max_tokens:
+            current = piece
+        else:
+            chunks.extend(_split_into_chunks(piece, max_tokens, finer_separators))
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _chat_completion(prompt: str, max_tokens: int) -> str:
+    """
+    Send a single-message chat completion request to Azure OpenAI.
+
+    Retries and rate limiting are handled by the shared client.
+
+    Args:
+        prompt: The user message
+        max_tokens: Maximum number of tokens in the response
+
+    Returns:
+        str: The text of the response
+    """
+    return llm_client.get_client().chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+    )
+
 
-def retry_with_backoff(retries: int, backoff_in_seconds: list[int]) -> Callable:
-    """
-    Retry decorator with specified backoff times
-    """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for i in range(retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    # Don't retry if it's a context length error
-                    if "context_length_exceeded" in str(e):
-                        raise e
-                    
-                    if i == retries:  # Last attempt
-                        raise e
-                    wait_time = backoff_in_seconds[i]
-                    print("There was an error:", e)
-                    print(f"Attempt {i + 1} failed. Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-            return None  # Should never reach here
-        return wrapper
-    return decorator
-
-
-@retry_with_backoff(retries=2, backoff_in_seconds=[35, 65])
 def _generate_tldr(summary: str) -> str:
     """
     Generate a one-sentence TLDR from a summary using Azure OpenAI.
@@ -52,41 +213,101 @@ def _generate_tldr(summary: str) -> str:
         str: One sentence TLDR
     """
     print("Generating TLDR")
-    
-    prompt = (
-        "Create a single sentence TLDR that captures the most important aspects "
-        "of this summary. Keep it concise but informative. The summary is:\n"
-        + summary
-    )
+    tldr = _chat_completion(TLDR_PROMPT + summary, max_tokens=100)
+    print("Generated TLDR")
+    return tldr
 
-    data = {
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 100
-    }
 
-    credential = DefaultAzureCredential()
-    token = credential.get_token("https://cognitiveservices.azure.com/.default").token
+def _summarize_chunks(content: str, max_tokens: int) -> str:
+    """
+    Map-reduce summarization of content that does not fit in a single request.
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
+    The content is split into chunks of at most `max_tokens` that are summarized concurrently.
+    The partial summaries are then merged in groups that fit the same budget, level by level,
+    until they fit in one request. Latency grows with the depth of that tree, not the size.
 
-    api_url = f"{constants.AZURE_API_BASE}/openai/deployments/{constants.AZURE_MODEL_ENGINE}/chat/completions?api-version={constants.AZURE_API_VERSION}"
-    response = requests.post(api_url, headers=headers, json=data)
+    Returns:
+        str: Text small enough to summarize in a single request
+    """
+    chunks = _split_into_chunks(content, max_tokens)
+    print(f"Summarizing {len(chunks)} chunks")
 
-    if response.status_code == 200:
-        print("Generated TLDR")
-        return response.json()["choices"][0]["message"]["content"].strip()
-    else:
-        print(f"Error in TLDR request: {response.status_code}, {response.text}")
-        raise RuntimeError(f"Error in TLDR request: {response.status_code}, {response.text}")
+    def summarize_part(part: int) -> str:
+        prompt = CHUNK_SUMMARY_PROMPT.format(part=part + 1, parts=len(chunks)) + chunks[part]
+        return _chat_completion(prompt, max_tokens=constants.LLM_CHUNK_SUMMARY_MAX_TOKENS)
 
+    def merge_group(group: str) -> str:
+        return _chat_completion(MERGE_SUMMARY_PROMPT + group, max_tokens=constants.LLM_CHUNK_SUMMARY_MAX_TOKENS)
 
-@retry_with_backoff(retries=2, backoff_in_seconds=[35, 65])
-def generate_llm_summary(content: str) -> str:
+    with ThreadPoolExecutor(max_workers=constants.LLM_MAX_CONCURRENCY) as executor:
+        partial_summaries = list(executor.map(summarize_part, range(len(chunks))))
+        combined = "\n\n".join(partial_summaries)
+        while _estimate_tokens(combined) > max_tokens:
+            groups = _split_into_chunks(combined, max_tokens, separators=["\n\n"])
+            print(f"Merging {len(partial_summaries)} partial summaries into {len(groups)}")
+            partial_summaries = list(executor.map(merge_group, groups))
+            combined = "\n\n".join(partial_summaries)
+    return combined
+
+
+def _parse_summary_with_tldr(response: str) -> tuple[str, str] | None:
+    """
+    Parse the JSON answer to SUMMARY_WITH_TLDR_PROMPT.
+
+    Returns:
+        tuple[str, str] | None: The TLDR and markdown summary, or None if the answer is unusable
+    """
+    text = response.strip()
+    # Models sometimes wrap JSON in a markdown code fence despite being told not to
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+
+    tldr, summary = parsed.get("tldr"), parsed.get("summary")
+    if not isinstance(tldr, str) or not isinstance(summary, str) or not tldr.strip() or not summary.strip():
+        return None
+    return tldr.strip(), summary.strip()
+
+
+def _summarize_with_tldr(text: str) -> tuple[str, str]:
+    """
+    Get the TLDR and markdown summary of text that fits in one request, from one completion.
+
+    Falls back to separate summary and TLDR requests if the answer can't be parsed.
+    """
+    response = _chat_completion(SUMMARY_WITH_TLDR_PROMPT + text, max_tokens=650)
+    parsed = _parse_summary_with_tldr(response)
+    if parsed:
+        return parsed
+
+    print("Could not parse the summary and TLDR, requesting them separately")
+    markdown_content = _chat_completion(SUMMARY_PROMPT + text, max_tokens=500)
+    return _generate_tldr(markdown_content), markdown_content
+
+
+def _summarize(content: str) -> tuple[str, str]:
+    """Get the TLDR and markdown summary of content of any size, chunking it when it is too large"""
+    max_tokens = constants.LLM_MAX_INPUT_TOKENS
+    if _estimate_tokens(content) <= max_tokens:
+        try:
+            return _summarize_with_tldr(content)
+        except RuntimeError as e:
+            if "context_length_exceeded" not in str(e):
+                raise
+            # Our estimate was too optimistic for this text; chunk well below it
+            max_tokens = _estimate_tokens(content) // 2
+            print("Content exceeded the context window, summarizing it in chunks")
+
+    max_tokens = min(max_tokens, constants.LLM_CHUNK_TOKENS)
+    return _summarize_with_tldr(_summarize_chunks(content, max_tokens))
+
+
+def _generate_llm_summary(content: str) -> str:
     """
     Generate a summary using Azure OpenAI.
     
@@ -97,58 +318,11 @@ def generate_llm_summary(content: str) -> str:
         str: HTML formatted summary with TLDR
     """
     print("Generating LLM Summary")
-    if not content.strip():
-        raise ValueError("No content provided to summarize")
+    tldr, markdown_content = _summarize(content)
+    print("Generated LLM Summary")
 
-    # Generate main summary first
-    prompt = (
-        "As a professional summarizer, create a concise "
-        "summary of the provided text while adhering to these guidelines:\n"
-        "Craft a summary that is detailed, thorough, in-depth, and complex, "
-        "while maintaining clarity and conciseness.\n"
-        "Incorporate main ideas and essential information, eliminating extraneous "
-        "language and focusing on critical aspects.\n"
-        "Rely strictly on the provided text, without including external information.\n"
-        "Utilize markdown to cleanly format your output. Do not use any header markdowns. " 
-        "Only use Bold or Italics for key subject matters that require emphasis.\n"
-        "Content is as follows:\n"
-        + content
-    )
+    # Combine TLDR and summary
+    full_content = f"**TLDR:** {tldr}\n\n **Full Summary:** {markdown_content}"
 
-    # Prepare the prompt data for the ChatGPT model
-    data = {
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 500
-    }
-
-    # Fetch token using Azure credential
-    credential = DefaultAzureCredential()
-    token = credential.get_token("https://cognitiveservices.azure.com/.default").token
-
-    # Set headers for the Azure API request
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
-
-    # Make request to Azure OpenAI using the correct API format
-    api_url = f"{constants.AZURE_API_BASE}/openai/deployments/{constants.AZURE_MODEL_ENGINE}/chat/completions?api-version={constants.AZURE_API_VERSION}"
-    response = requests.post(api_url, headers=headers, json=data)
-
-    if response.status_code == 200:
-        print("Generated LLM Summary")
-        markdown_content = response.json()["choices"][0]["message"]["content"].strip()
-        
-        # Generate TLDR from the summary
-        tldr = _generate_tldr(markdown_content)
-        
-        # Combine TLDR and summary
-        full_content = f"**TLDR:** {tldr}\n\n **Full Summary:** {markdown_content}"
-        
-        html_content = markdown.markdown(full_content)
-        return html_content
-    else:
-        print(f"Error in LLM request: {response.status_code}, {response.text}")
-        raise RuntimeError(f"Error in LLM request: {response.status_code}, {response.text}")
+    html_content = cpu_pool.submit(markdown.markdown, full_content).result()
+    return html_content
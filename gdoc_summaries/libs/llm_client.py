@@ -0,0 +1,319 @@
+"""Azure OpenAI client
+
+Owns the transport side of LLM calls: a cached bearer token shared by the whole process,
+a pooled keep-alive HTTP session, so each completion skips credential lookup and the
+TCP + TLS handshake to the Azure endpoint, and a shared rate limiter that paces requests
+by the budget Azure reports in its response headers.
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+from azure.identity import DefaultAzureCredential
+from requests.adapters import HTTPAdapter
+
+from gdoc_summaries.libs import constants
+
+LOGGER = logging.getLogger(__name__)
+
+_TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+
+class _TokenProvider:
+    """
+    Process-wide, thread-safe cache of the Azure bearer token.
+
+    Walking the DefaultAzureCredential chain can shell out to the az CLI, so it happens once
+    per token rather than once per request. Within `refresh_margin` seconds of expiry the
+    token is refreshed on a background thread while callers keep using the current one; a
+    caller only blocks on a refresh when the token is missing or about to expire.
+    """
+
+    def __init__(self, scope: str, refresh_margin: float = 300, min_validity: float = 60):
+        self._scope = scope
+        self._refresh_margin = refresh_margin
+        self._min_validity = min_validity
+        self._credential = None
+        self._access_token = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def get_token(self) -> str:
+        """Get a bearer token valid for at least `min_validity` seconds"""
+        access_token = self._access_token
+        remaining = access_token.expires_on - time.time() if access_token else 0
+        if remaining > self._refresh_margin:
+            return access_token.token
+        if remaining > self._min_validity:
+            self._refresh_in_background()
+            return access_token.token
+
+        with self._lock:
+            access_token = self._access_token
+            if not access_token or access_token.expires_on - time.time() <= self._min_validity:
+                access_token = self._fetch_token()
+                self._access_token = access_token
+            return access_token.token
+
+    def _fetch_token(self):
+        if self._credential is None:
+            self._credential = DefaultAzureCredential()
+        print("Fetching Azure access token")
+        return self._credential.get_token(self._scope)
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh(self) -> None:
+        try:
+            access_token = self._fetch_token()
+        except Exception as e:
+            # The current token is still valid; the next caller retries the refresh
+            LOGGER.warning(f"Background refresh of the Azure access token failed: {e}")
+            return
+        with self._lock:
+            self._access_token = access_token
+
+
+_TOKEN_PROVIDER = _TokenProvider(_TOKEN_SCOPE)
+
+
+# Throttling, timeouts and transient server errors; anything else will fail again
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMRequestError(RuntimeError):
+    """Azure OpenAI answered a completion request with an error status"""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Error in LLM request: {status_code}, {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def _retry_after_seconds(headers) -> float | None:
+    """How long the response asks us to wait, from retry-after-ms or Retry-After"""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _header_int(headers, name: str) -> int | None:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """
+    Shared, thread-safe view of the deployment's per-minute request and token budget.
+
+    Azure reports what is left of the current minute in the x-ratelimit-remaining-requests and
+    x-ratelimit-remaining-tokens headers, and asks for a pause with Retry-After on 429s.
+    `acquire` only makes a caller wait while that budget is used up or a pause is in effect,
+    so requests keep flowing at full speed until the deployment is actually saturated.
+    """
+
+    def __init__(self, window_seconds: float = 60, clock=time.monotonic, sleep=time.sleep):
+        self._window_seconds = window_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._remaining_requests = None
+        self._remaining_tokens = None
+        self._observed_at = 0.0
+        self._paused_until = 0.0
+
+    def acquire(self, estimated_tokens: int) -> None:
+        """Wait until a request of `estimated_tokens` fits in the budget, then reserve it"""
+        while True:
+            with self._lock:
+                delay = self._delay(estimated_tokens)
+                if delay <= 0:
+                    if self._remaining_requests is not None:
+                        self._remaining_requests -= 1
+                    if self._remaining_tokens is not None:
+                        self._remaining_tokens -= estimated_tokens
+                    return
+            print(f"Rate limit reached, waiting {delay:.1f} seconds")
+            self._sleep(delay)
+
+    def _delay(self, estimated_tokens: int) -> float:
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        exhausted = (
+            (self._remaining_requests is not None and self._remaining_requests <= 0)
+            or (self._remaining_tokens is not None and self._remaining_tokens < estimated_tokens)
+        )
+        if not exhausted:
+            return 0
+        window_resets_in = self._observed_at + self._window_seconds - now
+        if window_resets_in <= 0:
+            # The window the headers described is over; wait for fresh headers
+            self._remaining_requests = None
+            self._remaining_tokens = None
+            return 0
+        return window_resets_in
+
+    def update(self, headers) -> None:
+        """Record the remaining budget reported by a response"""
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is None and remaining_tokens is None:
+            return
+        with self._lock:
+            self._remaining_requests = remaining_requests
+            self._remaining_tokens = remaining_tokens
+            self._observed_at = self._clock()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`, e.g. after a 429 with Retry-After"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+_RATE_LIMITER = RateLimiter()
+
+
+class AzureOpenAIClient:
+    """
+    Chat completion client for one Azure OpenAI deployment.
+
+    All requests share one `requests.Session` whose connection pool keeps up to `pool_size`
+    connections alive, so concurrent workers reuse connections instead of reconnecting.
+    Retryable failures are retried up to `max_retries` times, waiting as long as the response
+    asks or with jittered exponential backoff; only the failing request waits, other threads
+    keep going unless the shared rate limiter says the deployment is saturated.
+    """
+
+    def __init__(
+        self,
+        api_base: str = constants.AZURE_API_BASE,
+        deployment: str = constants.AZURE_MODEL_ENGINE,
+        api_version: str = constants.AZURE_API_VERSION,
+        pool_size: int = constants.LLM_HTTP_POOL_SIZE,
+        connect_timeout: float = constants.LLM_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = constants.LLM_READ_TIMEOUT_SECONDS,
+        max_retries: int = constants.LLM_MAX_RETRIES,
+        backoff_base: float = constants.LLM_BACKOFF_BASE_SECONDS,
+        backoff_max: float = constants.LLM_BACKOFF_MAX_SECONDS,
+        token_provider=_TOKEN_PROVIDER,
+        rate_limiter: RateLimiter = _RATE_LIMITER,
+    ):
+        self.api_url = (
+            f"{api_base.rstrip('/')}/openai/deployments/{deployment}/chat/completions"
+            f"?api-version={api_version}"
+        )
+        self._timeout = (connect_timeout, read_timeout)
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._token_provider = token_provider
+        self._rate_limiter = rate_limiter
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def chat_completion(self, messages: list[dict], max_tokens: int) -> str:
+        """
+        Request a chat completion.
+
+        Args:
+            messages: Chat messages to send
+            max_tokens: Maximum number of tokens in the response
+
+        Returns:
+            str: The text of the first choice
+
+        Raises:
+            LLMRequestError: If the API answers with a non-retryable error, or retries run out
+        """
+        data = {"messages": messages, "max_tokens": max_tokens}
+        prompt_chars = sum(len(message["content"]) for message in messages)
+        estimated_tokens = prompt_chars // constants.CHARS_PER_TOKEN + max_tokens
+
+        for attempt in range(self._max_retries + 1):
+            self._rate_limiter.acquire(estimated_tokens)
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self._token_provider.get_token()}"
+            }
+            try:
+                response = self._session.post(self.api_url, headers=headers, json=data, timeout=self._timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self._max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"LLM request failed: {e}. Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+                continue
+
+            self._rate_limiter.update(response.headers)
+            if response.status_code == 200:
+                return response.json()["choices"][0]["message"]["content"].strip()
+
+            print(f"Error in LLM request: {response.status_code}, {response.text}")
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self._max_retries:
+                raise LLMRequestError(response.status_code, response.text)
+
+            retry_after = _retry_after_seconds(response.headers)
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            print(f"Attempt {attempt + 1} failed. Retrying in {delay:.1f} seconds...")
+            if response.status_code == 429:
+                # Throttling applies to the whole deployment, so every caller waits it out
+                self._rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+        return None  # Should never reach here
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter, so concurrent retries don't land together"""
+        delay = min(self._backoff_max, self._backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self._session.close()
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> AzureOpenAIClient:
+    """Get the process-wide client for the configured deployment, creating it on first use"""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = AzureOpenAIClient()
+        return _CLIENT
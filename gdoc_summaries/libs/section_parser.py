@@ -1,50 +1,179 @@
 """Parser for biweekly document sections"""
 
+import itertools
+import json
 import re
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Iterator, Optional
 
 from gdoc_summaries.libs import constants, gdoc_client
 
+# Sections are delimited by "--- UPDATE YYYY-MM-DD ---" headers. ISO dates sort correctly as
+# strings, so headers are only parsed as dates once their section is actually returned.
+_SECTION_DELIMITER = re.compile(r"---\s*UPDATE\s+(\d{4}-\d{2}-\d{2})\s*---\s*")
+
+# Text runs are searched for delimiters a few thousand characters at a time, which costs about
+# as much as joining the whole text, while reading only that far past the last section needed
+_READ_CHUNK_CHARS = 4096
+
+
+def _unfinished_delimiter_start(text: str, start: int) -> int:
+    """
+    Find where a delimiter cut off at the end of `text` could start, so the next search
+    doesn't scan the text before it again.
+
+    A delimiter only contains "---" at its start and end, so it can't start before the
+    second to last "---", or the last two characters when there is none.
+    """
+    last = text.rfind("---", start)
+    if last < 0:
+        return max(start, len(text) - 2)
+    second_to_last = text.rfind("---", start, last + 2)
+    return second_to_last if second_to_last >= 0 else last
+
+
+def _iter_sections(document: dict) -> Iterator[tuple[str, str, int, int, int]]:
+    """
+    Yield the sections of a document in document order, reading its text as it goes.
+
+    Each section is yielded once the next delimiter is read, so a caller that stops early
+    never extracts the rest of the document.
+
+    Yields:
+        tuple[str, str, int, int, int]: The date of each section, the text read around it,
+            and the start, content start and end offset of the section in that text
+    """
+    # A table of contents repeats the section headers, without their content
+    runs = gdoc_client.iter_document_text(document, include_table_of_contents=False)
+    text = ""
+    current = None  # the date, start and content start of the current section in `text`
+    search_from = 0
+    chunk, chunk_size = [], 0
+    for run in itertools.chain(runs, [None]):
+        if run is not None:
+            chunk.append(run)
+            chunk_size += len(run)
+            if chunk_size < _READ_CHUNK_CHARS:
+                continue
+        # Only the current section and what follows it is still needed
+        keep_from = current[1] if current else search_from
+        text = text[keep_from:] + "".join(chunk)
+        search_from -= keep_from
+        if current:
+            current = (current[0], 0, current[2] - keep_from)
+        chunk, chunk_size = [], 0
+
+        # Whitespace after a delimiter at the end of the text may continue in the next chunk, where
+        # it is stripped from the content anyway
+        while match := _SECTION_DELIMITER.search(text, search_from):
+            if current:
+                yield current[0], text, current[1], current[2], match.start()
+            current = (match.group(1), match.start(), match.end())
+            search_from = match.end()
+        search_from = _unfinished_delimiter_start(text, search_from)
+    if current:
+        yield current[0], text, current[1], current[2], len(text)
+
+
+def _iter_ordered_sections(document: dict) -> Iterator[tuple[tuple[str, str, int, int, int], Optional[bool]]]:
+    """
+    Yield the sections of a document in document order, each with whether the document lists
+    its sections newest first, or None until that is known.
+
+    Updates are added either at the top or at the bottom of a biweekly document, so the first
+    two distinct dates tell which, and the rest of the document is assumed to follow suit.
+    """
+    first_date = None
+    newest_first = None
+    for section in _iter_sections(document):
+        date_str = section[0]
+        if first_date is None:
+            first_date = date_str
+        elif newest_first is None and date_str != first_date:
+            newest_first = date_str < first_date
+        yield section, newest_first
+
+
+def _build_section(section: tuple[str, str, int, int, int]) -> constants.DocumentSection:
+    """Materialize a read section, checking its date is valid"""
+    date_str, text, start, content_start, end = section
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Invalid date format in section: {date_str}. Expected format: YYYY-MM-DD")
+
+    return constants.DocumentSection(
+        section_date=date_str,
+        content=text[content_start:end].strip(),
+        raw_content=text[start:end]
+    )
+
+
+def extract_sections_since(document: dict, since_date: Optional[str]) -> list[constants.DocumentSection]:
+    """
+    Extract the sections of a document dated after `since_date`.
+
+    Args:
+        document: The Google Doc document dictionary
+        since_date: ISO date (YYYY-MM-DD) of the last processed section, or None for all sections
+
+    Reading stops at the first section at or before `since_date` when the document lists its
+    sections newest first, so the cost depends on the new sections rather than the history.
+
+    Returns:
+        list[constants.DocumentSection]: The newer sections, oldest first. When a date
+            appears more than once, only its first section in the document is returned.
+
+    Raises:
+        ValueError: If a returned section contains an invalid date format
+    """
+    newer = {}
+    for section, newest_first in _iter_ordered_sections(document):
+        date_str = section[0]
+        if since_date is not None and date_str <= since_date:
+            if newest_first:
+                # The rest of the document is older still
+                break
+            continue
+        newer.setdefault(date_str, section)
+
+    return [_build_section(newer[date_str]) for date_str in sorted(newer)]
+
+
+def read_sections_since(
+    response: bytes | str, since_date: Optional[str]
+) -> tuple[str, list[constants.DocumentSection]]:
+    """
+    Decode a Docs response fetched with `decode=False`, and extract its title and the
+    sections dated after `since_date`.
+
+    Takes and returns only text and dataclasses, so it can run in a `cpu_pool` process.
+    """
+    document = json.loads(response)
+    return document.get("title", ""), extract_sections_since(document, since_date)
+
 
 def extract_latest_section(document: dict) -> Optional[constants.DocumentSection]:
     """
     Extract the most recent section from a document.
-    
+
+    Reading stops after the first sections when the document lists its sections newest first.
+
     Args:
         document: The Google Doc document dictionary
-        
+
     Returns:
         Optional[constants.DocumentSection]: The latest section if found, None otherwise
-        
+
     Raises:
-        ValueError: If a section contains an invalid date format
-    """
-    content = gdoc_client.extract_document_content(document)
-    if not content:
-        return None
-
-    # Find all sections using the custom date delimiter
-    section_pattern = r"---\s*UPDATE\s+(\d{4}-\d{2}-\d{2})\s*---\s*(.*?)(?=---\s*UPDATE|\Z)"
-    matches = re.finditer(section_pattern, content, re.DOTALL)
-    
-    latest_section = None
-    latest_date = None
-    
-    for match in matches:
-        date_str = match.group(1)
-        section_content = match.group(2).strip()
-        
-        try:
-            current_date = datetime.strptime(date_str, "%Y-%m-%d")
-            if not latest_date or current_date > latest_date:
-                latest_date = current_date
-                latest_section = constants.DocumentSection(
-                    section_date=date_str,
-                    content=section_content,
-                    raw_content=match.group(0)
-                )
-        except ValueError:
-            raise ValueError(f"Invalid date format in section: {date_str}. Expected format: YYYY-MM-DD")
-    
-    return latest_section
+        ValueError: If the latest section contains an invalid date format
+    """
+    latest = None
+    for section, newest_first in _iter_ordered_sections(document):
+        if latest is None or section[0] > latest[0]:
+            latest = section
+        if newest_first:
+            # The first section is the latest
+            break
+
+    return _build_section(latest) if latest else None
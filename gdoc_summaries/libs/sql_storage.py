@@ -0,0 +1,592 @@
+"""Shared database storage
+
+`SQLAlchemyStorage` stores the same data as the local SQLite file in `db.py`, in a database
+shared by several workers or machines, e.g. PostgreSQL. It has a method for each of `db.py`'s
+public functions, which call it instead when `constants.DATABASE_URL` is set.
+
+Connections come from the engine's pool and go back to it after each call, or at the end of a
+`transaction()` block. Claiming documents takes row locks and skips rows locked by other
+workers, so concurrent workers never claim the same document.
+SQLite URLs are supported too, e.g. `sqlite://` for an in-memory database in tests, whose
+single connection all threads take turns on.
+"""
+import contextlib
+import threading
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+from gdoc_summaries.libs import constants
+
+# Version of the schema below. Bump it with every change to the tables, and migrate
+# existing shared databases in `setup_database`.
+SCHEMA_VERSION = 1
+
+# Stay well below the databases' limits on bound parameters in a single statement
+_MAX_QUERY_PARAMS = 500
+
+# Key of the Postgres advisory lock held while creating the schema, so workers starting
+# together don't all try to create it
+_SETUP_LOCK_KEY = 0x6764_6F63
+
+METADATA = sa.MetaData()
+
+SUMMARIES = sa.Table(
+    "summaries", METADATA,
+    sa.Column("document_id", sa.Text, primary_key=True),
+    sa.Column("title", sa.Text),
+    sa.Column("summary", sa.Text),
+    sa.Column("date_published", sa.Text),
+    sa.Column("sent", sa.Integer, server_default=sa.text("0")),
+    sa.Column("summary_type", sa.Text, server_default=sa.text("'TDD'")),
+    sa.Index("idx_summaries_type_sent", "summary_type", "sent"),
+)
+
+# Sections are saved before their document has a row in `summaries`, so unlike the SQLite
+# schema there is no foreign key, which Postgres would enforce
+SUMMARY_SECTIONS = sa.Table(
+    "summary_sections", METADATA,
+    sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+    sa.Column("document_id", sa.Text),
+    sa.Column("section_date", sa.Text),
+    sa.Column("section_content", sa.Text),
+    sa.Column("section_summary", sa.Text),
+    sa.Column("processed_date", sa.DateTime, server_default=sa.func.current_timestamp()),
+    sa.Column("sent", sa.Integer, server_default=sa.text("0")),
+    sa.Index("idx_summary_sections_document_date", "document_id", "section_date", unique=True),
+    sa.Index("idx_summary_sections_document_sent_date", "document_id", "sent", "section_date"),
+)
+
+DOCUMENT_REVISIONS = sa.Table(
+    "document_revisions", METADATA,
+    sa.Column("document_id", sa.Text, primary_key=True),
+    sa.Column("modified_time", sa.Text),
+    sa.Column("head_revision_id", sa.Text),
+)
+
+LLM_CACHE = sa.Table(
+    "llm_cache", METADATA,
+    sa.Column("cache_key", sa.Text, primary_key=True),
+    sa.Column("response", sa.Text),
+    sa.Column("created_at", sa.Float),
+    sa.Column("last_used_at", sa.Float),
+    sa.Index("idx_llm_cache_last_used_at", "last_used_at"),
+)
+
+DOCUMENTS = sa.Table(
+    "documents", METADATA,
+    sa.Column("document_id", sa.Text, primary_key=True),
+    sa.Column("title", sa.Text),
+)
+
+# `id` keeps the order recipients were added in, like the rowid of the SQLite table
+EMAIL_OUTBOX = sa.Table(
+    "email_outbox", METADATA,
+    sa.Column("id", sa.BigInteger().with_variant(sa.Integer, "sqlite"), primary_key=True, autoincrement=True),
+    sa.Column("batch_id", sa.Text, nullable=False),
+    sa.Column("email_address", sa.Text, nullable=False),
+    sa.Column("status", sa.Text, nullable=False, server_default=sa.text("'PENDING'")),
+    sa.Column("attempts", sa.Integer, nullable=False, server_default=sa.text("0")),
+    sa.Column("message_id", sa.Text),
+    sa.Column("error", sa.Text),
+    sa.Column("updated_at", sa.Float),
+    sa.UniqueConstraint("batch_id", "email_address", name="uq_email_outbox_batch_email"),
+)
+
+DOCUMENT_CLAIMS = sa.Table(
+    "document_claims", METADATA,
+    sa.Column("document_id", sa.Text, primary_key=True),
+    sa.Column("owner", sa.Text),
+    sa.Column("lease_expires_at", sa.Float),
+)
+
+SCHEMA_VERSIONS = sa.Table(
+    "schema_version", METADATA,
+    sa.Column("version", sa.Integer, nullable=False),
+)
+
+# Everything `drop_tables` drops; the LLM cache is kept so reset documents aren't paid for again
+_RESETTABLE_TABLES = [SUMMARY_SECTIONS, SUMMARIES, DOCUMENT_REVISIONS, DOCUMENTS, EMAIL_OUTBOX, DOCUMENT_CLAIMS]
+
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def _chunked(items: list, size: int = _MAX_QUERY_PARAMS):
+    """Yield successive slices of at most `size` items"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _use_explicit_sqlite_transactions(engine: sa.Engine) -> None:
+    """
+    Let SQLAlchemy, rather than the sqlite3 module, begin transactions on SQLite connections.
+
+    The sqlite3 module otherwise begins transactions lazily, which breaks savepoints and
+    `BEGIN IMMEDIATE`.
+    """
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute("PRAGMA busy_timeout=5000")
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        immediate = conn.get_execution_options().get("begin_immediate", False)
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+
+class SQLAlchemyStorage:
+    """Summaries, sections, sent state, email outbox, document claims and LLM cache in a SQL database"""
+
+    def __init__(self, engine: sa.Engine):
+        if engine.dialect.name not in _INSERTS:
+            raise ValueError(f"Unsupported database {engine.dialect.name!r}, use PostgreSQL or SQLite")
+        self.engine = engine
+        self._insert = _INSERTS[engine.dialect.name]
+        self._local = threading.local()
+        if engine.dialect.name == "sqlite":
+            _use_explicit_sqlite_transactions(engine)
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        pool_size: int = constants.DATABASE_POOL_SIZE,
+        max_overflow: int = constants.DATABASE_MAX_OVERFLOW,
+    ) -> "SQLAlchemyStorage":
+        """Connect to the database at a SQLAlchemy URL through a pool of connections"""
+        engine_url = sa.make_url(url)
+        options = {"pool_pre_ping": True}
+        if engine_url.get_backend_name() != "sqlite":
+            options.update(pool_size=pool_size, max_overflow=max_overflow)
+        elif engine_url.database in (None, "", ":memory:"):
+            # An in-memory database lives and dies with its connection, so every thread has to
+            # use the same one, and one at a time, since each call runs in its own transaction
+            options.update(
+                poolclass=sa.QueuePool, pool_size=1, max_overflow=0,
+                connect_args={"check_same_thread": False},
+            )
+        return cls(sa.create_engine(engine_url, **options))
+
+    @contextlib.contextmanager
+    def transaction(self, immediate: bool = False):
+        """
+        Run the enclosed calls on one pooled connection in a single transaction.
+
+        Nested blocks use savepoints, so a failing inner block only rolls back its own writes.
+        An `immediate` transaction takes SQLite's write lock up front; Postgres locks rows instead.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with conn.begin_nested():
+                yield conn
+            return
+
+        with self.engine.connect() as conn:
+            if immediate:
+                conn.execution_options(begin_immediate=True)
+            self._local.conn = conn
+            try:
+                with conn.begin():
+                    yield conn
+            finally:
+                self._local.conn = None
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Use this thread's transaction if it is in one, otherwise a transaction of its own"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+        else:
+            with self.transaction() as conn:
+                yield conn
+
+    def close_connection(self) -> None:
+        """Connections go back to the pool after each call or transaction, so there is nothing to close"""
+
+    def get_schema_version(self) -> int:
+        """Get the version of the schema in the database, 0 if it has none yet"""
+        with self._connect() as conn:
+            if not sa.inspect(conn).has_table(SCHEMA_VERSIONS.name):
+                return 0
+            return conn.execute(sa.select(sa.func.max(SCHEMA_VERSIONS.c.version))).scalar() or 0
+
+    def setup_database(self) -> None:
+        """Create the tables the database doesn't have yet"""
+        if self.get_schema_version() >= SCHEMA_VERSION:
+            return
+
+        with self.transaction() as conn:
+            if self.engine.dialect.name == "postgresql":
+                conn.execute(sa.text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SETUP_LOCK_KEY})
+            print(f"Creating shared database schema version {SCHEMA_VERSION}")
+            METADATA.create_all(conn)
+            conn.execute(sa.delete(SCHEMA_VERSIONS))
+            conn.execute(sa.insert(SCHEMA_VERSIONS).values(version=SCHEMA_VERSION))
+
+    def drop_tables(self) -> None:
+        """Drop every table except the LLM cache, so `setup_database` recreates them empty"""
+        with self.transaction() as conn:
+            METADATA.drop_all(conn, tables=[*_RESETTABLE_TABLES, SCHEMA_VERSIONS])
+
+    def get_summary_from_db(self, document_id: str) -> constants.Summary | None:
+        with self._connect() as conn:
+            result = conn.execute(
+                sa.select(SUMMARIES.c.title, SUMMARIES.c.summary, SUMMARIES.c.date_published, SUMMARIES.c.summary_type)
+                .where(SUMMARIES.c.document_id == document_id)
+            ).first()
+        if result:
+            return constants.Summary(
+                document_id=document_id,
+                title=result.title,
+                content=result.summary,
+                date_published=result.date_published,
+                summary_type=result.summary_type,
+            )
+        return None
+
+    def save_summary_to_db(self, summary: constants.Summary) -> None:
+        statement = self._insert(SUMMARIES).values(
+            document_id=summary.document_id,
+            title=summary.title,
+            summary=summary.content,
+            date_published=summary.date_published,
+            sent=0,
+            summary_type=summary.summary_type.value,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[SUMMARIES.c.document_id],
+            set_={
+                "title": statement.excluded.title,
+                "summary": statement.excluded.summary,
+                "date_published": statement.excluded.date_published,
+                "summary_type": statement.excluded.summary_type,
+                "sent": 0,
+            },
+        )
+        with self._connect() as conn:
+            conn.execute(statement)
+
+    def get_summary_sent_status(self, document_id: str) -> 0|1:
+        with self._connect() as conn:
+            return conn.execute(
+                sa.select(SUMMARIES.c.sent).where(SUMMARIES.c.document_id == document_id)
+            ).scalar()
+
+    def mark_summary_as_sent(self, document_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(sa.update(SUMMARIES).where(SUMMARIES.c.document_id == document_id).values(sent=1))
+
+    def get_summaries_with_sent_status(
+        self, document_ids: list[str]
+    ) -> dict[str, tuple[constants.Summary, int]]:
+        """Get the stored summary and sent status of many documents in a single query"""
+        results = {}
+        with self._connect() as conn:
+            for chunk in _chunked(list(dict.fromkeys(document_ids))):
+                rows = conn.execute(sa.select(SUMMARIES).where(SUMMARIES.c.document_id.in_(chunk)))
+                for row in rows:
+                    summary = constants.Summary(
+                        document_id=row.document_id,
+                        title=row.title,
+                        content=row.summary,
+                        date_published=row.date_published,
+                        summary_type=row.summary_type,
+                    )
+                    results[row.document_id] = (summary, row.sent)
+        return results
+
+    def mark_summaries_as_sent(self, document_ids: list[str]) -> None:
+        """Mark many summaries as sent in a single statement"""
+        with self._connect() as conn:
+            for chunk in _chunked(list(dict.fromkeys(document_ids))):
+                conn.execute(sa.update(SUMMARIES).where(SUMMARIES.c.document_id.in_(chunk)).values(sent=1))
+
+    def get_latest_section_date(self, document_id: str) -> str | None:
+        """Get the most recent section date for a document"""
+        with self._connect() as conn:
+            return conn.execute(
+                sa.select(SUMMARY_SECTIONS.c.section_date)
+                .where(SUMMARY_SECTIONS.c.document_id == document_id)
+                .order_by(SUMMARY_SECTIONS.c.section_date.desc())
+                .limit(1)
+            ).scalar()
+
+    def save_section_to_db(
+        self,
+        document_id: str,
+        section_date: str,
+        section_content: str,
+        section_summary: str,
+    ) -> None:
+        """Save a new document section, ignoring a section already saved for the same date"""
+        statement = self._insert(SUMMARY_SECTIONS).values(
+            document_id=document_id,
+            section_date=section_date,
+            section_content=section_content,
+            section_summary=section_summary,
+        ).on_conflict_do_nothing(index_elements=[SUMMARY_SECTIONS.c.document_id, SUMMARY_SECTIONS.c.section_date])
+        with self._connect() as conn:
+            conn.execute(statement)
+
+    def get_unsent_sections(self, document_id: str) -> list[tuple]:
+        """Get all unsent sections for a document"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                sa.select(SUMMARY_SECTIONS.c.section_date, SUMMARY_SECTIONS.c.section_summary)
+                .where(SUMMARY_SECTIONS.c.document_id == document_id, SUMMARY_SECTIONS.c.sent == 0)
+                .order_by(SUMMARY_SECTIONS.c.section_date.desc())
+            )
+            return [tuple(row) for row in rows]
+
+    def mark_sections_as_sent(self, document_id: str) -> None:
+        """Mark all sections for a document as sent"""
+        with self._connect() as conn:
+            conn.execute(
+                sa.update(SUMMARY_SECTIONS)
+                .where(SUMMARY_SECTIONS.c.document_id == document_id, SUMMARY_SECTIONS.c.sent == 0)
+                .values(sent=1)
+            )
+
+    def get_document_revisions(self, document_ids: list[str]) -> dict[str, constants.DocumentRevision]:
+        """Get the last processed revision of each of the given documents"""
+        revisions = {}
+        with self._connect() as conn:
+            for chunk in _chunked(list(dict.fromkeys(document_ids))):
+                rows = conn.execute(sa.select(DOCUMENT_REVISIONS).where(DOCUMENT_REVISIONS.c.document_id.in_(chunk)))
+                for row in rows:
+                    revisions[row.document_id] = constants.DocumentRevision(
+                        document_id=row.document_id,
+                        modified_time=row.modified_time,
+                        head_revision_id=row.head_revision_id,
+                    )
+        return revisions
+
+    def save_document_revision(self, revision: constants.DocumentRevision) -> None:
+        """Record the revision of a document that has just been processed"""
+        statement = self._insert(DOCUMENT_REVISIONS).values(
+            document_id=revision.document_id,
+            modified_time=revision.modified_time,
+            head_revision_id=revision.head_revision_id,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[DOCUMENT_REVISIONS.c.document_id],
+            set_={
+                "modified_time": statement.excluded.modified_time,
+                "head_revision_id": statement.excluded.head_revision_id,
+            },
+        )
+        with self._connect() as conn:
+            conn.execute(statement)
+
+    def get_document_titles(self, document_ids: list[str]) -> dict[str, str]:
+        """Get the stored title of each of the given documents"""
+        titles = {}
+        with self._connect() as conn:
+            for chunk in _chunked(list(dict.fromkeys(document_ids))):
+                rows = conn.execute(
+                    sa.select(DOCUMENTS.c.document_id, DOCUMENTS.c.title).where(DOCUMENTS.c.document_id.in_(chunk))
+                )
+                titles.update(tuple(row) for row in rows)
+        return titles
+
+    def save_document_titles(self, titles: dict[str, str]) -> None:
+        """Store the titles of documents by ID"""
+        if not titles:
+            return
+        statement = self._insert(DOCUMENTS)
+        statement = statement.on_conflict_do_update(
+            index_elements=[DOCUMENTS.c.document_id], set_={"title": statement.excluded.title}
+        )
+        with self._connect() as conn:
+            conn.execute(statement, [
+                {"document_id": document_id, "title": title} for document_id, title in titles.items()
+            ])
+
+    def enqueue_emails(self, batch_id: str, email_addresses: list[str]) -> None:
+        """Add recipients of a batch to the outbox, keeping the delivery state of ones already there"""
+        if not email_addresses:
+            return
+        statement = self._insert(EMAIL_OUTBOX).on_conflict_do_nothing(
+            index_elements=[EMAIL_OUTBOX.c.batch_id, EMAIL_OUTBOX.c.email_address]
+        )
+        with self._connect() as conn:
+            conn.execute(statement, [
+                {
+                    "batch_id": batch_id,
+                    "email_address": email_address,
+                    "status": constants.DeliveryStatus.PENDING.value,
+                    "updated_at": time.time(),
+                }
+                for email_address in email_addresses
+            ])
+
+    def get_undelivered_emails(self, batch_id: str) -> list[str]:
+        """Get the recipients of a batch that haven't been sent the email yet, in the order they were added"""
+        with self._connect() as conn:
+            return list(conn.execute(
+                sa.select(EMAIL_OUTBOX.c.email_address)
+                .where(
+                    EMAIL_OUTBOX.c.batch_id == batch_id,
+                    EMAIL_OUTBOX.c.status != constants.DeliveryStatus.SENT.value,
+                )
+                .order_by(EMAIL_OUTBOX.c.id)
+            ).scalars())
+
+    def record_email_results(self, batch_id: str, results: list[constants.EmailResult]) -> None:
+        """Record the outcome of an attempt to send a batch's email to some of its recipients"""
+        if not results:
+            return
+        statement = (
+            sa.update(EMAIL_OUTBOX)
+            .where(
+                EMAIL_OUTBOX.c.batch_id == sa.bindparam("b_batch_id"),
+                EMAIL_OUTBOX.c.email_address == sa.bindparam("b_email_address"),
+            )
+            .values(
+                status=sa.bindparam("b_status"),
+                attempts=EMAIL_OUTBOX.c.attempts + 1,
+                message_id=sa.bindparam("b_message_id"),
+                error=sa.bindparam("b_error"),
+                updated_at=sa.bindparam("b_updated_at"),
+            )
+        )
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(statement, [
+                {
+                    "b_status": (constants.DeliveryStatus.SENT if result.ok else constants.DeliveryStatus.FAILED).value,
+                    "b_message_id": result.message_id,
+                    "b_error": None if result.ok else str(result.error),
+                    "b_updated_at": now,
+                    "b_batch_id": batch_id,
+                    "b_email_address": result.email_address,
+                }
+                for result in results
+            ])
+
+    def claim_documents(self, document_ids: list[str], owner: str, lease_seconds: float) -> list[str]:
+        """
+        Claim the given documents for `owner` until the lease expires.
+
+        Documents claimed by another owner whose lease hasn't expired are skipped, and so are
+        documents another worker is claiming right now. Claiming a document `owner` already
+        holds extends its lease.
+
+        Returns:
+            list[str]: The claimed document IDs, in the order of `document_ids`
+        """
+        unique_ids = list(dict.fromkeys(document_ids))
+        if not unique_ids:
+            return []
+        now = time.time()
+        claimable = set()
+        with self.transaction(immediate=True) as conn:
+            conn.execute(
+                self._insert(DOCUMENT_CLAIMS).on_conflict_do_nothing(index_elements=[DOCUMENT_CLAIMS.c.document_id]),
+                [{"document_id": document_id} for document_id in unique_ids],
+            )
+            for chunk in _chunked(unique_ids):
+                rows = conn.execute(
+                    sa.select(DOCUMENT_CLAIMS.c.document_id)
+                    .where(
+                        DOCUMENT_CLAIMS.c.document_id.in_(chunk),
+                        sa.or_(
+                            DOCUMENT_CLAIMS.c.owner.is_(None),
+                            DOCUMENT_CLAIMS.c.owner == owner,
+                            DOCUMENT_CLAIMS.c.lease_expires_at < now,
+                        ),
+                    )
+                    .with_for_update(skip_locked=True)
+                )
+                claimable.update(rows.scalars())
+            claimed = [document_id for document_id in unique_ids if document_id in claimable]
+            for chunk in _chunked(claimed):
+                conn.execute(
+                    sa.update(DOCUMENT_CLAIMS)
+                    .where(DOCUMENT_CLAIMS.c.document_id.in_(chunk))
+                    .values(owner=owner, lease_expires_at=now + lease_seconds)
+                )
+        return claimed
+
+    def renew_claims(self, document_ids: list[str], owner: str, lease_seconds: float) -> list[str]:
+        """
+        Extend `owner`'s leases on the given documents.
+
+        Returns:
+            list[str]: The given document IDs `owner` still holds, in the order of `document_ids`
+        """
+        unique_ids = list(dict.fromkeys(document_ids))
+        held = set()
+        with self._connect() as conn:
+            for chunk in _chunked(unique_ids):
+                rows = conn.execute(
+                    sa.update(DOCUMENT_CLAIMS)
+                    .where(DOCUMENT_CLAIMS.c.document_id.in_(chunk), DOCUMENT_CLAIMS.c.owner == owner)
+                    .values(lease_expires_at=time.time() + lease_seconds)
+                    .returning(DOCUMENT_CLAIMS.c.document_id)
+                )
+                held.update(rows.scalars())
+        return [document_id for document_id in unique_ids if document_id in held]
+
+    def release_documents(self, document_ids: list[str], owner: str) -> None:
+        """Give up `owner`'s claims on the given documents"""
+        with self._connect() as conn:
+            for chunk in _chunked(list(dict.fromkeys(document_ids))):
+                conn.execute(
+                    sa.update(DOCUMENT_CLAIMS)
+                    .where(DOCUMENT_CLAIMS.c.document_id.in_(chunk), DOCUMENT_CLAIMS.c.owner == owner)
+                    .values(owner=None, lease_expires_at=None)
+                )
+
+    def get_cached_llm_response(self, cache_key: str, max_age_seconds: float) -> str | None:
+        """Get a cached LLM response that is younger than `max_age_seconds`"""
+        now = time.time()
+        with self._connect() as conn:
+            response = conn.execute(
+                sa.select(LLM_CACHE.c.response)
+                .where(LLM_CACHE.c.cache_key == cache_key, LLM_CACHE.c.created_at >= now - max_age_seconds)
+            ).first()
+            if not response:
+                return None
+            conn.execute(sa.update(LLM_CACHE).where(LLM_CACHE.c.cache_key == cache_key).values(last_used_at=now))
+        return response[0]
+
+    def save_cached_llm_response(self, cache_key: str, response: str) -> None:
+        """Cache an LLM response under the hash of everything that produced it"""
+        now = time.time()
+        statement = self._insert(LLM_CACHE).values(
+            cache_key=cache_key, response=response, created_at=now, last_used_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[LLM_CACHE.c.cache_key],
+            set_={
+                "response": statement.excluded.response,
+                "created_at": statement.excluded.created_at,
+                "last_used_at": statement.excluded.last_used_at,
+            },
+        )
+        with self._connect() as conn:
+            conn.execute(statement)
+
+    def evict_llm_cache(self, max_entries: int, max_age_seconds: float) -> int:
+        """Drop expired cache entries, then the least recently used ones above `max_entries`"""
+        least_recently_used = (
+            sa.select(LLM_CACHE.c.cache_key)
+            .order_by(LLM_CACHE.c.last_used_at.desc())
+            .offset(max_entries)
+        )
+        with self.transaction() as conn:
+            expired = conn.execute(
+                sa.delete(LLM_CACHE).where(LLM_CACHE.c.created_at < time.time() - max_age_seconds)
+            ).rowcount
+            overflow = conn.execute(
+                sa.delete(LLM_CACHE).where(LLM_CACHE.c.cache_key.in_(least_recently_used))
+            ).rowcount
+        return expired + overflow
@@ -1,11 +1,13 @@
 """Common functionality for processing document summaries"""
 
+import hashlib
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List
 
 from googleapiclient import discovery
 
-from gdoc_summaries.libs import constants, db, email_client, gdoc_client, llm
+from gdoc_summaries.libs import claims, constants, cpu_pool, db, email_client, gdoc_client, llm
 
 LOGGER = logging.getLogger(__name__)
 
@@ -25,70 +27,172 @@ def preview_and_confirm_email(summaries: List[constants.Summary], recipients: Li
     confirmation = input("\nSend these emails? (Y/N): ")
     return confirmation.strip().upper() == "Y"
 
+def _email_batch_id(summaries: List[constants.Summary], summary_type: constants.SummaryType) -> str:
+    """Identify an email by what it contains, so a retried send resumes the same outbox batch"""
+    digest = hashlib.sha256(summary_type.value.encode())
+    for summary in summaries:
+        digest.update(b"\0" + summary.document_id.encode() + b"\0" + summary.content.encode())
+    return digest.hexdigest()
+
 def send_summaries(summaries: List[constants.Summary], summary_type: constants.SummaryType) -> bool:
-    """Send summaries to all subscribers and mark as sent. Returns True if emails were sent."""
+    """
+    Send summaries to all subscribers and mark as sent. Returns True if emails were sent.
+
+    Each recipient's delivery is tracked in the DB outbox as it happens, so after a failure
+    the next send of the same summaries only goes to the recipients that didn't get it.
+    """
     if not summaries:
         print("No summaries to send.")
         return False
 
     recipients = constants.get_subscribers(summary_type)
-    if not preview_and_confirm_email(summaries, recipients):
-        print("Aborted sending emails.")
-        return False
+    batch_id = _email_batch_id(summaries, summary_type)
+    db.enqueue_emails(batch_id, recipients)
+    subscribed = set(recipients)
+    pending = [email_address for email_address in db.get_undelivered_emails(batch_id) if email_address in subscribed]
 
-    for email_address in recipients:
-        print(f"Sending email to: {email_address}")
-        email_client.build_and_send_email(
-            email_address=email_address,
+    if pending:
+        if len(pending) < len(recipients):
+            print(f"Resuming a previous send: {len(recipients) - len(pending)} recipients already have these summaries")
+        if not preview_and_confirm_email(summaries, pending):
+            print("Aborted sending emails.")
+            return False
+
+        print(f"Sending email to {len(pending)} recipients")
+        results = email_client.send_bulk_email(
+            email_addresses=pending,
             summaries=summaries,
-            summary_type=summary_type
+            summary_type=summary_type,
+            on_results=lambda request_results: db.record_email_results(batch_id, request_results),
         )
+        failures = [result for result in results if not result.ok]
+        if failures:
+            for result in failures:
+                LOGGER.error(f"Error sending email to {result.email_address}: {result.error}")
+            raise failures[0].error
+    else:
+        print("Every recipient already has these summaries.")
 
     # Mark as sent after successful sending
-    for summary in summaries:
-        db.mark_summary_as_sent(summary.document_id)
+    db.mark_summaries_as_sent([summary.document_id for summary in summaries])
         
     return True
 
-def process_summaries(summary_type: constants.SummaryType) -> None:
-    """Process summaries for a given summary type"""
+def _summarize_document(
+    read_document: Future, document_info: constants.DocumentInfo, summary_type: constants.SummaryType
+) -> constants.Summary:
+    """Summarize a single fetched document, once its title and text have been read"""
+    title, document_content = read_document.result()
+    llm_summary = llm.generate_llm_summary(document_content)
+
+    return constants.Summary(
+        document_id=document_info.document_id,
+        title=title,
+        content=llm_summary,
+        date_published=document_info.date_published,
+        summary_type=summary_type,
+    )
+
+def _pending_documents(
+    document_ids: List[str], summaries_by_id: dict[str, constants.Summary]
+) -> List[str]:
+    """
+    Get the documents that still need a summary, looking up stored summaries in bulk.
+
+    Stored summaries that haven't been sent yet are added to `summaries_by_id`.
+    """
+    stored = db.get_summaries_with_sent_status(document_ids)
+    pending = []
+    for document_id in document_ids:
+        existing_summary, sent_status = stored.get(document_id, (None, None))
+        if existing_summary:
+            if sent_status == 1:
+                print(f"Summary has already been sent for {document_id=}, skipping.")
+            else:
+                print(f"Summary has not been sent for {document_id=} but exists in the DB. Will send it.")
+                summaries_by_id[document_id] = existing_summary
+        else:
+            pending.append(document_id)
+    return pending
+
+def process_summaries(
+    summary_type: constants.SummaryType, max_workers: int = constants.MAX_WORKERS
+) -> None:
+    """
+    Process summaries for a given summary type
+
+    Documents are claimed a batch at a time, so several workers can share the document list:
+    each skips the documents the others hold, and releases its own once their summaries are
+    sent. Claimed documents without a stored summary are fetched with batched Docs requests,
+    read in the `cpu_pool`, and summarized concurrently by up to `max_workers` threads. New
+    summaries are written on the calling thread in a single transaction, and are sent in the
+    same order as the configured document list.
+    """
     db.setup_database()
 
     creds = gdoc_client.get_credentials(creds_path=constants.CREDS_PATH, scopes=gdoc_client.SCOPES)
     document_infos: List[constants.DocumentInfo] = constants.get_doc_info(summary_type)
     service = discovery.build("docs", "v1", credentials=creds)
 
-    # Do the work for each GDoc
-    summaries: List[constants.Summary] = []
+    document_infos_by_id: dict[str, constants.DocumentInfo] = {}
     for document_info in document_infos:
-        existing_summary = db.get_summary_from_db(document_info.document_id)
-        if existing_summary:
-            sent_status = db.get_summary_sent_status(document_info.document_id)
-            if sent_status == 1:
-                print(f"Summary has already been sent for {document_info.document_id=}, skipping.")
-                continue
-            else:
-                print(f"Summary has not been sent for {document_info.document_id=} but exists in the DB. Will send it.")
-                summaries.append(existing_summary)
-        else:
-            try:
-                document = gdoc_client.get_document_from_id(service, document_info.document_id)
-                document_content = gdoc_client.extract_document_content(document)
-                llm_summary = llm.generate_llm_summary(document_content)
-                
-                summary = constants.Summary(
-                    document_id=document_info.document_id,
-                    title=document["title"],
-                    content=llm_summary,
-                    date_published=document_info.date_published,
-                    summary_type=summary_type,
-                )
-                db.save_summary_to_db(summary)
-                summaries.append(summary)
-            except RuntimeError as e:
-                if "context_length_exceeded" in str(e):
-                    print(f"Skipping document {document_info.document_id} due to context length exceeded")
+        document_infos_by_id.setdefault(document_info.document_id, document_info)
+    document_ids = list(document_infos_by_id)
+
+    summaries_by_id: dict[str, constants.Summary] = {}
+    errors: dict[str, Exception] = {}
+    generated: List[constants.Summary] = []
+    with claims.DocumentClaims() as document_claims:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Summarizing a fetched batch overlaps with claiming and fetching the next one
+            futures = {}
+            document_ids_to_fetch = []
+            for start in range(0, len(document_ids), constants.DOCS_BATCH_SIZE):
+                claimed = document_claims.claim(document_ids[start:start + constants.DOCS_BATCH_SIZE])
+                # Check what is stored only once the documents are claimed, in case another
+                # worker finished them in the meantime
+                pending = _pending_documents(claimed, summaries_by_id) if claimed else []
+                if not pending:
                     continue
-                raise  # Re-raise other RuntimeErrors
+                document_ids_to_fetch.extend(pending)
+                responses, fetch_errors = gdoc_client.get_documents_from_ids(service, pending, decode=False)
+                errors.update(fetch_errors)
+                for document_id, response in responses.items():
+                    # Decoding and text extraction are CPU-bound, so they can run in another process
+                    read_document = cpu_pool.submit(gdoc_client.read_document, response)
+                    futures[document_id] = executor.submit(
+                        _summarize_document, read_document, document_infos_by_id[document_id], summary_type
+                    )
+
+            # Keep going past a failed document so finished LLM work still gets saved
+            for document_id in document_ids_to_fetch:
+                if document_id not in futures:
+                    continue
+                try:
+                    summary = futures[document_id].result()
+                except Exception as e:
+                    errors[document_id] = e
+                    continue
+                generated.append(summary)
+                summaries_by_id[document_id] = summary
+
+        with db.transaction():
+            for summary in generated:
+                db.save_summary_to_db(summary)
+
+        cache_stats = llm.get_cache_stats()
+        print(f"LLM summary cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+
+        if errors:
+            for document_id, error in errors.items():
+                LOGGER.error(f"Error processing document {document_id}: {error}")
+            raise next(iter(errors.values()))
 
-    send_summaries(summaries, summary_type)
+        # A worker that stalled past its leases may have lost documents to another worker,
+        # which then sends them
+        held = set(document_claims.still_held(list(summaries_by_id)))
+        summaries: List[constants.Summary] = [
+            summaries_by_id[document_id] for document_id in document_ids
+            if document_id in summaries_by_id and document_id in held
+        ]
+        send_summaries(summaries, summary_type)
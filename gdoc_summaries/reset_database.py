@@ -1,5 +1,3 @@
-import sqlite3
-
 from gdoc_summaries.libs import db
 
 
@@ -10,16 +8,10 @@ def reset_database():
         print("Operation cancelled.")
         return
     
-    conn = sqlite3.connect("summaries.db")
-    cursor = conn.cursor()
-    
-    # Drop all existing tables
-    cursor.execute("DROP TABLE IF EXISTS summary_sections")  # Drop sections first due to foreign key
-    cursor.execute("DROP TABLE IF EXISTS summaries")
-    conn.commit()
-    conn.close()
+    # Drop all existing tables, except the LLM cache so reset documents aren't paid for again
+    db.drop_tables()
     
-    # Use the setup_database function from db.py to recreate the tables
+    # Use the setup_database function from db.py to recreate the tables at the latest schema version
     db.setup_database()
     print("Database tables have been reset successfully!")
 
@@ -3,6 +3,8 @@ Fixtures for testing
 """
 import pytest
 
+from gdoc_summaries.libs import constants, db
+
 
 @pytest.fixture
 def sample_document():
@@ -68,3 +70,14 @@ def no_network_calls():
     socket.socket = guard
     yield
     socket.socket = old_socket
+
+@pytest.fixture(autouse=True)
+def temporary_database(tmp_path, monkeypatch):
+    """Point the DB tools at a fresh database instead of the working directory's summaries.db"""
+    database_path = str(tmp_path / "summaries.db")
+    monkeypatch.setattr(db, "DATABASE_PATH", database_path)
+    # Never write test data to a shared database configured in the environment
+    monkeypatch.setattr(constants, "DATABASE_URL", None)
+    db.setup_database()
+    yield database_path
+    db.close_connection()
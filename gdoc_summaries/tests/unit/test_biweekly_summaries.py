@@ -0,0 +1,157 @@
+"""Unit tests for the biweekly summaries entrypoint"""
+import json
+from unittest.mock import patch
+
+import pytest
+
+import gdoc_summaries.biweekly_summaries as biweekly_summaries
+import gdoc_summaries.libs.constants as constants
+import gdoc_summaries.libs.section_parser as section_parser
+
+
+@pytest.fixture
+def document_infos():
+    return [
+        constants.DocumentInfo(document_id="unchanged", date_published=""),
+        constants.DocumentInfo(document_id="changed", date_published=""),
+        constants.DocumentInfo(document_id="unknown", date_published=""),
+    ]
+
+
+def _fake_documents(service, document_ids, decode=True):
+    return {document_id: json.dumps({"id": document_id, "title": f"Title {document_id}"}) for document_id in document_ids}, {}
+
+
+class TestProcessBiweeklySummaries:
+    @patch('gdoc_summaries.biweekly_summaries.summary_processor')
+    @patch('gdoc_summaries.biweekly_summaries._process_document_sections')
+    @patch('gdoc_summaries.biweekly_summaries.db')
+    @patch('gdoc_summaries.biweekly_summaries.discovery')
+    @patch('gdoc_summaries.biweekly_summaries.gdoc_client')
+    @patch('gdoc_summaries.biweekly_summaries.constants.get_doc_info')
+    @patch('builtins.input', return_value="")
+    def test_only_changed_documents_are_fetched(
+        self, mock_input, mock_doc_info, mock_gdoc, mock_discovery, mock_db, mock_process, mock_processor,
+        document_infos
+    ):
+        # Setup
+        mock_doc_info.return_value = document_infos
+        mock_gdoc.get_revision_metadata.return_value = {
+            "unchanged": constants.DocumentRevision("unchanged", "t1", None),
+            "changed": constants.DocumentRevision("changed", "t3", None),
+        }
+        mock_db.get_document_revisions.return_value = {
+            "unchanged": constants.DocumentRevision("unchanged", "t1", None),
+            "changed": constants.DocumentRevision("changed", "t2", None),
+        }
+        mock_db.get_unsent_sections.return_value = []
+        mock_db.get_document_titles.return_value = {}
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_process.return_value = []
+
+        # Execute
+        biweekly_summaries.process_biweekly_summaries()
+
+        # Verify
+        mock_gdoc.get_documents_from_ids.assert_called_once_with(
+            mock_discovery.build.return_value, ["changed", "unknown"], decode=False
+        )
+        processed = [c.args[2].document_id for c in mock_process.call_args_list]
+        assert processed == ["changed", "unknown"]
+        assert mock_process.call_args.args[:2] == ([], mock_db.get_latest_section_date.return_value)
+        mock_db.save_document_titles.assert_called_once_with({"changed": "Title changed", "unknown": "Title unknown"})
+        mock_db.save_document_revision.assert_called_once_with(
+            constants.DocumentRevision("changed", "t3", None)
+        )
+        mock_processor.send_summaries.assert_not_called()
+
+    @patch('gdoc_summaries.biweekly_summaries.summary_processor')
+    @patch('gdoc_summaries.biweekly_summaries._process_document_sections')
+    @patch('gdoc_summaries.biweekly_summaries.db')
+    @patch('gdoc_summaries.biweekly_summaries.discovery')
+    @patch('gdoc_summaries.biweekly_summaries.gdoc_client')
+    @patch('gdoc_summaries.biweekly_summaries.constants.get_doc_info')
+    @patch('builtins.input', return_value="")
+    def test_documents_are_fetched_at_most_once(
+        self, mock_input, mock_doc_info, mock_gdoc, mock_discovery, mock_db, mock_process, mock_processor,
+        document_infos
+    ):
+        # Setup: "unchanged" has unsent sections and a stored title, "changed" has a new section
+        mock_doc_info.return_value = document_infos[:2]
+        revision = constants.DocumentRevision("unchanged", "t1", None)
+        mock_gdoc.get_revision_metadata.return_value = {"unchanged": revision}
+        mock_db.get_document_revisions.return_value = {"unchanged": revision}
+        mock_db.get_unsent_sections.return_value = [("2024-03-10", "summary")]
+        mock_db.get_document_titles.return_value = {"unchanged": "Stored title"}
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_process.side_effect = lambda sections, last_processed_date, doc_info: [doc_info.document_id]
+
+        # Execute
+        biweekly_summaries.process_biweekly_summaries()
+
+        # Verify
+        mock_gdoc.get_documents_from_ids.assert_called_once_with(
+            mock_discovery.build.return_value, ["changed"], decode=False
+        )
+        summaries, _ = mock_processor.send_summaries.call_args.args
+        assert [(s.document_id, s.title) for s in summaries] == [
+            ("unchanged", "Stored title"),
+            ("changed", "Title changed"),
+        ]
+
+
+class TestProcessDocumentSections:
+    @patch('gdoc_summaries.biweekly_summaries.llm')
+    @patch('gdoc_summaries.biweekly_summaries.db')
+    def test_every_new_section_is_summarized(self, mock_db, mock_llm, biweekly_document):
+        # Setup
+        new_sections = section_parser.extract_sections_since(biweekly_document, "2024-02-16")
+        mock_db.get_unsent_sections.return_value = []
+        mock_llm.generate_llm_summaries.side_effect = lambda contents: [f"summary of {c}" for c in contents]
+        doc_info = constants.DocumentInfo(document_id="doc", date_published="")
+
+        # Execute
+        updated = biweekly_summaries._process_document_sections(new_sections, "2024-02-16", doc_info)
+
+        # Verify
+        assert updated == ["doc"]
+        mock_llm.generate_llm_summaries.assert_called_once_with(["Older update content", "Latest update content"])
+        saved = [(c.kwargs["section_date"], c.kwargs["section_summary"]) for c in mock_db.save_section_to_db.call_args_list]
+        assert saved == [
+            ("2024-03-01", "summary of Older update content"),
+            ("2024-03-15", "summary of Latest update content"),
+        ]
+        mock_db.transaction.assert_called_once()
+
+    @patch('gdoc_summaries.biweekly_summaries.llm')
+    @patch('gdoc_summaries.biweekly_summaries.db')
+    def test_only_the_latest_section_is_summarized_when_nothing_was_processed(self, mock_db, mock_llm, biweekly_document):
+        # Setup: nothing processed yet, so the document's history isn't summarized
+        new_sections = section_parser.extract_sections_since(biweekly_document, None)
+        mock_db.get_unsent_sections.return_value = []
+        mock_llm.generate_llm_summaries.side_effect = lambda contents: [f"summary of {c}" for c in contents]
+        doc_info = constants.DocumentInfo(document_id="doc", date_published="")
+
+        # Execute
+        updated = biweekly_summaries._process_document_sections(new_sections, None, doc_info)
+
+        # Verify
+        assert updated == ["doc"]
+        mock_llm.generate_llm_summaries.assert_called_once_with(["Latest update content"])
+        saved = [(c.kwargs["section_date"], c.kwargs["section_summary"]) for c in mock_db.save_section_to_db.call_args_list]
+        assert saved == [("2024-03-15", "summary of Latest update content")]
+
+    @patch('gdoc_summaries.biweekly_summaries.llm')
+    @patch('gdoc_summaries.biweekly_summaries.db')
+    def test_no_new_sections(self, mock_db, mock_llm, biweekly_document):
+        # Setup
+        new_sections = section_parser.extract_sections_since(biweekly_document, "2024-03-15")
+        mock_db.get_unsent_sections.return_value = []
+        doc_info = constants.DocumentInfo(document_id="doc", date_published="")
+
+        # Execute
+        updated = biweekly_summaries._process_document_sections(new_sections, "2024-03-15", doc_info)
+
+        # Verify
+        assert updated == []
+        mock_llm.generate_llm_summaries.assert_not_called()
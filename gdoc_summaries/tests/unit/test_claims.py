@@ -0,0 +1,51 @@
+"""Unit tests for document claims"""
+import time
+
+import gdoc_summaries.libs.claims as claims
+import gdoc_summaries.libs.db as db
+
+
+class TestDocumentClaims:
+    def test_claims_are_released_on_exit(self):
+        # Execute
+        with claims.DocumentClaims(owner="worker-a") as document_claims:
+            claimed = document_claims.claim(["doc1", "doc2", "doc1"])
+            held_by_other = db.claim_documents(["doc1", "doc3"], "worker-b", lease_seconds=60)
+
+        # Verify
+        assert claimed == ["doc1", "doc2"]
+        assert held_by_other == ["doc3"]
+        assert db.claim_documents(["doc1", "doc2"], "worker-c", lease_seconds=60) == ["doc1", "doc2"]
+
+    def test_claims_are_released_on_error(self):
+        try:
+            with claims.DocumentClaims(owner="worker-a") as document_claims:
+                document_claims.claim(["doc1"])
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+        assert db.claim_documents(["doc1"], "worker-b", lease_seconds=60) == ["doc1"]
+
+    def test_leases_are_renewed_in_the_background(self):
+        # Execute: hold the claim for several lease lengths
+        with claims.DocumentClaims(lease_seconds=0.3, owner="worker-a") as document_claims:
+            document_claims.claim(["doc1"])
+            time.sleep(0.8)
+
+            # Verify
+            assert db.claim_documents(["doc1"], "worker-b", lease_seconds=60) == []
+
+    def test_lost_claims_are_not_held(self):
+        with claims.DocumentClaims(owner="worker-a") as document_claims:
+            # Setup: worker-b took over doc2 after worker-a's lease ran out
+            document_claims.claim(["doc1", "doc2"])
+            db.release_documents(["doc2"], "worker-a")
+            db.claim_documents(["doc2"], "worker-b", lease_seconds=60)
+
+            # Execute
+            held = document_claims.still_held(["doc1", "doc2"])
+
+        # Verify: leaving the block doesn't release worker-b's claim
+        assert held == ["doc1"]
+        assert db.claim_documents(["doc2"], "worker-c", lease_seconds=60) == []
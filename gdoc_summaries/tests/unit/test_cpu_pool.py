@@ -0,0 +1,55 @@
+"""Unit tests for the CPU-bound step process pool"""
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+import gdoc_summaries.libs.constants as constants
+import gdoc_summaries.libs.cpu_pool as cpu_pool
+import gdoc_summaries.libs.gdoc_client as gdoc_client
+import gdoc_summaries.libs.section_parser as section_parser
+
+
+@pytest.fixture
+def process_pool():
+    """Run tasks in a pool of two processes"""
+    with patch.object(constants, "CPU_WORKERS", 2):
+        yield
+        cpu_pool.shutdown()
+
+
+class TestInline:
+    def test_tasks_run_in_this_process_when_disabled(self):
+        assert cpu_pool.submit(os.getpid).result() == os.getpid()
+
+    def test_errors_are_raised_from_the_result(self):
+        future = cpu_pool.submit(json.loads, "{")
+
+        assert future.done()
+        with pytest.raises(json.JSONDecodeError):
+            future.result()
+
+
+class TestProcessPool:
+    def test_tasks_run_in_other_processes(self, process_pool):
+        assert cpu_pool.submit(os.getpid).result() != os.getpid()
+
+    def test_documents_are_read_in_other_processes(self, process_pool, biweekly_document):
+        # Setup
+        response = json.dumps(biweekly_document)
+
+        # Execute
+        title, content = cpu_pool.submit(gdoc_client.read_document, response).result()
+        _, sections = cpu_pool.submit(section_parser.read_sections_since, response, "2024-03-01").result()
+
+        # Verify
+        assert title == "Biweekly Updates"
+        assert content == gdoc_client.extract_document_content(biweekly_document)
+        assert sections == section_parser.extract_sections_since(biweekly_document, "2024-03-01")
+
+    def test_shutdown_starts_a_new_pool_on_next_use(self, process_pool):
+        first = cpu_pool.submit(os.getpid).result()
+        cpu_pool.shutdown()
+
+        assert cpu_pool.submit(os.getpid).result() not in (first, os.getpid())
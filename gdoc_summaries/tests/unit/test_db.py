@@ -0,0 +1,383 @@
+"""Unit tests for the SQLite DB tools"""
+import sqlite3
+import threading
+from unittest.mock import patch
+
+import pytest
+
+import gdoc_summaries.libs.constants as constants
+import gdoc_summaries.libs.db as db
+
+
+@pytest.fixture
+def summary():
+    return constants.Summary(
+        document_id="doc1",
+        title="Doc 1",
+        content="Summary 1",
+        date_published="2024-03-15",
+        summary_type=constants.SummaryType.TDD,
+    )
+
+
+class TestConnection:
+    def test_connection_is_reused(self):
+        assert db.get_connection() is db.get_connection()
+
+    def test_connection_uses_wal(self):
+        assert db.get_connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    def test_database_path_is_honoured(self, temporary_database, summary, tmp_path, monkeypatch):
+        # Setup
+        db.save_summary_to_db(summary)
+        monkeypatch.setattr(db, "DATABASE_PATH", str(tmp_path / "other.db"))
+        db.setup_database()
+
+        # Verify
+        assert db.get_summary_from_db("doc1") is None
+        assert sqlite3.connect(temporary_database).execute("SELECT count(*) FROM summaries").fetchone()[0] == 1
+
+    def test_threads_get_their_own_connection(self):
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(db.get_connection()))
+        thread.start()
+        thread.join()
+        assert connections[0] is not db.get_connection()
+
+
+class TestTransaction:
+    def test_commits_on_success(self, temporary_database, summary):
+        with db.transaction():
+            db.save_summary_to_db(summary)
+            db.mark_summary_as_sent(summary.document_id)
+
+        other = sqlite3.connect(temporary_database)
+        assert other.execute("SELECT sent FROM summaries").fetchall() == [(1,)]
+
+    def test_rolls_back_on_error(self, summary):
+        with pytest.raises(ValueError):
+            with db.transaction():
+                db.save_summary_to_db(summary)
+                raise ValueError("boom")
+
+        assert db.get_summary_from_db(summary.document_id) is None
+
+    def test_nested_failure_only_rolls_back_inner_block(self, summary):
+        with db.transaction():
+            db.save_summary_to_db(summary)
+            with pytest.raises(ValueError):
+                with db.transaction():
+                    db.mark_summary_as_sent(summary.document_id)
+                    raise ValueError("boom")
+
+        assert db.get_summary_from_db(summary.document_id).content == summary.content
+        assert db.get_summary_sent_status(summary.document_id) == 0
+
+
+class TestBulkSummaries:
+    def test_get_summaries_with_sent_status(self, summary):
+        # Setup
+        other = constants.Summary("doc2", "Doc 2", "Summary 2", "2024-03-16", constants.SummaryType.PRD)
+        db.save_summary_to_db(summary)
+        db.save_summary_to_db(other)
+        db.mark_summary_as_sent("doc2")
+
+        # Execute
+        results = db.get_summaries_with_sent_status(["doc1", "doc2", "doc3"])
+
+        # Verify
+        assert set(results) == {"doc1", "doc2"}
+        assert results["doc1"][0].content == "Summary 1"
+        assert results["doc1"][1] == 0
+        assert results["doc2"][0].title == "Doc 2"
+        assert results["doc2"][1] == 1
+
+    def test_mark_summaries_as_sent(self, summary):
+        # Setup
+        document_ids = [f"doc{i}" for i in range(1200)]
+        with db.transaction():
+            for document_id in document_ids:
+                db.save_summary_to_db(constants.Summary(
+                    document_id, "title", "content", "2024-03-15", constants.SummaryType.TDD
+                ))
+
+        # Execute
+        db.mark_summaries_as_sent(document_ids[:1100])
+
+        # Verify
+        statuses = {
+            document_id: sent for document_id, (_, sent) in db.get_summaries_with_sent_status(document_ids).items()
+        }
+        assert sum(statuses.values()) == 1100
+        assert statuses["doc1150"] == 0
+
+
+class TestDocumentRevisions:
+    def test_unknown_documents_have_no_revision(self):
+        assert db.get_document_revisions(["missing"]) == {}
+
+    def test_save_and_update_revision(self):
+        # Setup
+        db.save_document_revision(constants.DocumentRevision("doc1", "2024-03-01T00:00:00Z", None))
+        db.save_document_revision(constants.DocumentRevision("doc2", "2024-03-02T00:00:00Z", "r2"))
+        db.save_document_revision(constants.DocumentRevision("doc1", "2024-03-05T00:00:00Z", None))
+
+        # Execute
+        revisions = db.get_document_revisions(["doc1", "doc2", "doc3"])
+
+        # Verify
+        assert revisions == {
+            "doc1": constants.DocumentRevision("doc1", "2024-03-05T00:00:00Z", None),
+            "doc2": constants.DocumentRevision("doc2", "2024-03-02T00:00:00Z", "r2"),
+        }
+
+    def test_lookup_larger_than_parameter_limit(self):
+        # Setup
+        document_ids = [f"doc{i}" for i in range(1200)]
+        for document_id in document_ids[::100]:
+            db.save_document_revision(constants.DocumentRevision(document_id, "t", None))
+
+        # Execute
+        revisions = db.get_document_revisions(document_ids)
+
+        # Verify
+        assert sorted(revisions) == sorted(document_ids[::100])
+
+
+class TestDocumentTitles:
+    def test_save_and_update_titles(self):
+        # Setup
+        db.save_document_titles({"doc1": "Old title", "doc2": "Doc 2"})
+        db.save_document_titles({"doc1": "New title"})
+
+        # Execute
+        titles = db.get_document_titles(["doc1", "doc2", "doc3"])
+
+        # Verify
+        assert titles == {"doc1": "New title", "doc2": "Doc 2"}
+
+
+class TestEmailOutbox:
+    def test_enqueue_keeps_delivery_state(self):
+        # Setup
+        db.enqueue_emails("batch", ["a@example.com", "b@example.com"])
+        db.record_email_results("batch", [
+            constants.EmailResult("a@example.com", status_code=202, message_id="msg1"),
+            constants.EmailResult("b@example.com", error=RuntimeError("HTTP Error 500")),
+        ])
+
+        # Execute
+        db.enqueue_emails("batch", ["a@example.com", "b@example.com", "c@example.com"])
+
+        # Verify
+        assert db.get_undelivered_emails("batch") == ["b@example.com", "c@example.com"]
+        assert db.get_undelivered_emails("other") == []
+        rows = db.get_connection().execute(
+            "SELECT email_address, status, attempts, message_id, error FROM email_outbox ORDER BY rowid"
+        ).fetchall()
+        assert rows == [
+            ("a@example.com", "SENT", 1, "msg1", None),
+            ("b@example.com", "FAILED", 1, None, "HTTP Error 500"),
+            ("c@example.com", "PENDING", 0, None, None),
+        ]
+
+
+class TestSectionIndexes:
+    @staticmethod
+    def _query_plans(func, *args) -> list[str]:
+        """Run a DB function and return the query plan of every statement it ran"""
+        conn = db.get_connection()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            func(*args)
+        finally:
+            conn.set_trace_callback(None)
+        return [
+            " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}"))
+            for statement in statements
+            if statement.lstrip().upper().startswith(("SELECT", "UPDATE"))
+        ]
+
+    @pytest.mark.parametrize("func", [
+        db.get_latest_section_date,
+        db.get_unsent_sections,
+        db.mark_sections_as_sent,
+    ])
+    def test_section_queries_use_an_index(self, func):
+        # Setup
+        for day in range(1, 11):
+            db.save_section_to_db("doc1", f"2024-03-{day:02d}", "content", "summary")
+
+        # Execute
+        plans = self._query_plans(func, "doc1")
+
+        # Verify
+        assert plans
+        for plan in plans:
+            assert "USING" in plan and "INDEX idx_summary_sections" in plan, plan
+            assert "TEMP B-TREE" not in plan, plan
+
+    def test_summaries_by_type_and_sent_use_an_index(self):
+        plan = " ".join(row[3] for row in db.get_connection().execute(
+            "EXPLAIN QUERY PLAN SELECT document_id FROM summaries WHERE summary_type = ? AND sent = 0", ("TDD",)
+        ))
+
+        assert "INDEX idx_summaries_type_sent" in plan
+
+    def test_duplicate_sections_are_ignored(self):
+        # Setup
+        db.save_section_to_db("doc1", "2024-03-01", "first", "first summary")
+
+        # Execute
+        db.save_section_to_db("doc1", "2024-03-01", "second", "second summary")
+
+        # Verify
+        assert db.get_unsent_sections("doc1") == [("2024-03-01", "first summary")]
+
+    def test_migration_dedupes_existing_sections(self):
+        # Setup: a database from before the unique index, with duplicated sections
+        conn = db.get_connection()
+        conn.execute("DROP INDEX idx_summary_sections_document_date")
+        conn.execute("DROP INDEX idx_summary_sections_document_sent_date")
+        conn.execute("PRAGMA user_version = 6")
+        conn.executemany("""
+            INSERT INTO summary_sections (document_id, section_date, section_summary, sent) VALUES (?, ?, ?, ?)
+        """, [
+            ("doc1", "2024-03-01", "first", 0),
+            ("doc1", "2024-03-01", "second", 1),
+            ("doc1", "2024-03-15", "latest", 0),
+            ("doc1", "2024-03-15", "latest again", 0),
+        ])
+
+        # Execute
+        db.run_migrations()
+
+        # Verify
+        rows = conn.execute(
+            "SELECT section_date, section_summary, sent FROM summary_sections ORDER BY section_date"
+        ).fetchall()
+        assert rows == [("2024-03-01", "first", 1), ("2024-03-15", "latest", 0)]
+
+
+def _schema(path: str) -> dict:
+    """Describe every table's columns and indexes, independently of the SQL that created them"""
+    conn = sqlite3.connect(path)
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )]
+    schema = {}
+    for table in tables:
+        indexes = {
+            name: (unique, [row[2] for row in conn.execute(f"PRAGMA index_info({name})")])
+            for _, name, unique, *_ in conn.execute(f"PRAGMA index_list({table})")
+        }
+        schema[table] = (conn.execute(f"PRAGMA table_info({table})").fetchall(), indexes)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return {"version": version, "tables": schema}
+
+
+class TestMigrations:
+    def test_migrated_schema_matches_latest_schema(self, temporary_database, tmp_path, monkeypatch):
+        # Setup: a database as the first version of the project created it
+        legacy_path = str(tmp_path / "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("""
+            CREATE TABLE summaries (
+                document_id TEXT PRIMARY KEY,
+                title TEXT,
+                summary TEXT,
+                date_published TEXT,
+                sent INTEGER DEFAULT 0
+            )
+        """)
+        conn.execute("INSERT INTO summaries VALUES ('doc1', 'Doc 1', 'Summary 1', '2024-03-15', 1)")
+        conn.commit()
+        conn.close()
+        db.close_connection()
+        monkeypatch.setattr(db, "DATABASE_PATH", legacy_path)
+
+        # Execute
+        db.setup_database()
+        db.close_connection()
+
+        # Verify
+        assert _schema(legacy_path) == _schema(temporary_database)
+        assert _schema(temporary_database)["version"] == db.SCHEMA_VERSION
+        monkeypatch.setattr(db, "DATABASE_PATH", legacy_path)
+        assert db.get_summary_from_db("doc1").summary_type == "TDD"
+
+    def test_up_to_date_database_runs_no_migrations(self):
+        # Setup
+        db.close_connection()
+
+        # Execute
+        with patch.object(db, "_table_exists") as mock_table_exists:
+            db.setup_database()
+
+        # Verify
+        mock_table_exists.assert_not_called()
+        assert db.get_schema_version() == db.SCHEMA_VERSION
+
+    def test_only_pending_migrations_run(self):
+        # Setup
+        db.get_connection().execute(f"PRAGMA user_version = {db.SCHEMA_VERSION - 1}")
+        applied = []
+        migrations = [lambda i=i: applied.append(i) for i in range(db.SCHEMA_VERSION)]
+
+        # Execute
+        with patch.object(db, "_MIGRATIONS", migrations):
+            db.run_migrations()
+
+        # Verify
+        assert applied == [db.SCHEMA_VERSION - 1]
+        assert db.get_schema_version() == db.SCHEMA_VERSION
+
+
+class TestDocumentClaims:
+    def test_claimed_documents_are_skipped_by_other_owners(self):
+        # Setup
+        assert db.claim_documents(["doc1", "doc2"], "worker-a", lease_seconds=60) == ["doc1", "doc2"]
+
+        # Execute
+        claimed = db.claim_documents(["doc2", "doc3", "doc1"], "worker-b", lease_seconds=60)
+
+        # Verify
+        assert claimed == ["doc3"]
+        assert db.claim_documents(["doc1"], "worker-a", lease_seconds=60) == ["doc1"]
+
+    def test_expired_leases_are_reclaimed(self):
+        # Setup
+        db.claim_documents(["doc1"], "worker-a", lease_seconds=60)
+
+        # Execute
+        with patch.object(db.time, "time", return_value=db.time.time() + 120):
+            claimed = db.claim_documents(["doc1"], "worker-b", lease_seconds=60)
+
+        # Verify
+        assert claimed == ["doc1"]
+
+    def test_released_documents_can_be_claimed(self):
+        # Setup
+        db.claim_documents(["doc1", "doc2"], "worker-a", lease_seconds=60)
+
+        # Execute
+        db.release_documents(["doc1"], "worker-a")
+        db.release_documents(["doc2"], "worker-b")
+
+        # Verify
+        assert db.claim_documents(["doc1", "doc2"], "worker-b", lease_seconds=60) == ["doc1"]
+
+    def test_renew_returns_documents_still_held(self):
+        # Setup: worker-b took over doc2 after worker-a's lease ran out
+        db.claim_documents(["doc1", "doc2"], "worker-a", lease_seconds=60)
+        with patch.object(db.time, "time", return_value=db.time.time() + 120):
+            db.claim_documents(["doc2"], "worker-b", lease_seconds=60)
+
+            # Execute
+            held = db.renew_claims(["doc2", "doc1"], "worker-a", lease_seconds=60)
+
+            # Verify
+            assert held == ["doc1"]
+            assert db.claim_documents(["doc1"], "worker-c", lease_seconds=60) == []
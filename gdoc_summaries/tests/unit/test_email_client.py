@@ -4,6 +4,8 @@ from datetime import datetime
 from unittest.mock import MagicMock, patch
 
 import pytest
+import requests
+from sendgrid.helpers.mail import Mail
 
 import gdoc_summaries.libs.constants as constants
 import gdoc_summaries.libs.email_client as email_client
@@ -111,4 +113,191 @@ class TestBuildAndSendEmail:
         )
         
         # Verify
-        mock_sendgrid.assert_called_once_with('test_api_key')
+        mock_sendgrid.assert_called_once_with('test_api_key', host=constants.SENDGRID_HOST)
+
+
+class TestSendGridSession:
+    @pytest.fixture
+    def mock_session(self):
+        with patch('gdoc_summaries.libs.email_client.requests.Session') as mock_session_class:
+            yield mock_session_class.return_value
+
+    @pytest.fixture
+    def message(self):
+        return Mail(from_email="sender@example.com", to_emails="user@example.com", subject="Subject", html_content="<p>Hi</p>")
+
+    def test_messages_are_posted_on_the_shared_session(self, mock_session, message):
+        # Setup
+        sg = email_client.SendGridSession("test_api_key", host="https://sendgrid.example.com/", pool_size=4)
+
+        # Execute
+        response = sg.send(message)
+        sg.send(message)
+
+        # Verify
+        assert response is mock_session.post.return_value
+        mock_session.headers.update.assert_called_once_with({"Authorization": "Bearer test_api_key"})
+        mock_session.post.assert_called_with(
+            "https://sendgrid.example.com/v3/mail/send",
+            json=message.get(),
+            timeout=(constants.SENDGRID_CONNECT_TIMEOUT_SECONDS, constants.SENDGRID_READ_TIMEOUT_SECONDS),
+        )
+        assert mock_session.post.call_count == 2
+        adapter = mock_session.mount.call_args.args[1]
+        assert adapter._pool_maxsize == 4
+
+    def test_error_status_raises(self, mock_session, message):
+        # Setup
+        mock_session.post.return_value.raise_for_status.side_effect = requests.HTTPError("400 Client Error")
+        sg = email_client.SendGridSession("test_api_key")
+
+        # Execute / Verify
+        with pytest.raises(requests.HTTPError, match="400 Client Error"):
+            sg.send(message)
+
+
+class TestSendBulkEmail:
+    @patch('gdoc_summaries.libs.email_client.SendGridSession')
+    @patch('gdoc_summaries.libs.email_client.pyjokes.get_joke')
+    def test_body_is_rendered_once_and_client_reused(self, mock_joke, mock_sendgrid, mock_summaries):
+        # Setup
+        mock_joke.return_value = "Test joke"
+        mock_sendgrid.return_value.send.return_value = MagicMock(status_code=202)
+        recipients = [f"user{i}@example.com" for i in range(5)]
+
+        # Execute
+        results = email_client.send_bulk_email(
+            email_addresses=recipients,
+            summaries=mock_summaries,
+            summary_type=constants.SummaryType.TDD,
+            recipients_per_request=1,
+        )
+
+        # Verify
+        assert [result.email_address for result in results] == recipients
+        assert all(result.ok and result.status_code == 202 for result in results)
+        mock_joke.assert_called_once()
+        mock_sendgrid.assert_called_once()
+        assert mock_sendgrid.return_value.send.call_count == len(recipients)
+        mock_sendgrid.return_value.close.assert_called_once()
+        sent_to = sorted(
+            call.args[0].personalizations[0].tos[0]["email"]
+            for call in mock_sendgrid.return_value.send.call_args_list
+        )
+        assert sent_to == recipients
+
+    @patch('gdoc_summaries.libs.email_client.SendGridSession')
+    def test_failures_are_tracked_per_recipient(self, mock_sendgrid, mock_summaries):
+        # Setup
+        def send(message):
+            if message.personalizations[0].tos[0]["email"] == "bad@example.com":
+                raise Exception("HTTP Error 400: Bad Request")
+            return MagicMock(status_code=202)
+        mock_sendgrid.return_value.send.side_effect = send
+
+        # Execute
+        results = email_client.send_bulk_email(
+            email_addresses=["a@example.com", "bad@example.com", "b@example.com"],
+            summaries=mock_summaries,
+            summary_type=constants.SummaryType.TDD,
+            recipients_per_request=1,
+            max_workers=2,
+        )
+
+        # Verify
+        assert [result.ok for result in results] == [True, False, True]
+        assert str(results[1].error) == "HTTP Error 400: Bad Request"
+        assert results[1].status_code is None
+
+    @patch('gdoc_summaries.libs.email_client.SendGridSession')
+    def test_recipients_are_packed_into_personalizations(self, mock_sendgrid, mock_summaries):
+        # Setup
+        mock_sendgrid.return_value.send.return_value = MagicMock(status_code=202)
+        recipients = [f"user{i}@example.com" for i in range(2500)]
+
+        # Execute
+        results = email_client.send_bulk_email(
+            email_addresses=recipients, summaries=mock_summaries, summary_type=constants.SummaryType.TDD
+        )
+
+        # Verify: each recipient has their own personalization, at most 1000 per request
+        messages = [call.args[0].get() for call in mock_sendgrid.return_value.send.call_args_list]
+        assert sorted(len(message["personalizations"]) for message in messages) == [500, 1000, 1000]
+        assert all(len(p["to"]) == 1 for message in messages for p in message["personalizations"])
+        sent_to = sorted(p["to"][0]["email"] for message in messages for p in message["personalizations"])
+        assert sent_to == sorted(recipients)
+        assert [result.email_address for result in results] == recipients
+        assert all(result.ok for result in results)
+
+    @patch('gdoc_summaries.libs.email_client.SendGridSession')
+    def test_failed_request_fails_its_recipients(self, mock_sendgrid, mock_summaries):
+        # Setup
+        def send(message):
+            emails = [p["to"][0]["email"] for p in message.get()["personalizations"]]
+            if "bad@example.com" in emails:
+                raise Exception("HTTP Error 400: Bad Request")
+            return MagicMock(status_code=202)
+        mock_sendgrid.return_value.send.side_effect = send
+
+        # Execute
+        results = email_client.send_bulk_email(
+            email_addresses=["a@example.com", "bad@example.com", "b@example.com"],
+            summaries=mock_summaries,
+            summary_type=constants.SummaryType.TDD,
+            recipients_per_request=2,
+        )
+
+        # Verify
+        assert [result.ok for result in results] == [False, False, True]
+
+
+    @patch('gdoc_summaries.libs.email_client.SendGridSession')
+    def test_results_are_reported_per_request(self, mock_sendgrid, mock_summaries):
+        # Setup
+        mock_sendgrid.return_value.send.return_value = MagicMock(status_code=202, headers={"X-Message-Id": "msg1"})
+        reported = []
+
+        # Execute
+        results = email_client.send_bulk_email(
+            email_addresses=["a@example.com", "b@example.com", "c@example.com"],
+            summaries=mock_summaries,
+            summary_type=constants.SummaryType.TDD,
+            recipients_per_request=2,
+            on_results=reported.append,
+        )
+
+        # Verify
+        assert sorted(len(request_results) for request_results in reported) == [1, 2]
+        assert all(result.message_id == "msg1" for result in results)
+
+class TestBuildEmailHtml:
+    @patch('gdoc_summaries.libs.email_client.pyjokes.get_joke')
+    def test_renders_summaries_and_joke(self, mock_joke, mock_summaries, expected_email_content):
+        # Execute
+        html = email_client.build_email_html(mock_summaries, joke="{Test joke}")
+
+        # Verify
+        assert html == expected_email_content + "<p>{Test joke}</p>"
+        mock_joke.assert_not_called()
+
+    def test_summary_without_content(self):
+        # Setup
+        summary = constants.Summary("789ghi", "Empty", "", "2024-03-17", constants.SummaryType.TDD)
+
+        # Execute
+        html = email_client.build_email_html([summary], joke="joke")
+
+        # Verify
+        assert "<h3>Empty</h3><p><em>Published: 2024-03-17</em></p><p>Click" in html
+
+    def test_summary_fragments_are_cached(self, mock_summaries):
+        # Setup
+        email_client._render_summary.cache_clear()
+
+        # Execute
+        first = email_client.build_email_html(mock_summaries, joke="joke")
+        second = email_client.build_email_html(mock_summaries, joke="joke")
+
+        # Verify
+        assert first == second
+        assert email_client._render_summary.cache_info().hits == len(mock_summaries)
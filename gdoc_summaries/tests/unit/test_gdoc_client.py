@@ -1,4 +1,5 @@
 """Unit tests for the Google Doc client"""
+import json
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -43,6 +44,9 @@ def mock_document():
         }
     }
 
+def _paragraph(text):
+    return {"paragraph": {"elements": [{"textRun": {"content": text}}]}}
+
 class TestGetCredentials:
     @patch('gdoc_summaries.libs.gdoc_client.auth')
     def test_valid_credentials(self, mock_auth, mock_credentials):
@@ -100,7 +104,20 @@ class TestGetDocumentFromId:
         
         # Verify
         assert result == mock_document
-        mock_service.documents().get.assert_called_with(documentId="test_doc_id")
+        mock_service.documents().get.assert_called_with(
+            documentId="test_doc_id", includeTabsContent=True, fields=gdoc_client.DOCUMENT_TEXT_FIELDS
+        )
+
+    def test_full_document_retrieval(self, mock_document):
+        # Setup
+        mock_service = MagicMock()
+        mock_service.documents().get().execute.return_value = mock_document
+
+        # Execute
+        gdoc_client.get_document_from_id(mock_service, "test_doc_id", fields=None)
+
+        # Verify
+        mock_service.documents().get.assert_called_with(documentId="test_doc_id", includeTabsContent=True)
 
     def test_failed_document_retrieval(self):
         # Setup
@@ -112,6 +129,115 @@ class TestGetDocumentFromId:
             gdoc_client.get_document_from_id(mock_service, "test_doc_id")
 
 
+class FakeBatch:
+    """Stand-in for a googleapiclient BatchHttpRequest"""
+    def __init__(self, callback, responses):
+        self.callback = callback
+        self.responses = responses
+        self.request_ids = []
+
+    def add(self, request, request_id):
+        self.request_ids.append(request_id)
+
+    def execute(self):
+        for request_id in self.request_ids:
+            response = self.responses[request_id]
+            if isinstance(response, Exception):
+                self.callback(request_id, None, response)
+            else:
+                self.callback(request_id, response, None)
+
+
+class TestGetDocumentsFromIds:
+    def test_batches_and_reports_errors(self, mock_document):
+        # Setup
+        responses = {f"doc{i}": dict(mock_document, documentId=f"doc{i}") for i in range(1, 5)}
+        responses["doc3"] = Exception("404 Not Found")
+        batches = []
+        mock_service = MagicMock()
+
+        def new_batch(callback):
+            batches.append(FakeBatch(callback, responses))
+            return batches[-1]
+        mock_service.new_batch_http_request.side_effect = new_batch
+
+        # Execute
+        documents, errors = gdoc_client.get_documents_from_ids(mock_service, list(responses), batch_size=3)
+
+        # Verify
+        assert [batch.request_ids for batch in batches] == [["doc1", "doc2", "doc3"], ["doc4"]]
+        assert sorted(documents) == ["doc1", "doc2", "doc4"]
+        assert documents["doc2"]["documentId"] == "doc2"
+        assert list(errors) == ["doc3"]
+        assert str(errors["doc3"]) == "404 Not Found"
+        mock_service.documents().get.assert_called_with(
+            documentId="doc4", includeTabsContent=True, fields=gdoc_client.DOCUMENT_TEXT_FIELDS
+        )
+
+    def test_documents_can_be_left_undecoded(self, mock_document):
+        # Setup
+        response = json.dumps(mock_document)
+        mock_service = MagicMock()
+        mock_service.new_batch_http_request.side_effect = lambda callback: FakeBatch(callback, {"doc1": response})
+
+        # Execute
+        documents, errors = gdoc_client.get_documents_from_ids(mock_service, ["doc1"], decode=False)
+
+        # Verify
+        assert documents == {"doc1": response} and errors == {}
+        request = mock_service.documents().get.return_value
+        assert request.postproc(MagicMock(), response) == response
+        assert gdoc_client.read_document(response) == (
+            "Test Document", "First paragraph content.\nSecond paragraph content.\n"
+        )
+
+    def test_no_documents(self):
+        mock_service = MagicMock()
+
+        assert gdoc_client.get_documents_from_ids(mock_service, []) == ({}, {})
+        mock_service.new_batch_http_request.assert_not_called()
+
+
+class TestGetRevisionMetadata:
+    def test_batches_and_collects_revisions(self):
+        # Setup
+        responses = {
+            f"doc{i}": {"id": f"doc{i}", "modifiedTime": f"2024-03-0{i}T00:00:00Z"}
+            for i in range(1, 6)
+        }
+        batches = []
+        mock_drive = MagicMock()
+
+        def new_batch(callback):
+            batches.append(FakeBatch(callback, responses))
+            return batches[-1]
+        mock_drive.new_batch_http_request.side_effect = new_batch
+
+        # Execute
+        revisions = gdoc_client.get_revision_metadata(mock_drive, list(responses), batch_size=2)
+
+        # Verify
+        assert [batch.request_ids for batch in batches] == [["doc1", "doc2"], ["doc3", "doc4"], ["doc5"]]
+        assert revisions["doc3"].modified_time == "2024-03-03T00:00:00Z"
+        assert revisions["doc3"].head_revision_id is None
+        mock_drive.files().get.assert_called_with(
+            fileId="doc5", fields="id,modifiedTime,headRevisionId", supportsAllDrives=True
+        )
+
+    def test_failed_lookups_are_left_out(self):
+        # Setup
+        responses = {"doc1": {"modifiedTime": "t1", "headRevisionId": "r1"}, "doc2": Exception("404")}
+        mock_drive = MagicMock()
+        mock_drive.new_batch_http_request.side_effect = lambda callback: FakeBatch(callback, responses)
+
+        # Execute
+        revisions = gdoc_client.get_revision_metadata(mock_drive, ["doc1", "doc2", "doc1"])
+
+        # Verify
+        assert list(revisions) == ["doc1"]
+        assert revisions["doc1"].head_revision_id == "r1"
+
+
 class TestExtractDocumentContent:
     def test_extract_simple_content(self, mock_document):
         # Execute
@@ -179,3 +305,59 @@ class TestExtractDocumentContent:
         # Verify
         expected_content = "Text content.\nMore text.\n"
         assert content == expected_content
+
+
+class TestIterDocumentText:
+    def test_tables_are_read_cell_by_cell(self):
+        # Setup
+        table = {"table": {"tableRows": [
+            {"tableCells": [{"content": [_paragraph("a1\n")]}, {"content": [_paragraph("b1\n")]}]},
+            {"tableCells": [{"content": [{"table": {"tableRows": [
+                {"tableCells": [{"content": [_paragraph("nested\n")]}]}
+            ]}}]}]},
+        ]}}
+        document = {"body": {"content": [_paragraph("before\n"), table, _paragraph("after\n")]}}
+
+        # Execute
+        content = gdoc_client.extract_document_content(document)
+
+        # Verify
+        assert content == "before\na1\nb1\nnested\nafter\n"
+
+    def test_table_of_contents_can_be_skipped(self):
+        # Setup
+        document = {"body": {"content": [
+            {"tableOfContents": {"content": [_paragraph("Heading\n")]}},
+            _paragraph("Heading\n"),
+        ]}}
+
+        # Execute and verify
+        assert gdoc_client.extract_document_content(document) == "Heading\nHeading\n"
+        assert gdoc_client.extract_document_content(document, include_table_of_contents=False) == "Heading\n"
+
+    def test_all_tabs_are_read_in_order(self):
+        # Setup
+        def tab(text, child_tabs=()):
+            return {"documentTab": {"body": {"content": [_paragraph(text)]}}, "childTabs": list(child_tabs)}
+        document = {"tabs": [tab("one\n", [tab("one.a\n", [tab("one.a.i\n")])]), tab("two\n")]}
+
+        # Execute
+        content = gdoc_client.extract_document_content(document)
+
+        # Verify
+        assert content == "one\none.a\none.a.i\ntwo\n"
+
+    def test_text_is_yielded_lazily(self):
+        # Setup
+        document = {"body": {"content": [_paragraph("first\n"), {"paragraph": None}]}}
+
+        # Execute: the malformed second element is never reached
+        runs = gdoc_client.iter_document_text(document)
+
+        # Verify
+        assert next(runs) == "first\n"
+
+    def test_mask_covers_tabs_and_tables(self):
+        assert gdoc_client.DOCUMENT_TEXT_FIELDS.startswith("documentId,title,revisionId,tabs(")
+        assert "childTabs(" in gdoc_client.DOCUMENT_TEXT_FIELDS
+        assert "table(tableRows(tableCells(" in gdoc_client.DOCUMENT_TEXT_FIELDS
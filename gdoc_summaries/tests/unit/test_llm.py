@@ -1,53 +1,274 @@
 """Unit tests for the LLM client"""
-from unittest.mock import MagicMock, patch
+import json
+import time
+from unittest.mock import patch
 
 import pytest
 
 import gdoc_summaries.libs.llm as llm
 
 
-class TestRetryWithBackoff:
-    def test_successful_execution(self):
-        mock_function = MagicMock()
-        mock_function.return_value = "success"
-        
-        decorated = llm.retry_with_backoff(retries=2, backoff_in_seconds=[1, 2])(mock_function)
-        result = decorated()
-        
-        assert result == "success"
-        mock_function.assert_called_once()
-
-    def test_retry_on_failure(self):
-        mock_function = MagicMock()
-        mock_function.side_effect = [ValueError("Error"), ValueError("Error"), "success"]
-        
-        decorated = llm.retry_with_backoff(retries=2, backoff_in_seconds=[0.1, 0.1])(mock_function)
-        result = decorated()
-        
-        assert result == "success"
-        assert mock_function.call_count == 3
-
-    def test_context_length_error_no_retry(self):
-        mock_function = MagicMock()
-        mock_function.side_effect = ValueError("context_length_exceeded error")
-        
-        decorated = llm.retry_with_backoff(retries=2, backoff_in_seconds=[0.1, 0.1])(mock_function)
-        
-        with pytest.raises(ValueError, match="context_length_exceeded error"):
-            decorated()
-        
-        mock_function.assert_called_once()
-
-    def test_max_retries_exceeded(self):
-        mock_function = MagicMock()
-        mock_function.side_effect = ValueError("Error")
-        
-        decorated = llm.retry_with_backoff(retries=2, backoff_in_seconds=[0.1, 0.1])(mock_function)
-        
-        with pytest.raises(ValueError, match="Error"):
-            decorated()
-        
-        assert mock_function.call_count == 3
-
-
-# TODO: Add tests for the LLM client
+class TestSummaryCache:
+    @patch('gdoc_summaries.libs.llm._generate_llm_summary')
+    def test_identical_content_is_only_summarized_once(self, mock_generate):
+        # Setup
+        mock_generate.return_value = "<p>summary</p>"
+        before = llm.get_cache_stats()
+
+        # Execute
+        first = llm.generate_llm_summary("Some document\ncontent.")
+        second = llm.generate_llm_summary("  Some document   content.\n")
+
+        # Verify
+        assert first == second == "<p>summary</p>"
+        mock_generate.assert_called_once_with("Some document\ncontent.")
+        after = llm.get_cache_stats()
+        assert after["hits"] - before["hits"] == 1
+        assert after["misses"] - before["misses"] == 1
+
+    @patch('gdoc_summaries.libs.llm._generate_llm_summary')
+    def test_key_depends_on_prompt_and_model(self, mock_generate):
+        # Setup
+        mock_generate.return_value = "<p>summary</p>"
+        llm.generate_llm_summary("content")
+
+        # Execute
+        with patch.object(llm.constants, "AZURE_MODEL_ENGINE", "another-model"):
+            llm.generate_llm_summary("content")
+        with patch.object(llm, "SUMMARY_PROMPT", "Another prompt:\n"):
+            llm.generate_llm_summary("content")
+
+        # Verify
+        assert mock_generate.call_count == 3
+
+    @patch('gdoc_summaries.libs.llm._generate_llm_summary')
+    def test_key_depends_on_chunking(self, mock_generate):
+        # Setup
+        mock_generate.return_value = "<p>summary</p>"
+        llm.generate_llm_summary("content")
+
+        # Execute
+        with patch.object(llm, "CHUNK_SUMMARY_PROMPT", "Another chunk prompt:\n"):
+            llm.generate_llm_summary("content")
+        with patch.object(llm, "MERGE_SUMMARY_PROMPT", "Another merge prompt:\n"):
+            llm.generate_llm_summary("content")
+        with patch.object(llm.constants, "LLM_CHUNK_TOKENS", 8_000):
+            llm.generate_llm_summary("content")
+        with patch.object(llm.constants, "LLM_MAX_INPUT_TOKENS", 50_000):
+            llm.generate_llm_summary("content")
+        with patch.object(llm.constants, "LLM_CHUNK_SUMMARY_MAX_TOKENS", 400):
+            llm.generate_llm_summary("content")
+        llm.generate_llm_summary("content")
+
+        # Verify
+        assert mock_generate.call_count == 6
+
+    @patch('gdoc_summaries.libs.llm._generate_llm_summary')
+    def test_entries_are_evicted_by_size(self, mock_generate):
+        # Setup
+        mock_generate.side_effect = lambda content: f"<p>{content}</p>"
+
+        # Execute
+        with patch.object(llm.constants, "LLM_CACHE_MAX_ENTRIES", 2):
+            for content in ["one", "two", "three"]:
+                llm.generate_llm_summary(content)
+            llm.generate_llm_summary("one")
+
+        # Verify
+        assert mock_generate.call_count == 4
+
+    def test_entries_expire_by_age(self):
+        # Setup
+        with patch('gdoc_summaries.libs.db.time.time', return_value=1_000):
+            llm.db.save_cached_llm_response("key", "<p>old</p>")
+
+        # Execute and verify
+        with patch('gdoc_summaries.libs.db.time.time', return_value=1_000 + 59):
+            assert llm.db.get_cached_llm_response("key", max_age_seconds=60) == "<p>old</p>"
+        with patch('gdoc_summaries.libs.db.time.time', return_value=1_000 + 61):
+            assert llm.db.get_cached_llm_response("key", max_age_seconds=60) is None
+            assert llm.db.evict_llm_cache(max_entries=10, max_age_seconds=60) == 1
+
+    def test_empty_content_is_rejected(self):
+        with pytest.raises(ValueError, match="No content"):
+            llm.generate_llm_summary("  \n")
+
+
+class TestSplitIntoChunks:
+    def test_small_text_is_one_chunk(self):
+        assert llm._split_into_chunks("short text", max_tokens=100) == ["short text"]
+
+    def test_splits_on_paragraphs_first(self):
+        paragraphs = [f"Paragraph {i} " + "word " * 30 for i in range(10)]
+        text = "\n\n".join(paragraphs)
+
+        chunks = llm._split_into_chunks(text, max_tokens=100)
+
+        assert len(chunks) > 1
+        assert all(llm._estimate_tokens(chunk) <= 100 for chunk in chunks)
+        assert "\n\n".join(chunks) == text
+        assert all(chunk.startswith("Paragraph") for chunk in chunks)
+
+    def test_oversized_paragraph_falls_back_to_finer_boundaries(self):
+        text = ". ".join(f"Sentence {i} " + "word " * 10 for i in range(50))
+
+        chunks = llm._split_into_chunks(text, max_tokens=50)
+
+        assert all(llm._estimate_tokens(chunk) <= 50 for chunk in chunks)
+        assert all(chunk.startswith("Sentence") for chunk in chunks)
+
+    def test_unbreakable_text_is_hard_split(self):
+        chunks = llm._split_into_chunks("x" * 1000, max_tokens=50)
+
+        assert "".join(chunks) == "x" * 1000
+        assert all(llm._estimate_tokens(chunk) <= 51 for chunk in chunks)
+
+
+def _structured(tldr="tldr", summary="summary"):
+    return json.dumps({"tldr": tldr, "summary": summary})
+
+
+class TestSummarize:
+    @patch('gdoc_summaries.libs.llm._chat_completion')
+    def test_small_content_uses_one_request(self, mock_completion):
+        mock_completion.return_value = _structured("One sentence.", "**Key** points")
+
+        assert llm._summarize("content") == ("One sentence.", "**Key** points")
+        mock_completion.assert_called_once_with(llm.SUMMARY_WITH_TLDR_PROMPT + "content", max_tokens=650)
+
+    @patch('gdoc_summaries.libs.llm._chat_completion')
+    @patch.object(llm.constants, "LLM_MAX_INPUT_TOKENS", 100)
+    @patch.object(llm.constants, "LLM_CHUNK_TOKENS", 100)
+    def test_large_content_is_summarized_in_chunks(self, mock_completion):
+        # Setup
+        def fake_completion(prompt, max_tokens):
+            if prompt.startswith(llm.SUMMARY_WITH_TLDR_PROMPT):
+                return _structured("final tldr", "final")
+            return "partial"
+        mock_completion.side_effect = fake_completion
+        content = "\n\n".join(f"Paragraph {i} " + "word " * 50 for i in range(6))
+
+        # Execute
+        result = llm._summarize(content)
+
+        # Verify
+        assert result == ("final tldr", "final")
+        prompts = [c.args[0] for c in mock_completion.call_args_list]
+        chunk_prompts = [p for p in prompts if p.startswith("The following text is part")]
+        assert len(chunk_prompts) == 6
+        assert "part 1 of 6" in " ".join(chunk_prompts)
+        assert prompts[-1].startswith(llm.SUMMARY_WITH_TLDR_PROMPT)
+
+    @patch('gdoc_summaries.libs.llm._chat_completion')
+    @patch.object(llm.constants, "LLM_MAX_INPUT_TOKENS", 100)
+    @patch.object(llm.constants, "LLM_CHUNK_TOKENS", 100)
+    def test_partial_summaries_are_reduced_hierarchically(self, mock_completion):
+        # Setup: every partial summary is large enough that they need merging
+        def fake_completion(prompt, max_tokens):
+            if prompt.startswith(llm.SUMMARY_WITH_TLDR_PROMPT):
+                return _structured()
+            return "summary " * 20
+        mock_completion.side_effect = fake_completion
+        content = "\n\n".join("word " * 50 for _ in range(20))
+
+        # Execute
+        llm._summarize(content)
+
+        # Verify
+        prompts = [c.args[0] for c in mock_completion.call_args_list]
+        assert any(p.startswith(llm.MERGE_SUMMARY_PROMPT) for p in prompts)
+        assert llm._estimate_tokens(prompts[-1]) <= 100 + llm._estimate_tokens(llm.SUMMARY_WITH_TLDR_PROMPT)
+
+    @patch('gdoc_summaries.libs.llm._chat_completion')
+    def test_context_length_error_falls_back_to_chunks(self, mock_completion):
+        # Setup
+        def fake_completion(prompt, max_tokens):
+            if prompt == llm.SUMMARY_WITH_TLDR_PROMPT + content:
+                raise RuntimeError("Error in LLM request: 400, context_length_exceeded")
+            return _structured()
+        mock_completion.side_effect = fake_completion
+        content = "\n\n".join("word " * 50 for _ in range(4))
+
+        # Execute
+        result = llm._summarize(content)
+
+        # Verify
+        assert result == ("tldr", "summary")
+        assert mock_completion.call_count > 2
+
+    @patch('gdoc_summaries.libs.llm._chat_completion')
+    def test_unparseable_answer_falls_back_to_two_requests(self, mock_completion):
+        mock_completion.side_effect = ["not json", "plain summary", "plain tldr"]
+
+        assert llm._summarize("content") == ("plain tldr", "plain summary")
+        prompts = [c.args[0] for c in mock_completion.call_args_list]
+        assert prompts == [
+            llm.SUMMARY_WITH_TLDR_PROMPT + "content",
+            llm.SUMMARY_PROMPT + "content",
+            llm.TLDR_PROMPT + "plain summary",
+        ]
+
+
+class TestParseSummaryWithTldr:
+    def test_plain_json(self):
+        assert llm._parse_summary_with_tldr(_structured(" A. ", "B\n")) == ("A.", "B")
+
+    def test_fenced_json(self):
+        assert llm._parse_summary_with_tldr("```json\n" + _structured() + "\n```") == ("tldr", "summary")
+
+    @pytest.mark.parametrize("response", [
+        "The summary is ...",
+        "[]",
+        json.dumps({"summary": "only a summary"}),
+        json.dumps({"tldr": "", "summary": "empty tldr"}),
+        json.dumps({"tldr": 1, "summary": "wrong type"}),
+    ])
+    def test_unusable_answers(self, response):
+        assert llm._parse_summary_with_tldr(response) is None
+
+
+class TestGenerateLlmSummary:
+    @patch('gdoc_summaries.libs.llm._chat_completion')
+    def test_html_output_format(self, mock_completion):
+        mock_completion.return_value = _structured("Short version.", "The **long** version.")
+
+        html = llm.generate_llm_summary("content")
+
+        assert html == (
+            "<p><strong>TLDR:</strong> Short version.</p>\n"
+            "<p><strong>Full Summary:</strong> The <strong>long</strong> version.</p>"
+        )
+        mock_completion.assert_called_once()
+
+
+class TestGenerateLlmSummaries:
+    @patch('gdoc_summaries.libs.llm._generate_llm_summary')
+    def test_summaries_keep_input_order(self, mock_generate):
+        # Setup: the first content finishes last
+        def slow_summary(content):
+            time.sleep(0.05 if content == "first" else 0)
+            return f"summary of {content}"
+        mock_generate.side_effect = slow_summary
+
+        # Execute
+        summaries = llm.generate_llm_summaries(["first", "second", "third"])
+
+        # Verify
+        assert summaries == ["summary of first", "summary of second", "summary of third"]
+
+    @patch('gdoc_summaries.libs.llm._generate_llm_summary')
+    def test_failure_is_raised_after_others_are_cached(self, mock_generate):
+        # Setup
+        def failing_summary(content):
+            if content == "second":
+                raise RuntimeError("Error in LLM request: 500")
+            return f"summary of {content}"
+        mock_generate.side_effect = failing_summary
+
+        # Execute and verify
+        with pytest.raises(RuntimeError, match="500"):
+            llm.generate_llm_summaries(["first", "second", "third"])
+
+        mock_generate.reset_mock()
+        assert llm.generate_llm_summary("third") == "summary of third"
+        mock_generate.assert_not_called()
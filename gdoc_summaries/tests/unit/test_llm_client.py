@@ -0,0 +1,279 @@
+"""Unit tests for the Azure OpenAI client"""
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from azure.core.credentials import AccessToken
+
+import gdoc_summaries.libs.llm_client as llm_client
+
+
+class TestTokenProvider:
+    @patch('gdoc_summaries.libs.llm_client.time.time', return_value=1_000)
+    @patch('gdoc_summaries.libs.llm_client.DefaultAzureCredential')
+    def test_token_is_cached_until_close_to_expiry(self, mock_credential, mock_time):
+        # Setup
+        mock_credential.return_value.get_token.return_value = AccessToken("token-1", 1_000 + 3600)
+        provider = llm_client._TokenProvider("scope")
+
+        # Execute
+        tokens = [provider.get_token() for _ in range(5)]
+
+        # Verify
+        assert tokens == ["token-1"] * 5
+        mock_credential.assert_called_once()
+        mock_credential.return_value.get_token.assert_called_once_with("scope")
+
+    @patch('gdoc_summaries.libs.llm_client.time.time')
+    @patch('gdoc_summaries.libs.llm_client.DefaultAzureCredential')
+    def test_token_is_refreshed_in_background_before_expiry(self, mock_credential, mock_time):
+        # Setup
+        mock_time.return_value = 1_000
+        mock_credential.return_value.get_token.side_effect = [
+            AccessToken("token-1", 1_000 + 3600),
+            AccessToken("token-2", 1_000 + 7200),
+        ]
+        provider = llm_client._TokenProvider("scope", refresh_margin=300, min_validity=60)
+        provider.get_token()
+
+        # Execute: inside the refresh margin but still valid
+        mock_time.return_value = 1_000 + 3600 - 200
+        token = provider.get_token()
+        provider._refresh_thread.join()
+
+        # Verify
+        assert token == "token-1"
+        assert provider.get_token() == "token-2"
+
+    @patch('gdoc_summaries.libs.llm_client.time.time')
+    @patch('gdoc_summaries.libs.llm_client.DefaultAzureCredential')
+    def test_expiring_token_is_refreshed_synchronously(self, mock_credential, mock_time):
+        # Setup
+        mock_time.return_value = 1_000
+        mock_credential.return_value.get_token.side_effect = [
+            AccessToken("token-1", 1_000 + 3600),
+            AccessToken("token-2", 1_000 + 7200),
+        ]
+        provider = llm_client._TokenProvider("scope", refresh_margin=300, min_validity=60)
+        provider.get_token()
+
+        # Execute
+        mock_time.return_value = 1_000 + 3600 - 30
+
+        # Verify
+        assert provider.get_token() == "token-2"
+
+    @patch('gdoc_summaries.libs.llm_client.DefaultAzureCredential')
+    def test_concurrent_callers_share_one_fetch(self, mock_credential):
+        # Setup
+        fetched = threading.Event()
+
+        def slow_get_token(scope):
+            fetched.wait(0.05)
+            return AccessToken("token", 2**40)
+        mock_credential.return_value.get_token.side_effect = slow_get_token
+        provider = llm_client._TokenProvider("scope")
+
+        # Execute
+        threads = [threading.Thread(target=provider.get_token) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Verify
+        mock_credential.return_value.get_token.assert_called_once()
+
+
+@pytest.fixture
+def token_provider():
+    provider = MagicMock()
+    provider.get_token.return_value = "test-token"
+    return provider
+
+
+@pytest.fixture
+def rate_limiter():
+    return llm_client.RateLimiter(sleep=MagicMock())
+
+
+def _response(status_code, json_body=None, text="", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = json_body
+    response.text = text
+    response.headers = headers or {}
+    return response
+
+
+def _completion(content="answer"):
+    return _response(200, {"choices": [{"message": {"content": content}}]})
+
+
+class TestAzureOpenAIClient:
+    def test_completion_goes_through_pooled_session(self, token_provider, rate_limiter):
+        # Setup
+        client = llm_client.AzureOpenAIClient(
+            api_base="https://example.openai.azure.com/",
+            deployment="gpt-test",
+            api_version="2024-01-01",
+            pool_size=4,
+            connect_timeout=1,
+            read_timeout=2,
+            token_provider=token_provider,
+            rate_limiter=rate_limiter,
+        )
+        client._session.post = MagicMock(return_value=_response(
+            200, {"choices": [{"message": {"content": "  answer \n"}}]}
+        ))
+
+        # Execute
+        result = client.chat_completion(messages=[{"role": "user", "content": "hi"}], max_tokens=10)
+
+        # Verify
+        assert result == "answer"
+        client._session.post.assert_called_once_with(
+            "https://example.openai.azure.com/openai/deployments/gpt-test/chat/completions"
+            "?api-version=2024-01-01",
+            headers={"Content-Type": "application/json", "Authorization": "Bearer test-token"},
+            json={"messages": [{"role": "user", "content": "hi"}], "max_tokens": 10},
+            timeout=(1, 2),
+        )
+
+    def test_pool_size_is_configured(self, token_provider):
+        client = llm_client.AzureOpenAIClient(pool_size=7, token_provider=token_provider)
+
+        adapter = client._session.get_adapter("https://example.openai.azure.com/")
+        assert adapter._pool_maxsize == 7
+        assert adapter._pool_block is True
+
+    @patch('gdoc_summaries.libs.llm_client.time.sleep')
+    def test_non_retryable_error_raises_immediately(self, mock_sleep, token_provider, rate_limiter):
+        client = llm_client.AzureOpenAIClient(token_provider=token_provider, rate_limiter=rate_limiter)
+        client._session.post = MagicMock(return_value=_response(400, text="context_length_exceeded"))
+
+        with pytest.raises(llm_client.LLMRequestError, match="400, context_length_exceeded") as excinfo:
+            client.chat_completion(messages=[], max_tokens=10)
+
+        assert excinfo.value.status_code == 400
+        client._session.post.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch('gdoc_summaries.libs.llm_client.random.uniform', return_value=0)
+    @patch('gdoc_summaries.libs.llm_client.time.sleep')
+    def test_server_errors_are_retried_with_backoff(self, mock_sleep, mock_uniform, token_provider, rate_limiter):
+        # Setup
+        client = llm_client.AzureOpenAIClient(
+            token_provider=token_provider, rate_limiter=rate_limiter, backoff_base=2, backoff_max=60
+        )
+        client._session.post = MagicMock(side_effect=[
+            _response(500), _response(503), requests.ConnectionError("reset"), _completion(),
+        ])
+
+        # Execute
+        result = client.chat_completion(messages=[{"role": "user", "content": "hi"}], max_tokens=10)
+
+        # Verify
+        assert result == "answer"
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [1, 2, 4]
+
+    @patch('gdoc_summaries.libs.llm_client.time.sleep')
+    def test_retries_run_out(self, mock_sleep, token_provider, rate_limiter):
+        client = llm_client.AzureOpenAIClient(
+            token_provider=token_provider, rate_limiter=rate_limiter, max_retries=2
+        )
+        client._session.post = MagicMock(return_value=_response(502, text="bad gateway"))
+
+        with pytest.raises(llm_client.LLMRequestError, match="502"):
+            client.chat_completion(messages=[], max_tokens=10)
+
+        assert client._session.post.call_count == 3
+
+    @patch('gdoc_summaries.libs.llm_client.time.sleep')
+    def test_throttling_honours_retry_after_for_all_callers(self, mock_sleep, token_provider):
+        # Setup
+        clock = MagicMock(return_value=100.0)
+        limiter_sleep = MagicMock(side_effect=lambda seconds: clock.configure_mock(
+            return_value=clock.return_value + seconds
+        ))
+        rate_limiter = llm_client.RateLimiter(clock=clock, sleep=limiter_sleep)
+        client = llm_client.AzureOpenAIClient(token_provider=token_provider, rate_limiter=rate_limiter)
+        client._session.post = MagicMock(side_effect=[
+            _response(429, headers={"retry-after-ms": "7500"}), _completion(),
+        ])
+
+        # Execute
+        result = client.chat_completion(messages=[], max_tokens=10)
+
+        # Verify
+        assert result == "answer"
+        limiter_sleep.assert_called_once_with(7.5)
+        mock_sleep.assert_not_called()
+
+    def test_client_is_shared(self):
+        assert llm_client.get_client() is llm_client.get_client()
+
+
+class TestRetryAfter:
+    @pytest.mark.parametrize("headers,expected", [
+        ({}, None),
+        ({"retry-after": "12"}, 12),
+        ({"retry-after-ms": "1500", "retry-after": "2"}, 1.5),
+        ({"retry-after": "soon"}, None),
+    ])
+    def test_parsing(self, headers, expected):
+        assert llm_client._retry_after_seconds(headers) == expected
+
+    def test_http_date(self):
+        with patch('gdoc_summaries.libs.llm_client.time.time', return_value=784111787):
+            assert llm_client._retry_after_seconds({"retry-after": "Sun, 06 Nov 1994 08:49:57 GMT"}) == 10
+
+
+class TestRateLimiter:
+    @pytest.fixture
+    def clock(self):
+        return MagicMock(return_value=1_000.0)
+
+    @pytest.fixture
+    def sleep(self, clock):
+        return MagicMock(side_effect=lambda seconds: clock.configure_mock(return_value=clock.return_value + seconds))
+
+    def test_no_wait_without_budget_information(self, clock, sleep):
+        limiter = llm_client.RateLimiter(clock=clock, sleep=sleep)
+
+        for _ in range(100):
+            limiter.acquire(estimated_tokens=1_000)
+
+        sleep.assert_not_called()
+
+    def test_waits_for_the_window_when_tokens_run_out(self, clock, sleep):
+        # Setup
+        limiter = llm_client.RateLimiter(window_seconds=60, clock=clock, sleep=sleep)
+        limiter.update({"x-ratelimit-remaining-requests": "10", "x-ratelimit-remaining-tokens": "1500"})
+
+        # Execute
+        limiter.acquire(estimated_tokens=1_000)
+        clock.return_value += 20
+        limiter.acquire(estimated_tokens=1_000)
+
+        # Verify
+        sleep.assert_called_once_with(40)
+
+    def test_waits_when_requests_run_out(self, clock, sleep):
+        limiter = llm_client.RateLimiter(window_seconds=60, clock=clock, sleep=sleep)
+        limiter.update({"x-ratelimit-remaining-requests": "1"})
+
+        limiter.acquire(estimated_tokens=10)
+        limiter.acquire(estimated_tokens=10)
+
+        sleep.assert_called_once_with(60)
+
+    def test_pause_holds_back_every_caller(self, clock, sleep):
+        limiter = llm_client.RateLimiter(clock=clock, sleep=sleep)
+
+        limiter.pause(5)
+        limiter.pause(2)
+        limiter.acquire(estimated_tokens=10)
+
+        sleep.assert_called_once_with(5)
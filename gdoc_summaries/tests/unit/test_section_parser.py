@@ -2,6 +2,11 @@
 Unit tests for section_parser.py
 """
 
+import json
+from unittest.mock import patch
+
+import pytest
+
 from gdoc_summaries.libs import constants, section_parser
 
 
@@ -19,3 +24,111 @@ def test_extract_latest_section_empty_document():
     empty_doc = {"body": {"content": []}}
     result = section_parser.extract_latest_section(empty_doc)
     assert result is None
+
+def test_extract_latest_section_ignores_table_of_contents():
+    """Test that headers repeated in a table of contents don't count as sections"""
+    def paragraph(text):
+        return {"paragraph": {"elements": [{"textRun": {"content": text}}]}}
+    document = {"tabs": [{"documentTab": {"body": {"content": [
+        {"tableOfContents": {"content": [paragraph("--- UPDATE 2024-03-15 ---\n")]}},
+        paragraph("--- UPDATE 2024-03-15 ---\n"),
+        paragraph("Latest update content\n"),
+    ]}}}]}
+
+    result = section_parser.extract_latest_section(document)
+
+    assert result.content == "Latest update content"
+
+def test_extract_sections_since(biweekly_document):
+    """Test that only sections newer than the given date are returned, oldest first"""
+    result = section_parser.extract_sections_since(biweekly_document, "2024-03-01")
+
+    assert [section.section_date for section in result] == ["2024-03-15"]
+    assert result[0].content == "Latest update content"
+
+def test_extract_sections_since_without_date(biweekly_document):
+    """Test that every section is returned when nothing was processed yet"""
+    result = section_parser.extract_sections_since(biweekly_document, None)
+
+    assert [section.section_date for section in result] == ["2024-03-01", "2024-03-15"]
+    assert result[0].raw_content == "--- UPDATE 2024-03-01 ---\nOlder update content\n"
+
+def _document_of_runs(*runs):
+    return {"body": {"content": [{"paragraph": {"elements": [{"textRun": {"content": run}} for run in runs]}}]}}
+
+def test_extract_sections_since_delimiters_split_across_runs():
+    """Test that delimiters are found when they span text runs, including their trailing whitespace"""
+    document = _document_of_runs("Intro\n--", "- UPD", "ATE 2024-03-01 --", "-", "\n", "\nOlder\n--- UPDATE 2024-03-15 ---", "\nNewer\n")
+
+    result = section_parser.extract_sections_since(document, None)
+
+    assert [section.raw_content for section in result] == [
+        "--- UPDATE 2024-03-01 ---\n\nOlder\n", "--- UPDATE 2024-03-15 ---\nNewer\n"
+    ]
+    assert [section.content for section in result] == ["Older", "Newer"]
+
+def test_extract_sections_since_delimiters_split_across_chunks():
+    """Test that delimiters straddling the chunks the text is searched in are found"""
+    chunk_chars = section_parser._READ_CHUNK_CHARS
+    newer_delimiter = "--- UPDATE 2024-03-15 ---"
+    document = _document_of_runs(
+        "x" * (chunk_chars - 2), "--", "- UPDATE 2024-03-01 ---\nOlder\n", "y" * chunk_chars,
+        "z" * (chunk_chars - len(newer_delimiter)), newer_delimiter, "\nNewer\n",
+    )
+
+    result = section_parser.extract_sections_since(document, None)
+
+    assert [section.section_date for section in result] == ["2024-03-01", "2024-03-15"]
+    assert result[0].content == "Older\n" + "y" * chunk_chars + "z" * (chunk_chars - len(newer_delimiter))
+    assert result[1].raw_content == newer_delimiter + "\nNewer\n"
+
+def _chunk_per_section_runs(dates):
+    """Text runs with one section each, long enough to be read one at a time"""
+    return iter([f"--- UPDATE {date} ---\n" + "x" * section_parser._READ_CHUNK_CHARS for date in dates])
+
+def test_extract_sections_since_stops_at_old_sections_when_newest_first():
+    """Test that a newest-first document is only read up to the first section already processed"""
+    runs = _chunk_per_section_runs(["2024-04-12", "2024-03-29", "2024-03-15", "2024-03-01", "2024-02-16"])
+
+    with patch.object(section_parser.gdoc_client, "iter_document_text", return_value=runs):
+        result = section_parser.extract_sections_since({}, "2024-03-15")
+
+    assert [section.section_date for section in result] == ["2024-03-29", "2024-04-12"]
+    assert len(list(runs)) == 1
+
+def test_extract_sections_since_reads_oldest_first_documents_to_the_end():
+    """Test that an oldest-first document, whose new sections come last, is read in full"""
+    runs = _chunk_per_section_runs(["2024-03-01", "2024-03-15", "2024-03-29", "2024-04-12"])
+
+    with patch.object(section_parser.gdoc_client, "iter_document_text", return_value=runs):
+        result = section_parser.extract_sections_since({}, "2024-03-15")
+
+    assert [section.section_date for section in result] == ["2024-03-29", "2024-04-12"]
+
+def test_extract_latest_section_stops_early_when_newest_first():
+    """Test that only the first sections of a newest-first document are read"""
+    runs = _chunk_per_section_runs(["2024-03-29", "2024-03-29", "2024-03-15", "2024-03-01", "2024-02-16"])
+
+    with patch.object(section_parser.gdoc_client, "iter_document_text", return_value=runs):
+        result = section_parser.extract_latest_section({})
+
+    assert result.section_date == "2024-03-29"
+    assert result.raw_content == "--- UPDATE 2024-03-29 ---\n" + "x" * section_parser._READ_CHUNK_CHARS
+    assert len(list(runs)) == 1
+
+def test_read_sections_since(biweekly_document):
+    """Test that an undecoded response is decoded into its title and new sections"""
+    result = section_parser.read_sections_since(json.dumps(biweekly_document), "2024-03-01")
+
+    assert result == (
+        biweekly_document["title"], section_parser.extract_sections_since(biweekly_document, "2024-03-01")
+    )
+
+def test_extract_sections_since_skips_invalid_old_dates():
+    """Test that only returned sections have their dates checked"""
+    document = {"body": {"content": [{"paragraph": {"elements": [
+        {"textRun": {"content": "--- UPDATE 2024-02-30 ---\nOld\n--- UPDATE 2024-13-01 ---\nNew\n"}}
+    ]}}]}}
+
+    with pytest.raises(ValueError, match="2024-13-01"):
+        section_parser.extract_sections_since(document, "2024-03-01")
@@ -0,0 +1,313 @@
+"""Unit tests for the shared database storage
+
+The tests run against a SQLite file and an in-memory SQLite database through SQLAlchemy. Set GDOC_SUMMARIES_TEST_DATABASE_URL to a
+disposable database, e.g. a local Postgres container, to run them against it as well.
+"""
+import inspect
+import os
+import socket
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import sqlalchemy as sa
+
+import gdoc_summaries.libs.constants as constants
+import gdoc_summaries.libs.db as db
+import gdoc_summaries.libs.sql_storage as sql_storage
+
+_TEST_DATABASE_URL = os.environ.get("GDOC_SUMMARIES_TEST_DATABASE_URL")
+
+# The real socket, from before the no_network_calls fixture replaces it
+_SOCKET = socket.socket
+
+
+@pytest.fixture(params=["sqlite", "memory", "external"])
+def storage(request, tmp_path, monkeypatch):
+    """Point the DB tools at a fresh shared database"""
+    if request.param == "sqlite":
+        url = f"sqlite:///{tmp_path / 'shared.db'}"
+    elif request.param == "memory":
+        url = "sqlite://"
+    elif _TEST_DATABASE_URL:
+        url = _TEST_DATABASE_URL
+        monkeypatch.setattr(socket, "socket", _SOCKET)
+    else:
+        pytest.skip("GDOC_SUMMARIES_TEST_DATABASE_URL is not set")
+
+    monkeypatch.setattr(constants, "DATABASE_URL", url)
+    storage = db.get_shared_storage()
+    storage.drop_tables()
+    storage.setup_database()
+    yield storage
+    storage.drop_tables()
+    storage.engine.dispose()
+    db._SHARED_STORAGES.pop(url)
+
+
+@pytest.fixture
+def summary():
+    return constants.Summary(
+        document_id="doc1",
+        title="Doc 1",
+        content="Summary 1",
+        date_published="2024-03-15",
+        summary_type=constants.SummaryType.TDD,
+    )
+
+
+def test_every_dispatched_function_has_a_storage_method():
+    dispatched = [
+        name for name, func in inspect.getmembers(db, inspect.isfunction)
+        if getattr(func, "__wrapped__", None) is not None and func.__module__ == db.__name__
+    ]
+    assert "save_summary_to_db" in dispatched
+    for name in dispatched:
+        assert callable(getattr(sql_storage.SQLAlchemyStorage, name, None)), name
+
+
+def test_unsupported_database_is_rejected():
+    with pytest.raises(ValueError, match="Unsupported database"):
+        sql_storage.SQLAlchemyStorage(SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+
+
+class TestSetup:
+    def test_setup_creates_schema(self, storage):
+        assert db.get_schema_version() == sql_storage.SCHEMA_VERSION
+        assert set(sa.inspect(storage.engine).get_table_names()) >= set(sql_storage.METADATA.tables)
+
+    def test_local_database_is_not_used(self, storage, summary):
+        db.save_summary_to_db(summary)
+        assert db.get_connection().execute("SELECT count(*) FROM summaries").fetchone()[0] == 0
+
+    def test_drop_tables_keeps_llm_cache(self, storage, summary):
+        # Setup
+        db.save_summary_to_db(summary)
+        db.save_cached_llm_response("key", "cached")
+
+        # Execute
+        db.drop_tables()
+        db.setup_database()
+
+        # Verify
+        assert db.get_summary_from_db("doc1") is None
+        assert db.get_cached_llm_response("key", max_age_seconds=60) == "cached"
+
+
+class TestTransaction:
+    def test_rolls_back_on_error(self, storage, summary):
+        with pytest.raises(ValueError):
+            with db.transaction():
+                db.save_summary_to_db(summary)
+                raise ValueError("boom")
+
+        assert db.get_summary_from_db(summary.document_id) is None
+
+    def test_nested_failure_only_rolls_back_inner_block(self, storage, summary):
+        with db.transaction():
+            db.save_summary_to_db(summary)
+            with pytest.raises(ValueError):
+                with db.transaction():
+                    db.mark_summary_as_sent(summary.document_id)
+                    raise ValueError("boom")
+
+        assert db.get_summary_from_db(summary.document_id).content == summary.content
+        assert db.get_summary_sent_status(summary.document_id) == 0
+
+    def test_threads_write_concurrently(self, storage):
+        def save(document_id):
+            with db.transaction():
+                db.save_summary_to_db(constants.Summary(
+                    document_id, "title", "content", "2024-03-15", constants.SummaryType.TDD
+                ))
+
+        threads = [threading.Thread(target=save, args=(f"doc{i}",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(db.get_summaries_with_sent_status([f"doc{i}" for i in range(8)])) == 8
+
+    def test_other_threads_see_the_same_database(self, storage):
+        # Setup
+        db.save_cached_llm_response("key", "cached")
+        results = []
+
+        # Execute
+        thread = threading.Thread(target=lambda: results.append(db.get_cached_llm_response("key", max_age_seconds=60)))
+        thread.start()
+        thread.join()
+
+        # Verify
+        assert results == ["cached"]
+
+
+class TestSummaries:
+    def test_save_and_update_summary(self, storage, summary):
+        # Setup
+        db.save_summary_to_db(summary)
+        db.mark_summary_as_sent("doc1")
+
+        # Execute
+        db.save_summary_to_db(constants.Summary("doc1", "Doc 1", "New summary", "2024-03-16", constants.SummaryType.TDD))
+
+        # Verify
+        stored = db.get_summary_from_db("doc1")
+        assert (stored.content, stored.date_published, stored.summary_type) == ("New summary", "2024-03-16", "TDD")
+        assert db.get_summary_sent_status("doc1") == 0
+        assert db.get_summary_sent_status("missing") is None
+
+    def test_bulk_lookup_and_mark_as_sent(self, storage):
+        # Setup
+        document_ids = [f"doc{i}" for i in range(1200)]
+        with db.transaction():
+            for document_id in document_ids:
+                db.save_summary_to_db(constants.Summary(
+                    document_id, "title", "content", "2024-03-15", constants.SummaryType.TDD
+                ))
+
+        # Execute
+        db.mark_summaries_as_sent(document_ids[:1100])
+
+        # Verify
+        statuses = {
+            document_id: sent for document_id, (_, sent) in db.get_summaries_with_sent_status(document_ids).items()
+        }
+        assert sum(statuses.values()) == 1100
+        assert statuses["doc1150"] == 0
+
+
+class TestSections:
+    def test_sections(self, storage):
+        # Setup
+        db.save_section_to_db("doc1", "2024-03-01", "first", "first summary")
+        db.save_section_to_db("doc1", "2024-03-15", "latest", "latest summary")
+        db.save_section_to_db("doc1", "2024-03-15", "duplicate", "duplicate summary")
+        db.mark_sections_as_sent("doc1")
+        db.save_section_to_db("doc1", "2024-03-29", "newest", "newest summary")
+
+        # Verify
+        assert db.get_latest_section_date("doc1") == "2024-03-29"
+        assert db.get_latest_section_date("doc2") is None
+        assert db.get_unsent_sections("doc1") == [("2024-03-29", "newest summary")]
+
+
+class TestDocuments:
+    def test_revisions_and_titles(self, storage):
+        # Setup
+        db.save_document_revision(constants.DocumentRevision("doc1", "2024-03-01T00:00:00Z", None))
+        db.save_document_revision(constants.DocumentRevision("doc1", "2024-03-05T00:00:00Z", "r2"))
+        db.save_document_titles({"doc1": "Old title", "doc2": "Doc 2"})
+        db.save_document_titles({"doc1": "New title"})
+
+        # Verify
+        assert db.get_document_revisions(["doc1", "doc2"]) == {
+            "doc1": constants.DocumentRevision("doc1", "2024-03-05T00:00:00Z", "r2"),
+        }
+        assert db.get_document_titles(["doc1", "doc2", "doc3"]) == {"doc1": "New title", "doc2": "Doc 2"}
+
+
+class TestEmailOutbox:
+    def test_enqueue_keeps_delivery_state(self, storage):
+        # Setup
+        db.enqueue_emails("batch", ["c@example.com", "a@example.com", "b@example.com"])
+        db.record_email_results("batch", [
+            constants.EmailResult("a@example.com", status_code=202, message_id="msg1"),
+            constants.EmailResult("b@example.com", error=RuntimeError("HTTP Error 500")),
+        ])
+
+        # Execute
+        db.enqueue_emails("batch", ["a@example.com", "b@example.com", "d@example.com"])
+
+        # Verify
+        assert db.get_undelivered_emails("batch") == ["c@example.com", "b@example.com", "d@example.com"]
+        assert db.get_undelivered_emails("other") == []
+        with storage.engine.connect() as conn:
+            rows = conn.execute(sa.text(
+                "SELECT email_address, status, attempts, message_id, error FROM email_outbox ORDER BY id"
+            )).all()
+        assert [tuple(row) for row in rows] == [
+            ("c@example.com", "PENDING", 0, None, None),
+            ("a@example.com", "SENT", 1, "msg1", None),
+            ("b@example.com", "FAILED", 1, None, "HTTP Error 500"),
+            ("d@example.com", "PENDING", 0, None, None),
+        ]
+
+
+class TestDocumentClaims:
+    def test_claimed_documents_are_skipped_by_other_owners(self, storage):
+        # Setup
+        assert db.claim_documents(["doc1", "doc2"], "worker-a", lease_seconds=60) == ["doc1", "doc2"]
+
+        # Execute
+        claimed = db.claim_documents(["doc2", "doc3", "doc1"], "worker-b", lease_seconds=60)
+
+        # Verify
+        assert claimed == ["doc3"]
+        assert db.claim_documents(["doc1"], "worker-a", lease_seconds=60) == ["doc1"]
+
+    def test_expired_leases_are_reclaimed_and_released_documents_can_be_claimed(self, storage):
+        # Setup
+        db.claim_documents(["doc1", "doc2"], "worker-a", lease_seconds=60)
+
+        # Execute
+        with patch.object(sql_storage.time, "time", return_value=sql_storage.time.time() + 120):
+            expired = db.claim_documents(["doc1"], "worker-b", lease_seconds=60)
+        db.release_documents(["doc2"], "worker-a")
+
+        # Verify
+        assert expired == ["doc1"]
+        assert db.claim_documents(["doc1", "doc2"], "worker-c", lease_seconds=60) == ["doc2"]
+
+    def test_renew_returns_documents_still_held(self, storage):
+        # Setup: worker-b took over doc2 after worker-a's lease ran out
+        db.claim_documents(["doc1", "doc2"], "worker-a", lease_seconds=60)
+        with patch.object(sql_storage.time, "time", return_value=sql_storage.time.time() + 120):
+            db.claim_documents(["doc2"], "worker-b", lease_seconds=60)
+
+            # Execute
+            held = db.renew_claims(["doc2", "doc1"], "worker-a", lease_seconds=60)
+
+            # Verify
+            assert held == ["doc1"]
+            assert db.claim_documents(["doc1"], "worker-c", lease_seconds=60) == []
+
+    def test_concurrent_claims_never_overlap(self, storage):
+        document_ids = [f"doc{i}" for i in range(50)]
+        claims = {}
+
+        def claim(owner):
+            claims[owner] = db.claim_documents(document_ids, owner, lease_seconds=60)
+
+        threads = [threading.Thread(target=claim, args=(f"worker-{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [document_id for owner_claims in claims.values() for document_id in owner_claims]
+        assert sorted(claimed) == sorted(document_ids)
+
+
+class TestLLMCache:
+    def test_cache_and_evict(self, storage):
+        # Setup
+        for i in range(5):
+            with patch.object(sql_storage.time, "time", return_value=1000.0 + i):
+                db.save_cached_llm_response(f"key{i}", f"response{i}")
+        with patch.object(sql_storage.time, "time", return_value=2000.0):
+            assert db.get_cached_llm_response("key0", max_age_seconds=5000) == "response0"
+
+        # Execute
+        with patch.object(sql_storage.time, "time", return_value=2001.0):
+            evicted = db.evict_llm_cache(max_entries=2, max_age_seconds=5000)
+
+        # Verify
+        assert evicted == 3
+        with patch.object(sql_storage.time, "time", return_value=2002.0):
+            assert db.get_cached_llm_response("key0", max_age_seconds=5000) == "response0"
+            assert db.get_cached_llm_response("key4", max_age_seconds=5000) == "response4"
+            assert db.get_cached_llm_response("key1", max_age_seconds=5000) is None
+            assert db.get_cached_llm_response("key4", max_age_seconds=1) is None
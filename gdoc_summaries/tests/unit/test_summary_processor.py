@@ -0,0 +1,300 @@
+"""Unit tests for the summary processor"""
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import gdoc_summaries.libs.constants as constants
+import gdoc_summaries.libs.db as db
+import gdoc_summaries.libs.summary_processor as summary_processor
+
+
+@pytest.fixture
+def document_infos():
+    return [
+        constants.DocumentInfo(document_id=f"doc{i}", date_published=f"2024-03-{i + 10}")
+        for i in range(5)
+    ]
+
+
+def _fake_documents(service, document_ids, decode=True):
+    return {
+        document_id: {"title": f"Title {document_id}", "body": {"content": []}, "id": document_id}
+        for document_id in document_ids
+    }, {}
+
+
+def _read_fake_document(response):
+    return response["title"], response["id"]
+
+
+class TestProcessSummaries:
+    @patch('gdoc_summaries.libs.summary_processor.send_summaries')
+    @patch('gdoc_summaries.libs.summary_processor.db')
+    @patch('gdoc_summaries.libs.summary_processor.discovery')
+    @patch('gdoc_summaries.libs.summary_processor.gdoc_client')
+    @patch('gdoc_summaries.libs.summary_processor.llm')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_doc_info')
+    def test_summaries_keep_document_order(
+        self, mock_doc_info, mock_llm, mock_gdoc, mock_discovery, mock_db, mock_send, document_infos
+    ):
+        # Setup: later documents finish first
+        mock_doc_info.return_value = document_infos
+        mock_db.get_summaries_with_sent_status.return_value = {}
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_gdoc.read_document.side_effect = _read_fake_document
+
+        def slow_summary(content):
+            time.sleep(0.05 * (5 - int(content[-1])))
+            return f"summary of {content}"
+        mock_llm.generate_llm_summary.side_effect = slow_summary
+
+        # Execute
+        summary_processor.process_summaries(constants.SummaryType.TDD, max_workers=5)
+
+        # Verify
+        summaries, summary_type = mock_send.call_args.args
+        assert [s.document_id for s in summaries] == [d.document_id for d in document_infos]
+        assert summaries[0].content == "summary of doc0"
+        assert summary_type == constants.SummaryType.TDD
+        saved = [c.args[0].document_id for c in mock_db.save_summary_to_db.call_args_list]
+        assert saved == [d.document_id for d in document_infos]
+
+    @patch('gdoc_summaries.libs.summary_processor.send_summaries')
+    @patch('gdoc_summaries.libs.summary_processor.db')
+    @patch('gdoc_summaries.libs.summary_processor.discovery')
+    @patch('gdoc_summaries.libs.summary_processor.gdoc_client')
+    @patch('gdoc_summaries.libs.summary_processor.llm')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_doc_info')
+    def test_worker_count_is_bounded(
+        self, mock_doc_info, mock_llm, mock_gdoc, mock_discovery, mock_db, mock_send, document_infos
+    ):
+        # Setup
+        mock_doc_info.return_value = document_infos
+        mock_db.get_summaries_with_sent_status.return_value = {}
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_gdoc.read_document.side_effect = _read_fake_document
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def tracked_summary(content):
+            with lock:
+                in_flight.append(content)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.pop()
+            return "summary"
+        mock_llm.generate_llm_summary.side_effect = tracked_summary
+
+        # Execute
+        summary_processor.process_summaries(constants.SummaryType.PRD, max_workers=2)
+
+        # Verify
+        assert max(peak) <= 2
+        assert mock_llm.generate_llm_summary.call_count == len(document_infos)
+
+    @patch('gdoc_summaries.libs.summary_processor.send_summaries')
+    @patch('gdoc_summaries.libs.summary_processor.db')
+    @patch('gdoc_summaries.libs.summary_processor.discovery')
+    @patch('gdoc_summaries.libs.summary_processor.gdoc_client')
+    @patch('gdoc_summaries.libs.summary_processor.llm')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_doc_info')
+    def test_failure_saves_other_documents_then_raises(
+        self, mock_doc_info, mock_llm, mock_gdoc, mock_discovery, mock_db, mock_send, document_infos
+    ):
+        # Setup
+        mock_doc_info.return_value = document_infos
+        mock_db.get_summaries_with_sent_status.return_value = {}
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_gdoc.read_document.side_effect = _read_fake_document
+
+        def failing_summary(content):
+            if content == "doc1":
+                raise RuntimeError("Error in LLM request: 500")
+            return "summary"
+        mock_llm.generate_llm_summary.side_effect = failing_summary
+
+        # Execute and verify
+        with pytest.raises(RuntimeError, match="500"):
+            summary_processor.process_summaries(constants.SummaryType.TDD, max_workers=3)
+
+        assert mock_db.save_summary_to_db.call_count == len(document_infos) - 1
+        mock_send.assert_not_called()
+
+    @patch('gdoc_summaries.libs.summary_processor.send_summaries')
+    @patch('gdoc_summaries.libs.summary_processor.db')
+    @patch('gdoc_summaries.libs.summary_processor.discovery')
+    @patch('gdoc_summaries.libs.summary_processor.gdoc_client')
+    @patch('gdoc_summaries.libs.summary_processor.llm')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_doc_info')
+    def test_stored_summaries_are_looked_up_in_bulk(
+        self, mock_doc_info, mock_llm, mock_gdoc, mock_discovery, mock_db, mock_send, document_infos
+    ):
+        # Setup: doc0 was sent already, doc1 is stored but unsent
+        mock_doc_info.return_value = document_infos
+        stored_summary = constants.Summary("doc1", "Doc 1", "stored", "2024-03-11", constants.SummaryType.TDD)
+        mock_db.get_summaries_with_sent_status.return_value = {
+            "doc0": (constants.Summary("doc0", "Doc 0", "sent", "2024-03-10", constants.SummaryType.TDD), 1),
+            "doc1": (stored_summary, 0),
+        }
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_gdoc.read_document.side_effect = _read_fake_document
+        mock_llm.generate_llm_summary.return_value = "summary"
+
+        # Execute
+        summary_processor.process_summaries(constants.SummaryType.TDD)
+
+        # Verify
+        mock_db.get_summaries_with_sent_status.assert_called_once_with(
+            [d.document_id for d in document_infos]
+        )
+        mock_db.get_summary_from_db.assert_not_called()
+        mock_db.get_summary_sent_status.assert_not_called()
+        summaries, _ = mock_send.call_args.args
+        assert [s.document_id for s in summaries] == ["doc1", "doc2", "doc3", "doc4"]
+        assert summaries[0] is stored_summary
+
+    @patch('gdoc_summaries.libs.summary_processor.send_summaries')
+    @patch('gdoc_summaries.libs.summary_processor.db')
+    @patch('gdoc_summaries.libs.summary_processor.discovery')
+    @patch('gdoc_summaries.libs.summary_processor.gdoc_client')
+    @patch('gdoc_summaries.libs.summary_processor.llm')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_doc_info')
+    @patch.object(constants, "DOCS_BATCH_SIZE", 2)
+    def test_documents_are_fetched_in_batches(
+        self, mock_doc_info, mock_llm, mock_gdoc, mock_discovery, mock_db, mock_send, document_infos
+    ):
+        # Setup: doc3 can't be fetched
+        mock_doc_info.return_value = document_infos
+        mock_db.get_summaries_with_sent_status.return_value = {}
+
+        def fetch(service, document_ids, decode=True):
+            documents, _ = _fake_documents(service, document_ids)
+            errors = {"doc3": Exception("403 Forbidden")} if "doc3" in documents else {}
+            documents.pop("doc3", None)
+            return documents, errors
+        mock_gdoc.get_documents_from_ids.side_effect = fetch
+        mock_gdoc.read_document.side_effect = _read_fake_document
+        mock_llm.generate_llm_summary.return_value = "summary"
+
+        # Execute and verify
+        with pytest.raises(Exception, match="403 Forbidden"):
+            summary_processor.process_summaries(constants.SummaryType.TDD)
+
+        fetched = [c.args[1] for c in mock_gdoc.get_documents_from_ids.call_args_list]
+        assert fetched == [["doc0", "doc1"], ["doc2", "doc3"], ["doc4"]]
+        saved = [c.args[0].document_id for c in mock_db.save_summary_to_db.call_args_list]
+        assert saved == ["doc0", "doc1", "doc2", "doc4"]
+
+
+    @patch('gdoc_summaries.libs.summary_processor.send_summaries')
+    @patch('gdoc_summaries.libs.summary_processor.db')
+    @patch('gdoc_summaries.libs.summary_processor.discovery')
+    @patch('gdoc_summaries.libs.summary_processor.gdoc_client')
+    @patch('gdoc_summaries.libs.summary_processor.llm')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_doc_info')
+    def test_documents_claimed_by_another_worker_are_skipped(
+        self, mock_doc_info, mock_llm, mock_gdoc, mock_discovery, mock_db, mock_send, document_infos
+    ):
+        # Setup: another worker is processing doc1 and doc3
+        mock_doc_info.return_value = document_infos
+        mock_db.get_summaries_with_sent_status.return_value = {}
+        mock_gdoc.get_documents_from_ids.side_effect = _fake_documents
+        mock_gdoc.read_document.side_effect = _read_fake_document
+        mock_llm.generate_llm_summary.return_value = "summary"
+        db.claim_documents(["doc1", "doc3"], "other-worker", lease_seconds=60)
+
+        # Execute
+        summary_processor.process_summaries(constants.SummaryType.TDD)
+
+        # Verify
+        mock_gdoc.get_documents_from_ids.assert_called_once_with(
+            mock_discovery.build.return_value, ["doc0", "doc2", "doc4"], decode=False
+        )
+        summaries, _ = mock_send.call_args.args
+        assert [s.document_id for s in summaries] == ["doc0", "doc2", "doc4"]
+        assert db.claim_documents(["doc0", "doc1"], "next-worker", lease_seconds=60) == ["doc0"]
+
+
+class TestSendSummaries:
+    @pytest.fixture
+    def summaries(self):
+        return [constants.Summary("doc1", "Doc 1", "summary", "2024-03-11", constants.SummaryType.TDD)]
+
+    @staticmethod
+    def _send(failing=()):
+        def send_bulk_email(*, email_addresses, summaries, summary_type, on_results):
+            results = [
+                constants.EmailResult(email_address, error=RuntimeError("HTTP Error 500"))
+                if email_address in failing
+                else constants.EmailResult(email_address, status_code=202, message_id="msg")
+                for email_address in email_addresses
+            ]
+            on_results(results)
+            return results
+        return send_bulk_email
+
+    @patch('gdoc_summaries.libs.summary_processor.email_client')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_subscribers')
+    @patch('builtins.input', return_value="Y")
+    def test_failed_recipient_leaves_summaries_unsent(
+        self, mock_input, mock_subscribers, mock_email, summaries
+    ):
+        # Setup
+        db.save_summary_to_db(summaries[0])
+        mock_subscribers.return_value = ["a@example.com", "b@example.com"]
+        mock_email.send_bulk_email.side_effect = self._send(failing={"b@example.com"})
+
+        # Execute and verify
+        with pytest.raises(RuntimeError, match="HTTP Error 500"):
+            summary_processor.send_summaries(summaries, constants.SummaryType.TDD)
+
+        assert db.get_summary_sent_status("doc1") == 0
+        batch_id = summary_processor._email_batch_id(summaries, constants.SummaryType.TDD)
+        assert db.get_undelivered_emails(batch_id) == ["b@example.com"]
+
+    @patch('gdoc_summaries.libs.summary_processor.email_client')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_subscribers')
+    @patch('builtins.input', return_value="Y")
+    def test_resend_only_goes_to_remaining_recipients(
+        self, mock_input, mock_subscribers, mock_email, summaries
+    ):
+        # Setup: the first send failed for b and c
+        db.save_summary_to_db(summaries[0])
+        mock_subscribers.return_value = ["a@example.com", "b@example.com", "c@example.com"]
+        mock_email.send_bulk_email.side_effect = self._send(failing={"b@example.com", "c@example.com"})
+        with pytest.raises(RuntimeError):
+            summary_processor.send_summaries(summaries, constants.SummaryType.TDD)
+        mock_email.send_bulk_email.side_effect = self._send()
+
+        # Execute
+        sent = summary_processor.send_summaries(summaries, constants.SummaryType.TDD)
+
+        # Verify
+        assert sent
+        assert mock_email.send_bulk_email.call_args.kwargs["email_addresses"] == ["b@example.com", "c@example.com"]
+        assert db.get_summary_sent_status("doc1") == 1
+
+    @patch('gdoc_summaries.libs.summary_processor.email_client')
+    @patch('gdoc_summaries.libs.summary_processor.constants.get_subscribers')
+    @patch('builtins.input', return_value="Y")
+    def test_fully_delivered_batch_is_only_marked_sent(
+        self, mock_input, mock_subscribers, mock_email, summaries
+    ):
+        # Setup: every email went out, but the run stopped before marking the summary sent
+        db.save_summary_to_db(summaries[0])
+        mock_subscribers.return_value = ["a@example.com"]
+        batch_id = summary_processor._email_batch_id(summaries, constants.SummaryType.TDD)
+        db.enqueue_emails(batch_id, ["a@example.com"])
+        db.record_email_results(batch_id, [constants.EmailResult("a@example.com", status_code=202)])
+
+        # Execute
+        summary_processor.send_summaries(summaries, constants.SummaryType.TDD)
+
+        # Verify
+        mock_email.send_bulk_email.assert_not_called()
+        mock_input.assert_not_called()
+        assert db.get_summary_sent_status("doc1") == 1